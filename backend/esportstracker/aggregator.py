@@ -4,11 +4,17 @@ from ruamel import yaml
 from datetime import datetime
 import pytz
 import requests
+import numpy as np
+import psycopg2
+import pymongo.errors
 
 from .dbinterface import PostgresManager, MongoManager
 from .models.mongomodels import *
 from .models.postgresmodels import *
 from .classifiers import YouTubeGameClassifier
+from .webcache import WebSnapshotPublisher
+from .archive import SnapshotArchive
+from .compactor import DocCompactor
 
 
 class Aggregator:
@@ -24,6 +30,7 @@ class Aggregator:
         self.youtube_db = config['youtube']['db']
         self.postgres = config['postgres']
         self.esportsgames = set([g['name'] for g in config['esportsgames']])
+        self.esportsgamelist = config['esportsgames']
         self.postgres['user'] = keys['postgres']['user']
         self.postgres['password'] = keys['postgres']['passwd']
         mongo_cfg = config['aggregator']['mongodb']
@@ -33,12 +40,25 @@ class Aggregator:
         self.mongo_ssl = mongo_cfg['ssl']
         self.twitchgamescol = 'twitch_top_games'
         self.twitchstreamscol = 'twitch_streams'
+        if self.twitch_db.get('bucketed', False):
+            self.twitchstreamscol = TwitchStreamsHourBucket.COLLECTION
         self.ytstreamscol = 'youtube_streams'
         self.mongo_user = None
         self.mongo_pwd = None
         if 'mongodb' in keys:
             self.mongo_user = keys['mongodb']['read']['user']
             self.mongo_pwd = keys['mongodb']['read']['pwd']
+        self.archive = None
+        archive_cfg = config['aggregator'].get('archive')
+        if archive_cfg:
+            self.archive = SnapshotArchive(archive_cfg['dir'])
+            self.retention_days = archive_cfg['retention_days']
+        self.publisher = None
+        snapshot_cfg = config['aggregator'].get('snapshots')
+        if snapshot_cfg:
+            self.publisher = WebSnapshotPublisher(snapshot_cfg['dir'],
+                                                  snapshot_cfg['days'])
+        self.compactor_cfg = config['aggregator'].get('compactor')
 
     @staticmethod
     def strtime(timestamp):
@@ -81,6 +101,87 @@ class Aggregator:
             logging.warning('Cannot connect to webserver to refresh cache.')
             return
 
+    def publish_snapshots(self):
+        """
+        Writes the JSON payloads of the webserver's hot API routes.
+
+        The webserver answers those routes from the files when its
+        snapshots.dir is set, and refreshwebcache then only reruns the
+        queries of the other routes.  Does nothing unless aggregator.snapshots
+        is set in the config file.
+
+        :return: None
+        """
+        if not self.publisher:
+            return
+        man = PostgresManager.from_config(self.postgres, self.esportsgames)
+        try:
+            now = self.epoch_to_hour(time.time())
+            self.publisher.publish(man, self.esportsgamelist, now)
+        except (OSError, psycopg2.Error) as e:
+            logging.warning(f'Failed to publish web snapshots: {e}')
+        finally:
+            man.close()
+
+    def archive_snapshots(self):
+        """
+        Moves aggregated days out of MongoDB and into the archive.
+
+        A day is archived once every hour in it has been aggregated and it
+        is older than the configured retention period.  The hourly Twitch
+        buckets have no archive layout and stay in MongoDB when
+        twitch.db.bucketed is set.  Does nothing unless aggregator.archive is
+        set in the config file.
+
+        :return: None
+        """
+        if not self.archive:
+            return
+        man = PostgresManager.from_config(self.postgres, self.esportsgames)
+        mongo = MongoManager(self.mongo_host,
+                             self.mongo_port,
+                             self.mongo_name,
+                             self.mongo_user,
+                             self.mongo_pwd,
+                             self.mongo_ssl,
+                             archive=self.archive)
+        retention = time.time() - self.retention_days * 24 * 3600
+        try:
+            for collname, table in [(self.twitchgamescol, 'twitch_game_vc'),
+                                    (self.twitchstreamscol, 'twitch_stream'),
+                                    (self.ytstreamscol, 'youtube_stream')]:
+                if collname in mongo.bucket_collections:
+                    continue
+                aggregated = man.most_recent_epoch(table) + 3600
+                cutoff = min(aggregated, retention)
+                count = self.archive.archive(mongo, collname, cutoff)
+                logging.debug(f'Archived {count} docs from {collname}')
+        except (OSError, pymongo.errors.PyMongoError) as e:
+            logging.warning(f'Failed to archive snapshots: {e}')
+        finally:
+            man.close()
+            mongo.client.close()
+
+    def start_compactor(self):
+        """
+        Starts rewriting old MongoDB documents in the background.
+
+        Does nothing unless aggregator.compactor is set in the config file.
+
+        :return: None
+        """
+        if not self.compactor_cfg:
+            return
+        mongo = MongoManager(self.mongo_host,
+                             self.mongo_port,
+                             self.mongo_name,
+                             self.mongo_user,
+                             self.mongo_pwd,
+                             self.mongo_ssl)
+        compactor = DocCompactor(mongo, self.compactor_cfg['interval'],
+                                 self.compactor_cfg['batch_size'])
+        compactor.start()
+
     def _agg_ts(self, man, mongo, table_name, collname):
         """
         Helper function for aggregation timestamps.
@@ -104,7 +205,34 @@ class Aggregator:
         curhrend = curhrstart + sechr
         return curhrstart, curhrend, last
 
-    def process(self, collection, table, fun):
+    @staticmethod
+    def upgrade_docs(collname, docs):
+        """
+        Converts MongoDB docs to their current layout.
+
+        Old Twitch docs whose game names cannot be resolved to ids are
+        skipped and the names are logged, so they can be aggregated once
+        the games are added to the game table.
+
+        :param collname: str, name of the MongoDB collection.
+        :param docs: iterable(dict or RawBSONDocument), the documents.
+        :return: list, the upgraded documents.
+        """
+        upgraded = []
+        skipped = 0
+        unresolved = set()
+        for doc in docs:
+            try:
+                upgraded.append(upgrade_doc(collname, doc))
+            except UnresolvedGamesError as e:
+                skipped += 1
+                unresolved |= e.names
+        if skipped:
+            logging.warning(f'Skipped {skipped} docs in {collname} with '
+                            f'unknown games: {", ".join(sorted(unresolved))}')
+        return upgraded
+
+    def process(self, collection, table, fun, raw=False):
         """
         Feeds a RowFactory MongoDB docs in 60 minute chunks.
 
@@ -120,6 +248,7 @@ class Aggregator:
             in.
         :param fun: function, a function which takes in MongoDB documents and
             produces Row objects.
+        :param raw: bool, feed fun RawBSONDocuments instead of dicts.
         :return:
         """
         # start is the first second of the next hour that we need to aggregate
@@ -130,14 +259,16 @@ class Aggregator:
                              self.mongo_name,
                              self.mongo_user,
                              self.mongo_pwd,
-                             self.mongo_ssl)
+                             self.mongo_ssl,
+                             archive=self.archive)
         # TODO: Convert the Manager.
         curhrstart, curhrend, last = self._agg_ts(man, mongo,
                                                   table,
                                                   collection)
         while curhrend <= last:
             docs = mongo.docsbetween(curhrstart, curhrend,
-                                     collection)
+                                     collection, raw)
+            docs = self.upgrade_docs(collection, docs)
             rows = fun(docs, curhrstart, curhrend)
             man.store_rows(rows, True)
             curhrstart += 3600
@@ -155,21 +286,34 @@ class Aggregator:
         Runs forever aggregating viewer data that has been retrieved from the
         MongoDB instance and stores the aggregated data in the Postgres
         instance.  Runs on the 1st minute of every hour because the data is
-        aggregated in complete hours.  Calls the refresh cache route on the
-        Node.js server once complete.
+        aggregated in complete hours.  Publishes the web snapshots and calls
+        the refresh cache route on the Node.js server once complete.
 
         :return:
         """
+        # Old documents only contain game names, see DocVersions.
+        gameids = PostgresManager.from_config(self.postgres, self.esportsgames)
+        gameids.games.load()
+        set_game_id_lookup(gameids.game_name_to_id)
+        # Games configured by name only are resolved by the Twitch scraper.
+        for game in self.esportsgamelist:
+            if 'id' not in game:
+                game['id'] = gameids.game_name_to_id(game['name'])
+        self.esportsgamelist = [g for g in self.esportsgamelist
+                                if g['id'] is not None]
+        self.start_compactor()
         while True:
             start = time.time()
             self.process(self.twitchgamescol, 'twitch_game_vc',
                          RowFactory.twitch_game_viewer_counts)
             self.process(self.twitchstreamscol, 'twitch_stream',
-                         RowFactory.twitch_streams)
+                         RowFactory.twitch_streams_columnar, raw=True)
             self.process(self.ytstreamscol, 'youtube_stream',
                          RowFactory.youtube_streams)
+            self.archive_snapshots()
             end = time.time()
             logging.debug('Total Time: {:.2f}'.format(end - start))
+            self.publish_snapshots()
             self.refreshwebcache()
             timesleep = 3660 - (int(end) % 3600)
             time.sleep(timesleep)
@@ -212,6 +356,34 @@ class RowFactory:
             res[name] //= (end-start)
         return res
 
+    @staticmethod
+    def average_viewers_columnar(entries, start, end):
+        """
+        Vectorized average_viewers for TwitchStreamsColumns.
+
+        :param entries: list[TwitchStreamsColumns], Entries to be aggregated
+        :param start: int, Start of aggregation period
+        :param end: int, End of aggregation period
+        :return: dict, {id: average_viewers}, Average viewer of each item.
+        """
+        if not entries:
+            return {}
+        entries.sort()
+        # Each entry's viewers count from the previous entry's timestamp until
+        # its own, and the last entry also counts until the end.
+        timestamps = [e.gettimestamp() for e in entries]
+        weights = np.diff([start] + timestamps)
+        weights[-1] += end - timestamps[-1]
+
+        ids = np.concatenate([e.broadcaster_id for e in entries])
+        vcs = np.concatenate([e.viewers.astype(np.int64) * w
+                              for e, w in zip(entries, weights.tolist())])
+        uniq, inverse = np.unique(ids, return_inverse=True)
+        totals = np.zeros(len(uniq), dtype=np.int64)
+        np.add.at(totals, inverse, vcs)
+        totals //= (end - start)
+        return dict(zip(uniq.tolist(), totals.tolist()))
+
     @staticmethod
     def twitch_game_viewer_counts(docs, start, end):
         """
@@ -228,7 +400,8 @@ class RowFactory:
         """
         if not docs:
             return []
-        apiresp = [TwitchGamesAPIResponse.fromdoc(doc) for doc in docs]
+        strings = StringTable()
+        apiresp = [TwitchGamesAPIResponse.fromdoc(doc, strings) for doc in docs]
         games = Game.from_docs(apiresp)
         vcs = RowFactory.average_viewers(apiresp, start, end)
         vcs = TwitchGameVC.from_vcs(vcs, start)
@@ -243,12 +416,21 @@ class RowFactory:
         start parameter is start of the aggregation period and end
         is the first second in the next period.
 
-        :param docs: cursor, raw mongodb docs.
+        :param docs: cursor, raw mongodb docs from either twitch_streams or
+            twitch_streams_hourly.
         :param start: int, unix epoch.
         :param end: int, unix epoch.
         :return: list(list(Row)), the rows to insert grouped by type.
         """
-        apiresp = [TwitchStreamsAPIResponse.fromdoc(doc) for doc in docs]
+        # Interned strings live as long as the rows built from this batch.
+        strings = StringTable()
+        apiresp = []
+        for doc in docs:
+            if 'hour' in doc:
+                bucket = TwitchStreamsHourBucket.fromdoc(doc, strings)
+                apiresp += bucket.responses()
+            else:
+                apiresp.append(TwitchStreamsAPIResponse.fromdoc(doc, strings))
         # Need to sort responses by game
         sortedbygame = {}
         for resp in apiresp:
@@ -268,6 +450,42 @@ class RowFactory:
         streams = TwitchStream.from_vcs(apiresp, vcs, start)
         return streams + channels
 
+    @staticmethod
+    def twitch_streams_columnar(docs, start, end):
+        """
+        Creates database rows from API responses using TwitchStreamsColumns.
+
+        Produces the same rows as twitch_streams without creating an object
+        for every stream in every document.
+
+        :param docs: cursor, raw mongodb docs from either twitch_streams or
+            twitch_streams_hourly.
+        :param start: int, unix epoch.
+        :param end: int, unix epoch.
+        :return: list(list(Row)), the rows to insert grouped by type.
+        """
+        strings = StringTable()
+        apiresp = []
+        for doc in docs:
+            if 'hour' in doc:
+                bucket = TwitchStreamsHourBucket.fromdoc(doc)
+                apiresp += [TwitchStreamsColumns.fromresponse(r, strings)
+                            for r in bucket.responses()]
+            else:
+                apiresp.append(TwitchStreamsColumns.fromdoc(doc, strings))
+        sortedbygame = {}
+        for resp in apiresp:
+            sortedbygame.setdefault(resp.game_id, []).append(resp)
+        if not sortedbygame:
+            return []
+
+        vcs = {}
+        for game, resp in sortedbygame.items():
+            vcs.update(RowFactory.average_viewers_columnar(resp, start, end))
+        channels = [TwitchChannel(chanid) for chanid in vcs]
+        streams = TwitchStream.from_columns(apiresp, vcs, start)
+        return streams + channels
+
     @staticmethod
     def youtube_streams(docs, start, end):
         """
@@ -283,14 +501,13 @@ class RowFactory:
         :return: list(list(Row)), the rows to insert grouped by type.
         """
         yti = YouTubeGameClassifier()
-        ls = [YTLivestreams.fromdoc(doc) for doc in docs]
+        strings = StringTable()
+        ls = [YTLivestreams.fromdoc(doc, strings) for doc in docs]
         # Some hours empty due to server failure
         if not ls:
             return []
         allstreams = [s for streams in ls for s in streams.streams]
         channels = YouTubeChannel.fromstreams(allstreams)
         vcs = RowFactory.average_viewers(ls, start, end)
-        streams = YouTubeStream.from_vcs(ls, vcs, start)
-        for stream in streams:
-            yti.classify_game(stream)
+        streams = YouTubeStream.from_vcs(ls, vcs, start, yti)
         return channels + streams
@@ -1,11 +1,91 @@
 import requests
 import time
 import logging
-import json
 import math
+import asyncio
+import aiohttp
+from collections import OrderedDict
 from .models.mongomodels import YTLivestream, TwitchChannelDoc
 from .models.mongomodels import TwitchGamesAPIResponse, TwitchStreamsAPIResponse
 from .models.mongomodels import YouTubeChannelDoc
+from .jsondecoder import loads, loads_response
+from .ratelimit import PRIORITY_STREAMS
+from .retry import RetryPolicy
+
+
+def _add_stream_page(streams, page, minviewers):
+    """
+    Adds the streams of a Helix /streams page to those already retrieved.
+
+    Streams move between pages while they are requested, so a stream may
+    appear on more than one page.  Only its first appearance is kept.
+
+    :param streams: dict, keys are user ids and values are the raw streams
+        of the previous pages.  Updated in place.
+    :param page: dict, the parsed response page.
+    :param minviewers: int, streams are sorted by viewers so no more pages
+        are needed once a page contains a stream with fewer viewers.
+    :return: bool, whether the next page should be requested.
+    """
+    data = page['data']
+    for stream in data:
+        streams.setdefault(stream['user_id'], stream)
+    if not data or 'cursor' not in page.get('pagination', {}):
+        return False
+    return min(stream['viewer_count'] for stream in data) >= minviewers
+
+
+def _split_streams(streams, gameids, minviewers, timestamp):
+    """
+    Splits the streams of a multi-game request into one response per game.
+
+    :param streams: dict, keys are user ids and values are raw streams.
+    :param gameids: list(int), the games that were requested.
+    :param minviewers: int, does not include streams with fewer viewers.
+    :param timestamp: int, epoch to store the responses with.
+    :return: dict, keys are game ids and values are
+        TwitchStreamsAPIResponse or None if the game has no streams.
+    """
+    bygame = {gameid: [] for gameid in gameids}
+    for stream in streams.values():
+        gameid = int(stream['game_id'])
+        if gameid in bygame:
+            bygame[gameid].append(stream)
+    return {gameid: TwitchStreamsAPIResponse.fromapiresponse(
+                rawstreams, minviewers, timestamp)
+            for gameid, rawstreams in bygame.items()}
+
+
+def group_games(gameids, counts, maxgames=10, pagesize=100):
+    """
+    Groups games into multi-game /streams requests.
+
+    Helix accepts up to 10 game ids per request and returns the streams of
+    all of them sorted by viewers.  Games are packed first fit decreasing by
+    the number of streams they had in the last cycle, so that the games of
+    a group usually share a single page.  Games that fill a page on their
+    own are requested alone.  Games without a previous count are treated as
+    having no streams and are paged through with the rest of their group.
+
+    :param gameids: list(int), the games to group.
+    :param counts: dict, keys are game ids and values are the number of
+        streams returned for the game in the last cycle.
+    :param maxgames: int, the maximum number of games per request.
+    :param pagesize: int, the number of streams per page.
+    :return: list(list(int)), the game ids of each request.
+    """
+    groups = []
+    for gameid in sorted(gameids, key=lambda g: counts.get(g, 0),
+                         reverse=True):
+        count = counts.get(gameid, 0)
+        for group in groups:
+            if len(group[0]) < maxgames and group[1] + count <= pagesize:
+                group[0].append(gameid)
+                group[1] += count
+                break
+        else:
+            groups.append([[gameid], count])
+    return [gameids for gameids, _ in groups]
 
 
 class TwitchAPIClient:
@@ -16,16 +96,24 @@ class TwitchAPIClient:
     DEFAULT_REQUEST_LIMIT = 30
     API_MAX_RESULTS = 100
 
-    def __init__(self, host, clientid, secret):
+    def __init__(self, host, clientid, secret, ratelimiter=None,
+                 priority=PRIORITY_STREAMS, retry=None):
         """
         TwitchAPIClient Constructor.
 
         The Twitch API has a rate limit of 30 requests per 60 second period per
-        clientID per IP address.
+        clientID per IP address.  Processes sharing a client id should share
+        a ratelimiter, otherwise each client tracks the limit on its own.
 
         :param host: str, host url of the api.
         :param clientid: str, Twitch API client id.
         :param secret: str, Twitch API secret.
+        :param ratelimiter: ratelimit.SharedTokenBucket, the rate limit shared
+            with other processes.
+        :param priority: int, priority of this client's requests in the
+            shared rate limit.
+        :param retry: retry.RetryPolicy, decides how failed requests are
+            retried.
         """
         self.apiv5host = host + '/kraken'
         self.apiv6host = host + '/helix'
@@ -38,8 +126,12 @@ class TwitchAPIClient:
 
         self.req_remaining = self.DEFAULT_REQUEST_LIMIT
         self.rate_reset = None
-        self.first_request = True
         self.gameidcache = {}
+        self.ratelimiter = ratelimiter
+        self.priority = priority
+        self.retry = retry or RetryPolicy()
+        # Streams returned per game in the last cycle, used to group games.
+        self.stream_counts = {}
 
     def _request(self, url, params):
         """
@@ -48,80 +140,108 @@ class TwitchAPIClient:
         Manages Twitch API rate limits and sleeps until more requests are
         available if they are not.  Rather than rate limiting API requests by
         the clientID, Twitch limits them by clientID and IP address combination.
+        Failed requests are retried as decided by the retry policy.
 
         :param url: str, the request url.
         :param params: dict, query strings to add to the request.
         :return: requests.Response
         """
-        if self.req_remaining == 0:
+        if self.req_remaining == 0 and not self.ratelimiter:
             sleeptime = self.rate_reset - time.time()
             if sleeptime > 0:
                 time.sleep(sleeptime)
-        for i in range(3):
-            api_result = self.session.get(url, params=params)
-            # Requests does not default to utf-8 encoding and a small percentage
-            # of the time the utf-8 header is missing.
-            api_result.encoding = 'utf8'
-            if api_result.status_code == requests.codes.okay:
-                # Sometimes we will start with no api requests left and
-                # the Twitch API will return an okay status code but nothing
-                # in the response.  Other times, the Twitch API will just return
-                # nothing with on okay status code instead of failing.
-                if self.first_request and api_result.text == '':
-                    time.sleep(self.API_WINDOW_LENGTH)
-                    self.first_request = False
-                    continue
-
-                self.first_request = False
+        attempt = 0
+        while True:
+            if self.ratelimiter:
+                self.ratelimiter.acquire(self.priority)
+            status, headers = None, {}
+            try:
+                api_result = self.session.get(url, params=params)
+            except requests.RequestException as e:
+                logging.debug(f'Twitch API request error: {e!r}')
+            else:
+                # Requests does not default to utf-8 encoding and a small
+                # percentage of the time the utf-8 header is missing.
+                api_result.encoding = 'utf8'
                 # The Twitch API capitalization is inconsistent.
-                headers = {**api_result.headers}
-                headers = {str(k).lower(): v for k, v in headers.items()}
-
+                headers = {str(k).lower(): v
+                           for k, v in api_result.headers.items()}
                 # The rate limit headers are not sent for v5 API requests.
                 if 'ratelimit-remaining' in headers:
                     self.req_remaining = int(headers['ratelimit-remaining'])
                     self.rate_reset = int(headers['ratelimit-reset'])
-                return api_result
-            elif i == 2:
-                logging.WARNING('Twitch API request failed: {}'.format(
-                    api_result.status_code))
-                raise ConnectionError
-            time.sleep(self.API_WINDOW_LENGTH)
+                    if self.ratelimiter:
+                        self.ratelimiter.sync(self.req_remaining,
+                                              self.rate_reset)
+                status = api_result.status_code
+                if status == requests.codes.okay:
+                    if api_result.text != '':
+                        return api_result
+                    # Sometimes we will start with no api requests left and
+                    # the Twitch API will return an okay status code but
+                    # nothing in the response.  Other times, the Twitch API
+                    # will just return nothing with an okay status code
+                    # instead of failing.
+                    status = (requests.codes.too_many_requests
+                              if self.req_remaining == 0 else None)
+            if not self.retry.sleep(attempt, status, headers):
+                logging.warning(f'Twitch API request failed: {status}')
+                raise ConnectionError(f'Twitch API request failed: {status}')
+            attempt += 1
 
     def getgameid(self, gamename):
         """
         Returns the Twitch id corresponding to a game.
 
         Uses the Twitch API to return the game id for the game with the given
-        name.
+        name.  See GameRegistry for resolving many games at once.
 
         :param gamename: str, The name of the game
-        :return:
+        :return: int
         """
         if gamename.lower() in self.gameidcache:
             return self.gameidcache[gamename.lower()]
-        url = self.apiv5host + '/search/games'
-        res = self._request(url, {'query': gamename})
-        games = json.loads(res.text)['games']
-        for game in games:
-            if game['name'] == gamename:
-                self.gameidcache[gamename.lower()] = int(game['_id'])
-                return int(game['_id'])
+        for gameid, name in self.getgames(names=[gamename]).items():
+            self.gameidcache[name.lower()] = gameid
+        if gamename.lower() in self.gameidcache:
+            return self.gameidcache[gamename.lower()]
+        logging.warning(f'Game id not found for: {gamename}')
+        raise ValueError(f'Game id not found for: {gamename}')
 
-        # TODO: Raise a better exception
-        logging.warning('Game id not found for: ', gamename)
-        raise Exception
+    def getgames(self, names=(), ids=()):
+        """
+        Looks up games by name and by id.
+
+        Helix takes up to 100 names and ids in total per request, so the
+        lookups are made in as few requests as possible.  Games that do not
+        exist are missing from the result.
 
-    def gettopgames(self, limit=100):
+        :param names: list(str), names of games.
+        :param ids: list(int), Twitch ids of games.
+        :return: dict, keys are game ids and values are game names.
+        """
+        url = self.apiv6host + '/games/'
+        params = [('name', name) for name in names]
+        params += [('id', str(gameid)) for gameid in ids]
+        games = {}
+        for i in range(0, len(params), self.API_MAX_RESULTS):
+            res = self._request(url, params[i:i + self.API_MAX_RESULTS])
+            for game in loads_response(res)['data']:
+                games[int(game['id'])] = game['name']
+        return games
+
+    def gettopgames(self, limit=100, timestamp=None):
         """
         Gets the current top games.
 
         :param limit: int, number of games to return (max 100).
+        :param timestamp: int, epoch to store the response with, defaults to
+            the time of the request.
         :return: models.mongomodels.TwitchGamesAPIResponse
         """
         url = self.apiv5host + '/games/top/'
         res = self._request(url, {'limit': limit})
-        return TwitchGamesAPIResponse.fromapiresponse(res)
+        return TwitchGamesAPIResponse.fromapiresponse(res, timestamp)
 
     def getdisplaynames(self, userids):
         """
@@ -133,22 +253,8 @@ class TwitchAPIClient:
         :param userids: list(int), the twitch user ids.
         :return: dict, keys are user_ids and values are display names.
         """
-        # TODO use channel_info method.
-        res = {}
-        curbatch = []
-        url = self.apiv6host + '/users/'
-        params = {}
-        for userid in userids:
-            curbatch.append(str(userid))
-            if userid != userids[-1] and len(curbatch) < self.API_MAX_RESULTS:
-                continue
-            params['id'] = ','.join(curbatch)
-            res = self._request(url, params).text
-            users = json.loads(res)['data']
-            for user in users:
-                res[int(user['id'])] = user['display_name']
-            curbatch = []
-        return res
+        channels = self.channelinfo(userids)
+        return {cid: doc.display_name for cid, doc in channels.items()}
 
     def channelinfo(self, userids):
         """
@@ -162,51 +268,106 @@ class TwitchAPIClient:
         """
         if type(userids) == int or type(userids) == str:
             userids = [userids]
-        curbatch = []
         url = self.apiv6host + '/users/'
-        params = {}
         users = []
-        for userid in userids:
-            curbatch.append(str(userid))
-            # The API does not match their documentation currently.
-            if userid != userids[-1] and len(curbatch) < 1:
-                continue
-            params['id'] = ','.join(curbatch)
+        for i in range(0, len(userids), self.API_MAX_RESULTS):
+            batch = userids[i:i + self.API_MAX_RESULTS]
+            # Helix takes the ids as repeated id parameters.
+            params = {'id': [str(userid) for userid in batch]}
             res = self._request(url, params)
             users += TwitchChannelDoc.fromapiresponse(res)
-            curbatch = []
         return {user.channel_id: user for user in users}
 
-    def topstreams(self, gameid=None):
+    def topstreams(self, gameid=None, timestamp=None, pages=1, minviewers=10):
         """
-        Gets the 100 most popular livestreams.
+        Gets the most popular livestreams.
 
         Gets streams streaming the specified game, or all if gameid is not
-        specified.
+        specified.  Up to pages pages of 100 streams are requested, stopping
+        early once a page reaches streams with fewer than minviewers viewers.
 
         :param gameid: int, specifies which games to get.
+        :param timestamp: int, epoch to store the response with, defaults to
+            the time of the request.
+        :param pages: int, the maximum number of pages to request.
+        :param minviewers: int, does not include streams with fewer viewers.
         :return: models.mongomodels.TwitchStreamsAPIResponse
         """
+        gameids = [gameid] if gameid else []
+        streams = self._stream_pages(gameids, pages, minviewers)
+        return TwitchStreamsAPIResponse.fromapiresponse(
+            list(streams.values()), minviewers, timestamp)
+
+    def _stream_pages(self, gameids, pages, minviewers):
+        """
+        Requests pages of the top streams of one or more games.
+
+        :param gameids: list(int), up to 10 games, or all games if empty.
+        :param pages: int, the maximum number of pages to request.
+        :param minviewers: int, stops paging at streams with fewer viewers.
+        :return: dict, keys are user ids and values are raw streams.
+        """
         url = self.apiv6host + '/streams/'
         params = {
             'first': self.API_MAX_RESULTS
         }
-        if gameid:
-            params['game_id'] = gameid
-        # Each response includes 20 streams.
-        responses = [self._request(url, params)]
-        # TODO: Decide whether to support variable numbers of results.
-        for i in range(0):
-            res = json.loads(responses[i].text)
-            if 'cursor' not in res['pagination']:
+        if gameids:
+            # Helix takes the ids as repeated game_id parameters.
+            params['game_id'] = list(gameids)
+        streams = {}
+        for i in range(pages):
+            # Each page is parsed once and its cursor used to request the next.
+            res = loads_response(self._request(url, params))
+            if not _add_stream_page(streams, res, minviewers):
                 break
             params['after'] = res['pagination']['cursor']
-            responses.append(self._request(url, params))
-        rawstreams = []
-        for response in responses:
-            res = json.loads(response.text)
-            rawstreams += res['data']
-        return TwitchStreamsAPIResponse.fromapiresponse(rawstreams)
+        return streams
+
+    def topstreams_group(self, gameids, timestamp=None, pages=1,
+                         minviewers=10):
+        """
+        Gets the most popular livestreams of up to 10 games in one request.
+
+        :param gameids: list(int), the Twitch ids of the games.
+        :param timestamp: int, epoch to store the responses with, defaults
+            to the time of the request.
+        :param pages: int, the maximum number of pages to request.
+        :param minviewers: int, does not include streams with fewer viewers.
+        :return: dict, keys are game ids and values are
+            models.mongomodels.TwitchStreamsAPIResponse or None if the game
+            has no streams.
+        """
+        timestamp = int(timestamp or time.time())
+        streams = self._stream_pages(gameids, pages, minviewers)
+        return _split_streams(streams, gameids, minviewers, timestamp)
+
+    def topstreams_batched(self, gameids, timestamp=None, pages=None,
+                           minviewers=10):
+        """
+        Gets the most popular livestreams of each game with grouped requests.
+
+        See group_games for how games are grouped.  A group may request as
+        many pages as its games would have requested on their own.
+
+        :param gameids: list(int), the Twitch ids of the games.
+        :param timestamp: int, epoch of the cycle, defaults to now.
+        :param pages: dict, keys are game ids and values are the maximum
+            number of pages to request, defaults to 1.
+        :param minviewers: int, does not include streams with fewer viewers.
+        :return: dict, keys are game ids and values are
+            models.mongomodels.TwitchStreamsAPIResponse or None if the game
+            has no streams.
+        """
+        timestamp = int(timestamp or time.time())
+        pages = pages or {}
+        responses = {}
+        for group in group_games(gameids, self.stream_counts):
+            grouppages = sum(pages.get(gameid, 1) for gameid in group)
+            responses.update(self.topstreams_group(group, timestamp,
+                                                   grouppages, minviewers))
+        for gameid, resp in responses.items():
+            self.stream_counts[gameid] = len(resp.streams) if resp else 0
+        return responses
 
     def getuserid(self, username):
         """
@@ -217,17 +378,221 @@ class TwitchAPIClient:
         """
         url = self.apiv5host + '/users/'
         params = {'login': username}
-        res = self._request(url, params).text
-        res = json.loads(res)
+        res = loads_response(self._request(url, params))
         uid = res['users'][0]['_id']
         return uid
 
 
+class AsyncTwitchAPIClient:
+    """
+    Makes concurrent Twitch API requests with asyncio.
+
+    Used to retrieve the streams of every esports game at once instead of one
+    game after another.  Requests share the rate limit reported by the
+    ratelimit headers, so no more requests are in flight than the window has
+    remaining.
+    """
+    API_WINDOW_LENGTH = TwitchAPIClient.API_WINDOW_LENGTH
+    DEFAULT_REQUEST_LIMIT = TwitchAPIClient.DEFAULT_REQUEST_LIMIT
+    API_MAX_RESULTS = TwitchAPIClient.API_MAX_RESULTS
+
+    def __init__(self, host, clientid, secret, max_concurrency=10,
+                 ratelimiter=None, priority=PRIORITY_STREAMS, retry=None):
+        """
+        AsyncTwitchAPIClient Constructor.
+
+        :param host: str, host url of the api.
+        :param clientid: str, Twitch API client id.
+        :param secret: str, Twitch API secret.
+        :param max_concurrency: int, the maximum number of requests in flight.
+        :param ratelimiter: ratelimit.SharedTokenBucket, the rate limit shared
+            with other processes.
+        :param priority: int, priority of this client's requests in the
+            shared rate limit.
+        :param retry: retry.RetryPolicy, decides how failed requests are
+            retried.
+        """
+        self.apiv6host = host + '/helix'
+        self.secret = secret
+        self.headers = {'Client-ID': clientid}
+        self.max_concurrency = max_concurrency
+        self.req_remaining = self.DEFAULT_REQUEST_LIMIT
+        self.rate_reset = None
+        self.ratelimiter = ratelimiter
+        self.priority = priority
+        self.retry = retry or RetryPolicy()
+        # Streams returned per game in the last cycle, used to group games.
+        self.stream_counts = {}
+
+    async def _wait_for_budget(self):
+        """
+        Reserves one request from the current rate limit window.
+
+        Sleeps until the window resets if every remaining request has already
+        been reserved.
+
+        :return: None
+        """
+        if self.ratelimiter:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, self.ratelimiter.acquire,
+                                       self.priority)
+            return
+        while self.req_remaining <= 0:
+            sleeptime = self.API_WINDOW_LENGTH
+            if self.rate_reset:
+                sleeptime = self.rate_reset - time.time()
+            if sleeptime <= 0:
+                # The next response will report the new window.
+                self.req_remaining = 1
+                break
+            await asyncio.sleep(sleeptime)
+        self.req_remaining -= 1
+
+    async def _request(self, session, semaphore, url, params):
+        """
+        Makes an API request.
+
+        :param session: aiohttp.ClientSession
+        :param semaphore: asyncio.Semaphore, limits the requests in flight.
+        :param url: str, the request url.
+        :param params: dict, query strings to add to the request.
+        :return: object, the parsed response body.
+        """
+        attempt = 0
+        while True:
+            status, body, headers = None, b'', {}
+            async with semaphore:
+                await self._wait_for_budget()
+                try:
+                    async with session.get(url, params=params) as api_result:
+                        body = await api_result.read()
+                        status = api_result.status
+                        headers = {k.lower(): v
+                                   for k, v in api_result.headers.items()}
+                except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                    logging.debug(f'Twitch API request error: {e!r}')
+            if 'ratelimit-remaining' in headers:
+                self.req_remaining = int(headers['ratelimit-remaining'])
+                self.rate_reset = int(headers['ratelimit-reset'])
+                if self.ratelimiter:
+                    self.ratelimiter.sync(self.req_remaining, self.rate_reset)
+            if status == requests.codes.okay:
+                if body:
+                    return loads(body)
+                # See TwitchAPIClient._request.
+                status = (requests.codes.too_many_requests
+                          if self.req_remaining == 0 else None)
+            if status == requests.codes.too_many_requests:
+                self.req_remaining = 0
+            wait = self.retry.delay(attempt, status, headers)
+            if wait is None:
+                logging.warning(f'Twitch API request failed: {status}')
+                raise ConnectionError(f'Twitch API request failed: {status}')
+            await asyncio.sleep(wait)
+            attempt += 1
+
+    async def _topstreams(self, session, semaphore, gameids, timestamp,
+                          pages, minviewers):
+        url = self.apiv6host + '/streams/'
+        params = [('first', self.API_MAX_RESULTS)]
+        params += [('game_id', gameid) for gameid in gameids]
+        streams = {}
+        pageparams = params
+        # The pages of one request are sequential since each needs the
+        # cursor of the last, but the pages of different requests are
+        # interleaved.
+        for i in range(pages):
+            res = await self._request(session, semaphore, url, pageparams)
+            if not _add_stream_page(streams, res, minviewers):
+                break
+            pageparams = params + [('after', res['pagination']['cursor'])]
+        return _split_streams(streams, gameids, minviewers, timestamp)
+
+    async def _topstreams_many(self, groups, timestamp, pages, minviewers):
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with aiohttp.ClientSession(headers=self.headers) as session:
+            tasks = []
+            for group in groups:
+                grouppages = sum(pages.get(gameid, 1) for gameid in group)
+                tasks.append(self._topstreams(session, semaphore, group,
+                                              timestamp, grouppages,
+                                              minviewers))
+            results = await asyncio.gather(*tasks, return_exceptions=True)
+        responses = {}
+        for group, result in zip(groups, results):
+            if isinstance(result, (ConnectionError, aiohttp.ClientError,
+                                   asyncio.TimeoutError)):
+                logging.warning(f'Streams request failed for games {group}: '
+                                f'{result!r}')
+                result = dict.fromkeys(group)
+            elif isinstance(result, BaseException):
+                raise result
+            responses.update(result)
+        return responses
+
+    def topstreams_many(self, gameids, timestamp=None, pages=None,
+                        minviewers=10, batch=False):
+        """
+        Gets the most popular livestreams of each game concurrently.
+
+        Every response is stamped with the same timestamp so the snapshots
+        of a cycle line up across games.  See TwitchAPIClient.topstreams for
+        how pages are requested and TwitchAPIClient.topstreams_batched for
+        how games are batched.
+
+        :param gameids: list(int), the Twitch ids of the games.
+        :param timestamp: int, epoch of the cycle, defaults to now.
+        :param pages: dict, keys are game ids and values are the maximum
+            number of pages to request, defaults to 1.
+        :param minviewers: int, does not include streams with fewer viewers.
+        :param batch: bool, whether to request up to 10 games at once.
+        :return: dict, keys are game ids and values are
+            models.mongomodels.TwitchStreamsAPIResponse or None if the game
+            has no streams or its request failed.
+        """
+        timestamp = int(timestamp or time.time())
+        if batch:
+            groups = group_games(gameids, self.stream_counts)
+        else:
+            groups = [[gameid] for gameid in gameids]
+        responses = asyncio.run(self._topstreams_many(groups, timestamp,
+                                                      pages or {}, minviewers))
+        for gameid, resp in responses.items():
+            self.stream_counts[gameid] = len(resp.streams) if resp else 0
+        return responses
+
+
 class YouTubeAPIClient:
     """
     Makes YouTube API requests.
     """
-    def __init__(self, host, clientid, secret):
+    # Quota units charged for each request to an endpoint.  Every list
+    # request costs one unit regardless of its parts or number of ids.
+    QUOTA_COSTS = {
+        'search': 100,
+        'videos': 1,
+        'channels': 1
+    }
+
+    def __init__(self, host, clientid, secret, budget=None, consumer=None,
+                 discovery_interval=0, etag_cache_size=1000, retry=None):
+        """
+        YouTubeAPIClient constructor.
+
+        :param host: str, host url of the api.
+        :param clientid: str, YouTube API client id.
+        :param secret: str, YouTube API key.
+        :param budget: ratelimit.QuotaBudget, the daily quota shared with
+            other processes using the key.
+        :param consumer: str, the name this client charges the budget as.
+        :param discovery_interval: int, minimum seconds between searches for
+            new livestreams in live_gaming_streams.
+        :param etag_cache_size: int, the number of responses kept for
+            conditional requests.
+        :param retry: retry.RetryPolicy, decides how failed requests are
+            retried.
+        """
         self.host = host
         self.id = clientid
         self.secret = secret
@@ -237,27 +602,91 @@ class YouTubeAPIClient:
         self.idcache = {}
         self.maxres = 50
         self.gaming_category_id = 20
+        self.quota_used = 0
+        # Units spent but not yet charged to the budget.
+        self.unsettled = 0
+        self.budget = budget
+        self.consumer = consumer
+        self.discovery_interval = discovery_interval
+        self.last_discovery = 0
+        # Video ids of the livestreams found by the last search that are
+        # still live.
+        self.known_live = []
+        # Least recently used responses with an ETag, keyed by request.
+        self.etags = OrderedDict()
+        self.etag_cache_size = etag_cache_size
+        self.not_modified = 0
+        self.retry = retry or RetryPolicy()
+
+    def settle(self):
+        """
+        Charges the budget for the quota spent since the last settle.
+
+        Requests only count their cost in the client, so the budget's file
+        is locked and rewritten once per scraping cycle instead of once per
+        request.
+
+        :return: int, the units charged.
+        """
+        units, self.unsettled = self.unsettled, 0
+        if self.budget and units:
+            self.budget.charge(units, self.consumer)
+        return units
 
     def _request(self, url, params):
         """
         Makes an API request.
 
+        Responses with an ETag are cached and the request is repeated with
+        If-None-Match, so an unchanged resource is answered with an empty
+        304 response and the cached response is returned instead.
+        Failed requests are retried as decided by the retry policy.
+
         :param url: str, the request url.
         :param params: dict, query strings to add to the request.
         :return: requests.Response
         """
-        for i in range(3):
-            params = {**self.base_params, **params}
-            api_result = self.session.get(url, params=params)
-            # requests does not default to utf-8 encoding.
-            api_result.encoding = 'utf8'
-            if api_result.status_code == requests.codes.okay:
-                return api_result
-            elif i == 2:
-                logging.WARNING("YouTube API request failed: {}".format(
-                    api_result.status_code))
-                raise ConnectionError
-            time.sleep(10)
+        endpoint = url.rstrip('/').rsplit('/', 1)[-1]
+        key = (url, tuple(sorted(params.items())))
+        params = {**self.base_params, **params}
+        attempt = 0
+        while True:
+            # Failed requests are charged as well.
+            cost = self.QUOTA_COSTS.get(endpoint, 1)
+            self.quota_used += cost
+            self.unsettled += cost
+            cached = self.etags.get(key)
+            headers = {}
+            if cached is not None:
+                headers['If-None-Match'] = cached.headers['ETag']
+            status, resp_headers = None, {}
+            try:
+                api_result = self.session.get(url, params=params,
+                                              headers=headers)
+            except requests.RequestException as e:
+                logging.debug(f'YouTube API request error: {e!r}')
+            else:
+                # requests does not default to utf-8 encoding.
+                api_result.encoding = 'utf8'
+                status = api_result.status_code
+                resp_headers = {k.lower(): v
+                                for k, v in api_result.headers.items()}
+                if (status == requests.codes.not_modified and
+                        cached is not None):
+                    self.etags.move_to_end(key)
+                    self.not_modified += 1
+                    return cached
+                if status == requests.codes.okay:
+                    if 'ETag' in api_result.headers:
+                        self.etags[key] = api_result
+                        self.etags.move_to_end(key)
+                        if len(self.etags) > self.etag_cache_size:
+                            self.etags.popitem(last=False)
+                    return api_result
+            if not self.retry.sleep(attempt, status, resp_headers):
+                logging.warning(f'YouTube API request failed: {status}')
+                raise ConnectionError(f'YouTube API request failed: {status}')
+            attempt += 1
 
     def getid(self, username):
         """
@@ -274,10 +703,10 @@ class YouTubeAPIClient:
             return self.idcache[username]
 
         url = self.host + '/channels'
-        params = {'part': 'id', 'forUsername': username}
+        params = {'part': 'id', 'forUsername': username, 'fields': 'items/id'}
         api_result = self._request(url, params)
         try:
-            json_result = json.loads(api_result.text)
+            json_result = loads_response(api_result)
             self.idcache[username] = json_result['items'][0]['id']
             return self.idcache[username]
         except KeyError:
@@ -285,36 +714,62 @@ class YouTubeAPIClient:
             return ''
 
     class LivestreamDetails:
-        def __init__(self, viewers, language, tags, vidid):
+        def __init__(self, viewers, language, tags, vidid, title=None,
+                     channame=None, chanid=None, live=True):
             self.viewers = viewers
             self.language = language
             self.tags = tags
             self.vidid = vidid
+            self.title = title
+            self.channame = channame
+            self.chanid = chanid
+            self.live = live
 
-    def _bcids_to_urls(self, vidids):
+        def tolivestream(self):
+            return YTLivestream(self.title, self.channame, self.chanid,
+                                self.vidid, self.viewers, self.language,
+                                self.tags)
+
+    def _batch_params(self, ids, part, fields):
         """
-        Creates request parameters for retrieving livestream details.
+        Creates request parameters for looking up resources by id.
 
         Returns multiple sets of parameters for when the number of ids is
         greater than YouTube's 50 result limit.
 
-        :param vidids: list(str), list of youtube video ids.
+        :param ids: list(str), list of youtube video or channel ids.
+        :param part: str, the resource parts to request.
+        :param fields: str, partial response mask of the fields to return.
         :return: list(dict)
         """
         params = []
-        numcalls = math.ceil(len(vidids) / self.maxres)
-        part = 'liveStreamingDetails,topicDetails,snippet,contentDetails'
+        numcalls = math.ceil(len(ids) / self.maxres)
         for i in range(numcalls):
             start = i * self.maxres
-            end = min((i + 1) * self.maxres, len(vidids))
-            request_ids = vidids[start:end]
+            end = min((i + 1) * self.maxres, len(ids))
+            request_ids = ids[start:end]
             request_params = {
                 'part': part,
-                'id': ','.join(request_ids)
+                'id': ','.join(request_ids),
+                'fields': fields
             }
             params.append(request_params)
         return params
 
+    def _bcids_to_urls(self, vidids):
+        """
+        Creates request parameters for retrieving livestream details.
+
+        :param vidids: list(str), list of youtube video ids.
+        :return: list(dict)
+        """
+        # Only the fields read by _livestream_details are returned.
+        fields = ('items(id,snippet(title,channelTitle,channelId,'
+                  'defaultAudioLanguage,tags),'
+                  'liveStreamingDetails(concurrentViewers,actualEndTime))')
+        return self._batch_params(vidids, 'liveStreamingDetails,snippet',
+                                  fields)
+
     def _livestream_details(self, bcids):
         """
         Gets the viewers, language, and tags of the specified broadcasts.
@@ -332,16 +787,21 @@ class YouTubeAPIClient:
         broadcasts = []
         for params in mparams:
             api_result = self._request(api_url, params)
-            json_result = json.loads(api_result.text)
+            json_result = loads_response(api_result)
             broadcasts += json_result['items']
 
         details = {}
         for bc in broadcasts:
-            viewers = bc['liveStreamingDetails'].get('concurrentViewers', 0)
-            lang = bc['snippet'].get('defaultAudioLanguage', 'unknown')
-            tags = bc['snippet'].get('tags', [])
+            lsd = bc['liveStreamingDetails']
+            snippet = bc['snippet']
+            viewers = lsd.get('concurrentViewers', 0)
+            lang = snippet.get('defaultAudioLanguage', 'unknown')
+            tags = snippet.get('tags', [])
             vidid = bc['id']
-            details[vidid] = self.LivestreamDetails(viewers, lang, tags, vidid)
+            details[vidid] = self.LivestreamDetails(
+                viewers, lang, tags, vidid, snippet['title'],
+                snippet['channelTitle'], snippet['channelId'],
+                'actualEndTime' not in lsd)
         return details
 
     def most_viewed_gaming_streams(self, num=100):
@@ -371,13 +831,15 @@ class YouTubeAPIClient:
             'eventType': 'live',
             'regionCode': 'US',
             'relevantLanguage': 'en',
-            'safeSearch': 'none'
+            'safeSearch': 'none',
+            'fields': ('nextPageToken,'
+                       'items(id/videoId,snippet(title,channelTitle,channelId))')
         }
         numpages = num // self.maxres
         raw_broadcasts = []
         for i in range(numpages):
             api_result = self._request(url, params)
-            json_result = json.loads(api_result.text)
+            json_result = loads_response(api_result)
             raw_broadcasts += json_result['items']
             # The YouTube API seems to limit results to 100 while still
             # providing the pageToken.  Check if the result is empty to avoid
@@ -411,11 +873,39 @@ class YouTubeAPIClient:
             broadcasts.append(YTLivestream(**params))
         return broadcasts
 
+    def live_gaming_streams(self, num=100):
+        """
+        Retrieves the current viewer counts of the top gaming livestreams.
+
+        The top livestreams are only searched for once per
+        discovery_interval because searches cost 100 quota units.  In
+        between, the viewer counts of the livestreams found by the last
+        search are refreshed from the videos endpoint, which costs one unit
+        per 50 videos.  Livestreams that have ended are dropped.
+
+        :param num: int, The total number of livestreams to return.
+        :return: list(YTLivestream)
+        """
+        now = time.time()
+        if (not self.known_live or
+                now - self.last_discovery >= self.discovery_interval):
+            broadcasts = self.most_viewed_gaming_streams(num)
+            self.known_live = [bc.vidid for bc in broadcasts]
+            self.last_discovery = now
+            return broadcasts
+
+        details = self._livestream_details(self.known_live)
+        live = [det for det in details.values() if det.live]
+        live.sort(key=lambda det: int(det.viewers), reverse=True)
+        self.known_live = [det.vidid for det in live]
+        return [det.tolivestream() for det in live[:num]]
+
     def channelinfo(self, userids):
         """
         Gets the channel information of the given user(s).
 
-        Large requests will be split up into multiple API ones.
+        Up to 50 ids are looked up per request.  Channels that do not exist
+        are missing from the result.
 
         :param userids: str or list, the youtube user ids.
         :return: dict, keys are channel_ids and values are YouTubeChannelDoc.
@@ -424,13 +914,11 @@ class YouTubeAPIClient:
             userids = [userids]
         url = self.host + '/channels/'
         users = []
-        for userid in userids:
-            # The snippet and brandingSettings both have an API cost of 2.
-            # Request Cost: 2
-            params = {
-                'part': 'snippet,brandingSettings',
-                'id': userid
-            }
+        fields = ('items(id,snippet(title,description,publishedAt,'
+                  'thumbnails/default/url),'
+                  'brandingSettings/channel(keywords,defaultLanguage,country))')
+        for params in self._batch_params(userids, 'snippet,brandingSettings',
+                                         fields):
             res = self._request(url, params)
             users += YouTubeChannelDoc.fromapiresponse(res)
         return {user.channel_id: user for user in users}
\ No newline at end of file
@@ -0,0 +1,336 @@
+import os
+import time
+import calendar
+import logging
+import tempfile
+import numpy as np
+
+from .models.mongomodels import upgrade_doc, UnresolvedGamesError
+
+DAY = 60 * 60 * 24
+
+
+class SnapshotArchive:
+    """
+    Cold storage for raw snapshot collections that have been aggregated.
+
+    Each day of a collection is stored as one compressed numpy archive at
+    {directory}/{collection}/{YYYY-MM-DD}.npz.  Documents are flattened into
+    columns: document level fields are stored once per document, the streams
+    or games inside each document are stored as one row each, and every
+    string is replaced by an index into a per file string table.  The
+    columns of the last day read are cached, so aggregating a day hour by
+    hour only decompresses its file once.
+    """
+    # For each collection: the document level fields, the name of the field
+    # containing the rows, whether the rows are keyed by an id (a dict) or not
+    # (a list), and the fields of each row.
+    SCHEMAS = {
+        'twitch_top_games': {
+            'doc': ['timestamp'],
+            'rows': 'games',
+            'keyed': True,
+            'fields': [('name', str), ('id', int), ('viewers', int),
+                       ('channels', int), ('giantbomb_id', int)]
+        },
+        'twitch_streams': {
+            'doc': ['timestamp', 'game_id'],
+            'rows': 'streams',
+            'keyed': True,
+            'fields': [('viewers', int), ('game_id', int), ('language', str),
+                       ('stream_type', str), ('title', str),
+                       ('stream_id', int), ('broadcaster_id', int)]
+        },
+        'youtube_streams': {
+            'doc': ['timestamp'],
+            'rows': 'streams',
+            'keyed': False,
+            'fields': [('title', str), ('channame', str), ('chanid', str),
+                       ('vidid', str), ('viewers', int), ('language', str),
+                       ('tags', list)]
+        }
+    }
+    TAG_SEPARATOR = '\x1f'
+
+    def __init__(self, directory):
+        self.directory = directory
+        # (path, mtime, size), columns and strings of the last day loaded.
+        self._loaded = None
+
+    def path(self, collname, day):
+        name = time.strftime('%Y-%m-%d', time.gmtime(day)) + '.npz'
+        return os.path.join(self.directory, collname, name)
+
+    def days(self, collname):
+        """
+        Returns the days that have been archived for the collection.
+
+        :param collname: str, name of the collection.
+        :return: list(int), sorted epochs of the first second of each day.
+        """
+        directory = os.path.join(self.directory, collname)
+        if not os.path.isdir(directory):
+            return []
+        days = []
+        for fname in os.listdir(directory):
+            if fname.endswith('.npz'):
+                day = time.strptime(fname[:-len('.npz')], '%Y-%m-%d')
+                days.append(calendar.timegm(day))
+        return sorted(days)
+
+    @classmethod
+    def encode(cls, collname, docs):
+        """
+        Converts MongoDB documents into columns.
+
+        :param collname: str, name of the collection the docs are from.
+        :param docs: list(dict), documents sorted by timestamp.
+        :return: dict, column names and numpy arrays.
+        """
+        schema = cls.SCHEMAS[collname]
+        strings = {}
+        cols = {}
+        for field in schema['doc']:
+            cols['doc.' + field] = np.array([d[field] for d in docs],
+                                            dtype=np.int64)
+        keys, offsets = [], [0]
+        values = {field: [] for field, _ in schema['fields']}
+        for doc in docs:
+            rows = doc[schema['rows']]
+            if schema['keyed']:
+                for key in rows:
+                    keys.append(strings.setdefault(key, len(strings)))
+                rows = rows.values()
+            for row in rows:
+                for field, _ in schema['fields']:
+                    values[field].append(row.get(field))
+            offsets.append(offsets[-1] + len(doc[schema['rows']]))
+        cols['doc.offsets'] = np.array(offsets, dtype=np.int64)
+        if schema['keyed']:
+            cols['rows.key'] = np.array(keys, dtype=np.int32)
+
+        for field, kind in schema['fields']:
+            vals = values[field]
+            if kind == int:
+                nulls = [v is None for v in vals]
+                vals = [0 if v is None else int(v) for v in vals]
+                cols['rows.' + field] = np.array(vals, dtype=np.int64)
+                if any(nulls):
+                    cols['rows.' + field + '.null'] = np.array(nulls)
+            else:
+                if kind == list:
+                    vals = [None if v is None else cls.TAG_SEPARATOR.join(v)
+                            for v in vals]
+                idxs = [-1 if v is None else strings.setdefault(v, len(strings))
+                        for v in vals]
+                cols['rows.' + field] = np.array(idxs, dtype=np.int32)
+
+        encoded = [s.encode('utf8') for s in strings]
+        cols['strings.data'] = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+        cols['strings.offsets'] = np.cumsum([0] + [len(s) for s in encoded],
+                                            dtype=np.int64)
+        return cols
+
+    @staticmethod
+    def decode_strings(cols):
+        data = cols['strings.data'].tobytes()
+        soffsets = cols['strings.offsets'].tolist()
+        return [data[soffsets[i]:soffsets[i + 1]].decode('utf8')
+                for i in range(len(soffsets) - 1)]
+
+    @classmethod
+    def decode(cls, collname, cols, start=None, end=None, strings=None):
+        """
+        Converts columns created by encode back into MongoDB documents.
+
+        Only the rows of the documents between start and end are decoded.
+
+        :param collname: str, name of the collection the docs are from.
+        :param cols: dict, column names and numpy arrays.
+        :param start: int, timestamp of the earliest doc, or None.
+        :param end: int, timestamp of the last doc, exclusive, or None.
+        :param strings: list(str), the decoded string table, if known.
+        :return: list(dict)
+        """
+        schema = cls.SCHEMAS[collname]
+        if strings is None:
+            strings = cls.decode_strings(cols)
+        timestamps = cols['doc.timestamp']
+        first = 0 if start is None else int(np.searchsorted(timestamps, start))
+        last = (len(timestamps) if end is None else
+                int(np.searchsorted(timestamps, end)))
+        offsets = cols['doc.offsets'][first:last + 1].tolist()
+        rows = slice(offsets[0], offsets[-1])
+
+        values = {}
+        for field, kind in schema['fields']:
+            col = cols['rows.' + field][rows].tolist()
+            if kind == int:
+                if 'rows.' + field + '.null' in cols:
+                    nulls = cols['rows.' + field + '.null'][rows].tolist()
+                    col = [None if n else v for v, n in zip(col, nulls)]
+            elif kind == str:
+                col = [None if i < 0 else strings[i] for i in col]
+            else:
+                col = [None if i < 0 else
+                       (strings[i].split(cls.TAG_SEPARATOR) if strings[i]
+                        else []) for i in col]
+            values[field] = col
+        keys = None
+        if schema['keyed']:
+            keys = [strings[i] for i in cols['rows.key'][rows].tolist()]
+
+        docs = []
+        offsets = [o - offsets[0] for o in offsets]
+        docfields = {f: cols['doc.' + f][first:last].tolist()
+                     for f in schema['doc']}
+        for i in range(len(offsets) - 1):
+            doc = {f: docfields[f][i] for f in schema['doc']}
+            docrows = [{f: values[f][j] for f, _ in schema['fields']}
+                       for j in range(offsets[i], offsets[i + 1])]
+            if schema['keyed']:
+                docrows = dict(zip(keys[offsets[i]:offsets[i + 1]], docrows))
+            doc[schema['rows']] = docrows
+            docs.append(doc)
+        return docs
+
+    def _load(self, collname, day):
+        """
+        Returns the columns of a day, caching the last day loaded.
+
+        :param collname: str, name of the collection.
+        :param day: int, epoch of the first second in the day.
+        :return: tuple, (dict of columns, list of strings) or None if the day
+            is not archived.
+        """
+        path = self.path(collname, day)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            return None
+        key = (path, stat.st_mtime_ns, stat.st_size)
+        if self._loaded is None or self._loaded[0] != key:
+            with np.load(path) as npz:
+                cols = {name: npz[name] for name in npz.files}
+            self._loaded = (key, cols, self.decode_strings(cols))
+        return self._loaded[1:]
+
+    def read_day(self, collname, day, start=None, end=None):
+        loaded = self._load(collname, day)
+        if loaded is None:
+            return []
+        cols, strings = loaded
+        return self.decode(collname, cols, start, end, strings)
+
+    def write_day(self, collname, day, docs):
+        """
+        Atomically writes the documents of one day, merging existing ones.
+
+        Documents already in the archive are not duplicated so archiving can
+        be retried if the process stops before the documents are removed from
+        MongoDB.
+
+        :param collname: str, name of the collection the docs are from.
+        :param day: int, epoch of the first second in the day.
+        :param docs: list(dict), the documents to archive.
+        :return: None
+        """
+        docfields = self.SCHEMAS[collname]['doc']
+        merged = {}
+        for doc in self.read_day(collname, day) + list(docs):
+            merged.setdefault(tuple(doc[f] for f in docfields), doc)
+        merged = sorted(merged.values(), key=lambda d: d['timestamp'])
+        cols = self.encode(collname, merged)
+
+        path = self.path(collname, day)
+        directory = os.path.dirname(path)
+        os.makedirs(directory, exist_ok=True)
+        fd, tmppath = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.savez_compressed(f, **cols)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmppath, path)
+        except BaseException:
+            os.remove(tmppath)
+            raise
+        self._loaded = None
+
+    def docsbetween(self, start, end, collname):
+        """
+        Returns archived docs with timestamps between start and end.
+
+        :param start: int, Timestamp of the earliest entry.
+        :param end: int, Timestamp of the last entry, exclusive.
+        :param collname: str, name of the collection.
+        :return: list(dict), documents sorted by timestamp.
+        """
+        if collname not in self.SCHEMAS:
+            return []
+        docs = []
+        for day in self.days(collname):
+            if day + DAY <= start or day >= end:
+                continue
+            docs += self.read_day(collname, day, start, end)
+        return docs
+
+    def first_entry_after(self, start, collname):
+        """
+        Returns the smallest archived timestamp greater than start.
+
+        :param start: int, unix epoch.
+        :param collname: str, name of the collection.
+        :return: int, unix epoch or (1 << 31) - 1 if there is none.
+        """
+        if collname not in self.SCHEMAS:
+            return (1 << 31) - 1
+        for day in self.days(collname):
+            if day + DAY <= start:
+                continue
+            with np.load(self.path(collname, day)) as cols:
+                timestamps = cols['doc.timestamp']
+                timestamps = timestamps[timestamps > start]
+                if len(timestamps):
+                    return int(timestamps.min())
+        return (1 << 31) - 1
+
+    def archive(self, mongo, collname, cutoff):
+        """
+        Moves complete days before cutoff from MongoDB into the archive.
+
+        Collections without a schema, such as the hourly buckets, are left
+        in MongoDB.  Archiving stops at the first day containing old Twitch
+        documents whose games cannot be resolved.
+
+        :param mongo: MongoManager, the database to archive from.
+        :param collname: str, name of the collection.
+        :param cutoff: int, unix epoch, only days ending at or before cutoff
+            are archived.
+        :return: int, the number of documents archived.
+        """
+        if collname not in self.SCHEMAS:
+            logging.error(f'{collname} cannot be archived, it has no schema')
+            return 0
+        count = 0
+        first = mongo.first_entry_after(0, collname, archived=False)
+        day = first // DAY * DAY
+        while day + DAY <= cutoff:
+            try:
+                docs = [upgrade_doc(collname, doc) for doc in
+                        mongo.docsbetween(day, day + DAY, collname,
+                                          archived=False)]
+            except UnresolvedGamesError as e:
+                logging.warning(f'Not archiving {collname} from '
+                                f'{os.path.basename(self.path(collname, day))}'
+                                f', {e}')
+                break
+            self.write_day(collname, day, docs)
+            mongo.delete_between(day, day + DAY, collname)
+            count += len(docs)
+            logging.info(f'Archived {len(docs)} docs from {collname} for '
+                         f'{os.path.basename(self.path(collname, day))}')
+            first = mongo.first_entry_after(day + DAY - 1, collname,
+                                            archived=False)
+            day = first // DAY * DAY
+        return count
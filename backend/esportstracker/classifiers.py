@@ -101,30 +101,39 @@ class YouTubeGameClassifier:
             498860: tv
         }
 
-    def classify_game(self, yts):
+    def classify(self, channel_id, title, tags):
         """
         Determines the game of a youtube stream.
 
-        Takes a YouTubeStream object and attempts to classify_game the game that
-        based on the stream's channel, title, and tags. The stream's game_id
-        variable is updated.
+        Attempts to classify the game based on the stream's channel, title,
+        and tags.
 
-        :param yts: YouTubeStream
-        :return: None
+        :param channel_id: str, YouTube channel id of the stream.
+        :param title: str, title of the stream.
+        :param tags: list(str) or str, the stream's tags.
+        :return: int, the Twitch game id or None.
         """
-        if yts.channel_id in self.channels.keys():
-            yts.game_id = self.channels[yts.channel_id]
-            return
-        if isinstance(yts.tags, list):
-            titletags = yts.title + ' '.join(yts.tags)
+        if channel_id in self.channels.keys():
+            return self.channels[channel_id]
+        if isinstance(tags, list):
+            titletags = title + ' '.join(tags)
         else:
-            titletags = yts.title + yts.tags
+            titletags = title + tags
         for gid, kws in self.keywords.items():
             for kw in kws:
                 if kw.lower() in titletags.lower():
-                    yts.game_id = gid
-                    return
-        yts.game_id = None
+                    return gid
+        return None
+
+    def classify_game(self, yts):
+        """
+        Determines the game of a youtube stream.
+
+        :param yts: YouTubeStream
+        :return: YouTubeStream, a copy of yts with its game_id set.
+        """
+        game_id = self.classify(yts.channel_id, yts.title, yts.tags)
+        return yts._replace(game_id=game_id)
 
 
 def classify_language(title):
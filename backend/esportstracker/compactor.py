@@ -0,0 +1,125 @@
+import logging
+import threading
+import pymongo
+import pymongo.errors
+
+from .models.mongomodels import DOC_VERSIONS, UnresolvedGamesError
+
+
+class DocCompactor:
+    """
+    Rewrites documents with old layouts in their current layout.
+
+    Documents are upgraded when they are read, so compaction is never
+    required.  It only saves repeating the upgrade every time old documents
+    are aggregated or archived.  A background thread upgrades the documents
+    of each collection in bulk batches until none are left.  Old Twitch
+    documents are only rewritten once every game name in them resolves to
+    an id, so the names are never lost.
+    """
+    def __init__(self, mongo, interval=600, batch_size=1000):
+        """
+        DocCompactor constructor.
+
+        :param mongo: dbinterface.MongoManager, the database to compact.
+        :param interval: int, seconds between compaction passes.
+        :param batch_size: int, the number of documents per bulk write.
+        """
+        self.mongo = mongo
+        self.interval = interval
+        self.batch_size = batch_size
+        # Collections without outdated documents are not scanned again.
+        self.compacted = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def compact(self, collname):
+        """
+        Upgrades every outdated document in the collection.
+
+        :param collname: str, name of the collection.
+        :return: int, the number of documents rewritten.
+        """
+        versions = DOC_VERSIONS[collname]
+        collection = self.mongo.conn[collname]
+        query = versions.outdated if versions.outdated is not None else {}
+        count = 0
+        requests = []
+        unresolved = set()
+        for doc in collection.find(query, batch_size=self.batch_size):
+            if self._stop.is_set():
+                break
+            if versions.detect(doc) == versions.current:
+                continue
+            try:
+                upgraded = versions.upgrade(doc)
+            except UnresolvedGamesError as e:
+                unresolved |= e.names
+                continue
+            requests.append(pymongo.ReplaceOne({'_id': doc['_id']}, upgraded))
+            if len(requests) == self.batch_size:
+                collection.bulk_write(requests, ordered=False)
+                count += len(requests)
+                requests = []
+        if requests:
+            collection.bulk_write(requests, ordered=False)
+            count += len(requests)
+        if unresolved:
+            logging.warning(f'Not compacting docs in {collname} with unknown '
+                            f'games: {", ".join(sorted(unresolved))}')
+        elif not self._stop.is_set():
+            self.compacted.add(collname)
+        return count
+
+    def compact_all(self):
+        """
+        Compacts every collection that may contain outdated documents.
+
+        :return: int, the number of documents rewritten.
+        """
+        count = 0
+        for collname in DOC_VERSIONS:
+            if collname in self.compacted:
+                continue
+            compacted = self.compact(collname)
+            logging.debug(f'Compacted {compacted} docs in {collname}')
+            count += compacted
+        return count
+
+    def _run(self):
+        while True:
+            try:
+                self.compact_all()
+            except pymongo.errors.PyMongoError as e:
+                logging.warning(f'Compaction failed: {e}')
+            except ValueError as e:
+                logging.warning(f'Compaction stopped: {e}')
+                return
+            if len(self.compacted) == len(DOC_VERSIONS):
+                return
+            if self._stop.wait(self.interval):
+                return
+
+    def start(self):
+        """
+        Starts the background compactor if it is not already running.
+
+        :return: None
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='DocCompactor')
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background compactor.
+
+        :return: None
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
@@ -4,18 +4,45 @@ from psycopg2 import sql
 from psycopg2 import extras
 import pymongo
 from pymongo import MongoClient
+from pymongo.write_concern import WriteConcern
+from bson.codec_options import CodecOptions
+from bson.raw_bson import RawBSONDocument
 from collections import OrderedDict
 import collections
+import itertools
 
 from .models.postgresmodels import *
 from .models.mongomodels import TwitchChannelDoc, YouTubeChannelDoc
+from .models.mongomodels import TwitchStreamsHourBucket
+from .gameregistry import GameRegistry
+
+
+class InsertError(pymongo.errors.PyMongoError):
+    """
+    Raised when documents fail to be stored for reasons other than
+    duplicate keys, ie validation or write concern errors.
+    """
+    def __init__(self, collname, stored, errors):
+        """
+        InsertError constructor.
+
+        :param collname: str, name of the collection.
+        :param stored: int, the number of documents that were stored.
+        :param errors: list(dict), the write errors that were not duplicates.
+        """
+        super().__init__(f'Failed to store {len(errors)} documents in '
+                         f'{collname}')
+        self.collname = collname
+        self.stored = stored
+        self.errors = errors
 
 
 class PostgresManager:
     """
     Class for managing the Postgres instance.
     """
-    def __init__(self, host, port, user, password, dbname, esports_games=[]):
+    def __init__(self, host, port, user, password, dbname, esports_games=[],
+                 apiclient=None):
         """
         Initializes a PostgresManager.
 
@@ -28,6 +55,8 @@ class PostgresManager:
         :param password: str, password.
         :param dbname: str, name of the database to connect to.
         :param esports_games: list, list of Game objects.
+        :param apiclient: apiclients.TwitchAPIClient, resolves games that are
+            not in the game table.
         :return None
         """
 
@@ -38,14 +67,15 @@ class PostgresManager:
                            'youtube_channel', 'youtube_stream']
         self.index_names = {'game_name_idx'}
         self.esports_games = esports_games.copy()
-        self.gamename_cache = {}
+        self.games = GameRegistry(self, apiclient)
         self.esports_channels = {}
         self.initdb()
 
     @staticmethod
-    def from_config(dbconfig, esports_games):
+    def from_config(dbconfig, esports_games, apiclient=None):
         return PostgresManager(dbconfig['host'], dbconfig['port'], dbconfig[
-            'user'], dbconfig['password'], dbconfig['db_name'], esports_games)
+            'user'], dbconfig['password'], dbconfig['db_name'], esports_games,
+            apiclient)
 
     def commit(self):
         """
@@ -313,11 +343,18 @@ class PostgresManager:
                 query = (f'INSERT INTO {tablename} '
                          'VALUES %s '
                          'ON CONFLICT DO NOTHING ')
-
-                rowtups = [x.to_row() for x in group]
-                values = ','.join(['%s' for _ in range(len(rowtups[0]))])
+                if tablename == 'game':
+                    # Games added by the GameRegistry have no giantbomb id.
+                    query = ('INSERT INTO game '
+                             'VALUES %s '
+                             'ON CONFLICT (game_id) DO UPDATE SET '
+                             'giantbomb_id = COALESCE(game.giantbomb_id, '
+                             'EXCLUDED.giantbomb_id)')
+
+                # Rows are tuples so they are passed to psycopg2 as is.
+                values = ','.join(['%s' for _ in range(len(group[0]))])
                 template = '({})'.format(values)
-                extras.execute_values(curs, query, rowtups, template, 1000)
+                extras.execute_values(curs, query, group, template, 1000)
         if commit:
             self.conn.commit()
         return True
@@ -364,11 +401,11 @@ class PostgresManager:
         """
         Retrieves the twitch id number of the game with the given name.
 
-        Caches responses from previous invocations.  Fixes the case for some
-        Twitch games that have inconsistent casing across the API.
+        Looks the game up in the shared GameRegistry.  Fixes the case for
+        some Twitch games that have inconsistent casing across the API.
 
         :param name: str, name of the game.
-        :return: int, twitch game id number.
+        :return: int, twitch game id number or None if the game is unknown.
         """
         # Twitch API is inconsistent on capitalization so we fix it here.
         if name not in self.esports_games:
@@ -376,15 +413,7 @@ class PostgresManager:
                 if name.lower() == game.lower():
                     name = game
                     break
-        if name in self.gamename_cache:
-            return self.gamename_cache[name]
-        query = ('SELECT game_id '
-                 'FROM game '
-                 'WHERE name = %s')
-        cursor = self.conn.cursor()
-        cursor.execute(query, (name,))
-        self.gamename_cache[name] = cursor.fetchone()[0]
-        return self.gamename_cache[name]
+        return self.games.id(name)
 
     def get_yts(self, epoch, limit):
         """
@@ -407,6 +436,68 @@ class PostgresManager:
         rows = cursor.fetchall()
         return list(map(lambda x: YouTubeStream.from_row(x), rows))
 
+    def twitch_top_games_vh(self, start, end, limit):
+        """
+        Returns the total viewer hours of the most watched Twitch games.
+
+        :param start: int, unix epoch, inclusive.
+        :param end: int, unix epoch, exclusive.
+        :param limit: int, the maximum number of games to return.
+        :return: list(tuple), (name, viewers) in descending order by viewers.
+        """
+        query = ('SELECT game.name, v.viewers '
+                 'FROM game '
+                 'INNER JOIN (SELECT game_id, SUM(viewers) AS viewers '
+                 '            FROM twitch_game_vc '
+                 '            WHERE epoch >= %s AND epoch < %s '
+                 '            GROUP BY game_id) AS v '
+                 'ON v.game_id = game.game_id '
+                 'ORDER BY v.viewers DESC '
+                 'LIMIT %s;')
+        cursor = self.conn.cursor()
+        cursor.execute(query, (start, end, limit))
+        return [(name, int(viewers)) for name, viewers in cursor.fetchall()]
+
+    def total_viewer_hours(self, table, start, end):
+        """
+        Returns the sum of the viewers column between start and end.
+
+        :param table: str, twitch_game_vc or youtube_stream.
+        :param start: int, unix epoch, inclusive.
+        :param end: int, unix epoch, exclusive.
+        :return: int
+        """
+        if table not in ('twitch_game_vc', 'youtube_stream'):
+            raise KeyError('Table not supported ', table)
+        query = ('SELECT COALESCE(SUM(viewers), 0) '
+                 'FROM {} '
+                 'WHERE epoch >= %s AND epoch < %s;')
+        query = sql.SQL(query).format(sql.Identifier(table))
+        cursor = self.conn.cursor()
+        cursor.execute(query, (start, end))
+        return int(cursor.fetchone()[0])
+
+    def twitch_game_hourly(self, game_id, start, end):
+        """
+        Returns the hourly English language Twitch viewership of a game.
+
+        :param game_id: int, Twitch game id.
+        :param start: int, unix epoch, inclusive.
+        :param end: int, unix epoch, exclusive.
+        :return: list(tuple), (epoch, viewers) in ascending order by epoch.
+        """
+        query = ('SELECT epoch, SUM(viewers) AS viewers '
+                 'FROM twitch_stream '
+                 'WHERE game_id = %s '
+                 '  AND epoch >= %s '
+                 '  AND epoch < %s '
+                 "  AND LEFT(language, 2) = 'en' "
+                 'GROUP BY epoch '
+                 'ORDER BY epoch;')
+        cursor = self.conn.cursor()
+        cursor.execute(query, (game_id, start, end))
+        return [(epoch, int(viewers)) for epoch, viewers in cursor.fetchall()]
+
     def update_rows(self, rows, fields_to_update):
         """
         Updates database rows.
@@ -420,8 +511,10 @@ class PostgresManager:
         :return:
         """
         # TODO: Currently injectable
-        if not isinstance(rows, collections.Iterable):
+        # Rows are tuples themselves, so check for a single row explicitly.
+        if isinstance(rows, Row):
             rows = [rows]
+        rows = list(rows)
         if not rows or rows[0].TABLE_NAME not in self.tablenames:
             return False
         pk = rows[0].PRIMARY_KEY
@@ -449,14 +542,32 @@ class MongoManager:
     """
     Class for interacting with the MongoDB instance.
     """
+    DEFAULT_BATCH_SIZE = 1000
+
     def __init__(self, host, port, db_name, user=None,
-                 password=None, ssl=True):
+                 password=None, ssl=True, batch_size=DEFAULT_BATCH_SIZE,
+                 write_concern=None, archive=None):
+        """
+        MongoManager constructor.
+
+        :param batch_size: int, maximum number of documents sent in one bulk
+            insert by store_many.
+        :param write_concern: dict, WriteConcern options used by store_many,
+            ie {'w': 1}.  The database default is used if None.
+        :param archive: archive.SnapshotArchive, cold storage that
+            docsbetween and first_entry_after also read from.
+        """
+        self.archive = archive
+        self.batch_size = batch_size
+        self.write_concern = write_concern
         self.user = user
         self.password = password
         self.cols = ['twitch_top_games', 'twitch_streams', 'youtube_streams',
-                     'twitch_channels', 'youtube_channels']
-        self.timestamped_collections = self.cols[0:3]
+                     'twitch_channels', 'youtube_channels',
+                     'twitch_streams_hourly']
+        self.timestamped_collections = self.cols[0:3] + self.cols[5:6]
         self.channel_collections = self.cols[3:5]
+        self.bucket_collections = self.cols[5:6]
         self.client = MongoClient(host, port, ssl=ssl)
         self.conn = self.client[db_name]
         if user:
@@ -482,24 +593,32 @@ class MongoManager:
                 logging.info('Index not found for collection: ' + collname)
                 logging.info('Creating index on collection' + collname)
                 coll.create_index('channel_id', unique=True)
+        for collname in self.bucket_collections:
+            coll = self.conn[collname]
+            indexes = coll.index_information()
+            if 'game_id_1_hour_1' not in indexes:
+                logging.info('Index not found for collection: ' + collname)
+                logging.info('Creating index on collection' + collname)
+                coll.create_index([('game_id', pymongo.ASCENDING),
+                                   ('hour', pymongo.ASCENDING)], unique=True)
 
-    def first_entry_after(self, start, collname):
+    def first_entry_after(self, start, collname, archived=True):
         """
         Returns the timestamp of the first document after start.
 
         :param start: int, unix epoch.
         :param collname: str, name of the collection to search in.
+        :param archived: bool, also search the archive if there is one.
         :return: int, unix epoch of the document with the smallest timestamp
         greater than start.
         """
         topgames = self.conn[collname]
-        cursor = topgames.find(
-            {'timestamp': {'$gt': start}}
-        ).sort('timestamp', pymongo.ASCENDING)
-        if cursor.count() > 0:
-            return int(cursor[0]['timestamp'])
-        else:
-            return (1 << 31) - 1
+        doc = topgames.find_one({'timestamp': {'$gt': start}},
+                                sort=[('timestamp', pymongo.ASCENDING)])
+        first = int(doc['timestamp']) if doc else (1 << 31) - 1
+        if archived and self.archive:
+            first = min(first, self.archive.first_entry_after(start, collname))
+        return first
 
     def findall(self, collname):
         """
@@ -533,24 +652,93 @@ class MongoManager:
     def contains_yt_channel(self, channel_id):
         return self.conn.youtube_channels.count({'channel_id': channel_id})
 
-    def docsbetween(self, start, end, collname):
+    def _channels_by_id(self, channel_ids, collname, doccls, chunk_size):
+        """
+        Looks up channels with one $in query per chunk of ids.
+
+        :param channel_ids: list, the channel ids to look up.
+        :param collname: str, name of the channel collection.
+        :param doccls: class, MongoDoc subclass used to decode the documents.
+        :param chunk_size: int, number of ids per query.
+        :return: generator, yields (found, missing) for each chunk where found
+            is a dict of channel_id: MongoDoc and missing is a list of ids
+            that are not in the collection.
+        """
+        coll = self.conn[collname]
+        for i in range(0, len(channel_ids), chunk_size):
+            chunk = channel_ids[i:i + chunk_size]
+            cursor = coll.find({'channel_id': {'$in': chunk}}, {'_id': False})
+            found = {}
+            for doc in cursor:
+                channel = doccls.fromdoc(doc)
+                found[channel.channel_id] = channel
+            missing = [cid for cid in chunk if cid not in found]
+            yield found, missing
+
+    def get_twitch_channels(self, channel_ids, chunk_size=1000):
+        """
+        Batched version of get_twitch_channel.
+
+        :param channel_ids: list(int), Twitch channel ids.
+        :param chunk_size: int, number of ids per query.
+        :return: generator, yields (dict(int, TwitchChannelDoc), list(int)).
+        """
+        return self._channels_by_id(channel_ids, 'twitch_channels',
+                                    TwitchChannelDoc, chunk_size)
+
+    def get_youtube_channels(self, channel_ids, chunk_size=1000):
+        """
+        Batched version of get_youtube_channel.
+
+        :param channel_ids: list(str), YouTube channel ids.
+        :param chunk_size: int, number of ids per query.
+        :return: generator, yields (dict(str, YouTubeChannelDoc), list(str)).
+        """
+        return self._channels_by_id(channel_ids, 'youtube_channels',
+                                    YouTubeChannelDoc, chunk_size)
+
+    def docsbetween(self, start, end, collname, raw=False, archived=True):
         """
         Returns cursor to entries with timestamps between start and end.
 
         Returns a cursor to documents in the specified Mongo collection that
         have a field 'timestamp' with values greater than or equal to start
-        and less than end.
+        and less than end.  If raw is True, the cursor yields
+        RawBSONDocuments which are only decoded as fields are accessed.
+        Archived documents in the range are yielded first, as dicts.
 
         :param start: int, Timestamp of the earliest entry
         :param end: int, Timestamp of the last entry
-        :return: pymongo.cursor.Cursor
+        :param raw: bool, return RawBSONDocuments instead of dicts.
+        :param archived: bool, also read from the archive if there is one.
+        :return: pymongo.cursor.Cursor or iterator
         """
         coll = self.conn[collname]
+        if raw:
+            options = CodecOptions(document_class=RawBSONDocument)
+            coll = coll.with_options(codec_options=options)
         cursor = coll.find(
             {'timestamp': {'$gte': start, '$lt': end}}
         ).sort('timestamp', pymongo.ASCENDING)
+        if archived and self.archive:
+            docs = self.archive.docsbetween(start, end, collname)
+            if docs:
+                return itertools.chain(docs, cursor)
         return cursor
 
+    def delete_between(self, start, end, collname):
+        """
+        Deletes documents with timestamps between start and end.
+
+        :param start: int, Timestamp of the earliest entry
+        :param end: int, Timestamp of the last entry, exclusive.
+        :param collname: str, name of the collection.
+        :return: int, the number of deleted documents.
+        """
+        coll = self.conn[collname]
+        res = coll.delete_many({'timestamp': {'$gte': start, '$lt': end}})
+        return res.deleted_count
+
     def store(self, docs):
         """
         Stores a MongoDoc.
@@ -568,3 +756,108 @@ class MongoManager:
             collection = self.conn[doc.COLLECTION]
             lastid = collection.insert_one(doc.todoc())
         return lastid
+
+    def store_many(self, docs, batch_size=None, write_concern=None):
+        """
+        Stores MongoDocs using unordered bulk inserts.
+
+        Documents are grouped by their COLLECTION and inserted in batches of
+        batch_size.  Because the inserts are unordered, one failed document
+        does not prevent the rest of its batch from being stored.
+        Documents that are already in the collection are counted as stored.
+
+        :param docs: iterable(mongomodels.MongoDoc), the documents to store.
+        :param batch_size: int, overrides the manager's batch size.
+        :param write_concern: dict, overrides the manager's write concern.
+        :return: dict, keys are collection names and values are the number of
+            documents stored.
+        :raises InsertError: if any document failed with another error.
+        """
+        groups = {}
+        for doc in docs:
+            if doc.COLLECTION not in self.cols:
+                raise pymongo.errors.CollectionInvalid
+            groups.setdefault(doc.COLLECTION, []).append(doc.todoc())
+
+        counts = {}
+        for collname, group in groups.items():
+            counts[collname] = self.insert_docs(collname, group, batch_size,
+                                                write_concern)
+        return counts
+
+    def insert_docs(self, collname, docs, batch_size=None, write_concern=None):
+        """
+        Inserts raw documents into one collection using unordered bulk inserts.
+
+        Documents that fail with a duplicate key error are counted as inserted
+        so that documents with preassigned _ids can be safely reinserted.
+        Every batch is attempted before any other failure is raised.
+
+        :param collname: str, name of the collection.
+        :param docs: list(dict), the documents to insert.
+        :param batch_size: int, overrides the manager's batch size.
+        :param write_concern: dict, overrides the manager's write concern.
+        :return: int, the number of documents inserted.
+        :raises InsertError: if any document failed with another error.
+        """
+        if collname not in self.cols:
+            raise pymongo.errors.CollectionInvalid
+        batch_size = batch_size or self.batch_size
+        write_concern = write_concern or self.write_concern
+        collection = self.conn[collname]
+        if write_concern:
+            wc = WriteConcern(**write_concern)
+            collection = collection.with_options(write_concern=wc)
+        count = 0
+        failed = []
+        for i in range(0, len(docs), batch_size):
+            batch = docs[i:i + batch_size]
+            try:
+                res = collection.insert_many(batch, ordered=False)
+                count += len(res.inserted_ids)
+            except pymongo.errors.BulkWriteError as e:
+                errors = e.details['writeErrors']
+                batch_failed = [err for err in errors if err['code'] != 11000]
+                count += (e.details['nInserted'] + len(errors) -
+                          len(batch_failed))
+                failed += batch_failed
+        if failed:
+            logging.warning('Bulk insert into {} failed for {} '
+                            'documents'.format(collname, len(failed)))
+            raise InsertError(collname, count, failed)
+        return count
+
+    def append_buckets(self, resps):
+        """
+        Appends TwitchStreamsAPIResponses to their hourly buckets.
+
+        Buckets are created by the upsert if they do not exist yet.  A
+        response whose timestamp is already in its bucket matches nothing, so
+        its upsert fails with a duplicate key error on the bucket index and
+        is ignored.  Appending the same responses twice therefore does not
+        count their viewers twice.
+
+        :param resps: list(TwitchStreamsAPIResponse), responses to append.
+        :return: int, the number of buckets modified or created.
+        :raises InsertError: if any append failed with another error.
+        """
+        requests = []
+        for resp in resps:
+            filter, update = TwitchStreamsHourBucket.pushupdate(resp)
+            requests.append(pymongo.UpdateOne(filter, update, upsert=True))
+        if not requests:
+            return 0
+        collection = self.conn[TwitchStreamsHourBucket.COLLECTION]
+        try:
+            res = collection.bulk_write(requests, ordered=False)
+            return res.modified_count + res.upserted_count
+        except pymongo.errors.BulkWriteError as e:
+            failed = [err for err in e.details['writeErrors']
+                      if err['code'] != 11000]
+            count = e.details['nModified'] + e.details['nUpserted']
+            if failed:
+                logging.warning('Appending to {} failed for {} buckets'.format(
+                    TwitchStreamsHourBucket.COLLECTION, len(failed)))
+                raise InsertError(TwitchStreamsHourBucket.COLLECTION, count,
+                                  failed)
+            return count
@@ -0,0 +1,154 @@
+import time
+import logging
+import threading
+import psycopg2
+
+from .models.postgresmodels import Game
+
+
+class GameRegistry:
+    """
+    Maps Twitch game names to game ids.
+
+    The game table in Postgres is the persistent copy of the registry, so a
+    process loads every known game with one query at startup instead of
+    resolving names one at a time.  Games that are not in the table are
+    resolved with bulk Helix /games requests and added to it.  Names are
+    matched case insensitively because Twitch capitalization is
+    inconsistent.  Names and ids that are not found are not looked up again
+    until miss_ttl seconds have passed.  The registry can be shared
+    between threads, lookups are serialized by a lock.
+    """
+    def __init__(self, pg=None, apiclient=None, miss_ttl=3600):
+        """
+        GameRegistry constructor.
+
+        :param pg: dbinterface.PostgresManager, stores the registry in its
+            game table.  The registry is only kept in memory if None.
+        :param apiclient: apiclients.TwitchAPIClient, resolves unknown
+            games.  Games are only looked up in the game table if None.
+        :param miss_ttl: int, seconds a game that was not found is cached.
+        """
+        self.pg = pg
+        self.apiclient = apiclient
+        self.miss_ttl = miss_ttl
+        self.lock = threading.RLock()
+        self.ids = {}
+        self.names = {}
+        # Lowercase names and ids that were not found and when.
+        self.missing = {}
+
+    def _add(self, gameid, name):
+        self.ids[name.lower()] = int(gameid)
+        self.names[int(gameid)] = name
+
+    def _missed(self, key):
+        missed = self.missing.get(key)
+        return missed is not None and time.time() - missed < self.miss_ttl
+
+    def load(self):
+        """
+        Loads every game in the game table.
+
+        :return: int, the number of games known.
+        """
+        with self.lock:
+            if self.pg:
+                with self.pg.conn.cursor() as cursor:
+                    cursor.execute('SELECT game_id, name FROM game')
+                    for gameid, name in cursor.fetchall():
+                        self._add(gameid, name)
+            return len(self.names)
+
+    def warm(self, names=(), ids=()):
+        """
+        Resolves the games that are not yet known.
+
+        The unknown names and ids are looked up together with as few Helix
+        requests as possible and the games found are stored in the game
+        table.  Names and ids that were recently not found are skipped.
+
+        :param names: list(str), names of games.
+        :param ids: list(int), Twitch ids of games.
+        :return: int, the number of games added.
+        """
+        with self.lock:
+            names = [n for n in names if n.lower() not in self.ids and
+                     not self._missed(n.lower())]
+            ids = [int(i) for i in ids
+                   if int(i) not in self.names and not self._missed(int(i))]
+            if not (names or ids):
+                return 0
+            now = time.time()
+            if not self.apiclient:
+                # Nothing else can resolve them until the table changes.
+                for key in [n.lower() for n in names] + ids:
+                    self.missing[key] = now
+                return 0
+            games = self.apiclient.getgames(names, ids)
+            found = {name.lower() for name in games.values()}
+            for name in names:
+                if name.lower() not in found:
+                    self.missing[name.lower()] = now
+            for gameid in ids:
+                if gameid not in games:
+                    self.missing[gameid] = now
+            new = [Game(gameid, name, None) for gameid, name in games.items()
+                   if gameid not in self.names]
+            for game in new:
+                self._add(game.game_id, game.name)
+            if self.pg and new:
+                try:
+                    self.pg.store_rows(new, commit=True)
+                except psycopg2.DatabaseError as e:
+                    logging.warning(f'Failed to store games: {e}')
+                    self.pg.conn.rollback()
+            logging.debug(f'Resolved {len(new)} games')
+            return len(new)
+
+    def _query(self, name):
+        """
+        Looks up one game in the game table.
+
+        :param name: str, name of the game.
+        :return: int, the game id or None.
+        """
+        with self.pg.conn.cursor() as cursor:
+            cursor.execute('SELECT game_id, name FROM game '
+                           'WHERE lower(name) = lower(%s)', (name,))
+            row = cursor.fetchone()
+        if row is None:
+            return None
+        self._add(*row)
+        return row[0]
+
+    def id(self, name):
+        """
+        Returns the Twitch id of a game.
+
+        :param name: str, name of the game.
+        :return: int, the game id or None if the game is unknown.
+        """
+        with self.lock:
+            key = name.lower()
+            if key in self.ids:
+                return self.ids[key]
+            if self._missed(key):
+                return None
+            if self.pg and self._query(name) is not None:
+                return self.ids[key]
+            self.warm(names=[name])
+            return self.ids.get(key)
+
+    def name(self, gameid):
+        """
+        Returns the name of a game.
+
+        :param gameid: int, Twitch id of the game.
+        :return: str, the name or None if the game is unknown.
+        """
+        with self.lock:
+            gameid = int(gameid)
+            if gameid not in self.names:
+                self.warm(ids=[gameid])
+            return self.names.get(gameid)
@@ -0,0 +1,57 @@
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def stdlib_loads(content):
+    """
+    Parses JSON bytes with the standard library.
+
+    :param content: bytes, utf-8 encoded JSON.
+    :return: object
+    """
+    return json.loads(content.decode('utf8'))
+
+
+# orjson parses bytes directly and is several times faster than the standard
+# library on API payloads, but it is an optional dependency.
+_decoder = orjson.loads if orjson else stdlib_loads
+
+
+def set_decoder(decoder):
+    """
+    Replaces the function used to parse API responses.
+
+    :param decoder: function, takes utf-8 encoded JSON bytes and returns the
+        parsed object.  The default decoder is restored if None.
+    :return: None
+    """
+    global _decoder
+    if decoder is None:
+        decoder = orjson.loads if orjson else stdlib_loads
+    _decoder = decoder
+
+
+def loads(content):
+    """
+    Parses JSON bytes with the current decoder.
+
+    :param content: bytes, utf-8 encoded JSON.
+    :return: object
+    """
+    return _decoder(content)
+
+
+def loads_response(response):
+    """
+    Parses the body of an API response.
+
+    The raw bytes are parsed once instead of decoding them to a str first.
+
+    :param response: requests.Response
+    :return: object
+    """
+    return _decoder(response.content)
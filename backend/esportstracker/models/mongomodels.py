@@ -1,7 +1,11 @@
 from abc import ABC, abstractmethod
+from collections.abc import Mapping
 import time
-import json
 import re
+import numpy as np
+from bson.raw_bson import RawBSONDocument
+
+from ..jsondecoder import loads_response
 
 class Aggregatable(ABC):
     """
@@ -46,11 +50,228 @@ class MongoDoc(ABC):
         """ Constructor that takes a MongoDB document."""
 
 
+class DocVersions:
+    """
+    Upgrades old layouts of a collection's documents as they are read.
+
+    Documents are not tagged with a version, so detect inspects a document
+    and returns the version of its layout.  Each upgrade converts a document
+    from one version to the next.  The fromdoc constructors upgrade every
+    document they are given, so collections do not have to be migrated
+    before a new layout is used; see compactor.DocCompactor for rewriting old
+    documents in place.
+    """
+    def __init__(self, current, detect, upgrades, outdated=None):
+        """
+        DocVersions constructor.
+
+        :param current: int, the version written by the scrapers.
+        :param detect: function, takes a document and returns its version.
+        :param upgrades: dict, keys are versions and values are functions
+            that convert a document of that version to the next version.
+        :param outdated: dict, MongoDB filter matching the documents older
+            than current or None if they cannot be matched by a query.
+        """
+        self.current = current
+        self.detect = detect
+        self.upgrades = upgrades
+        self.outdated = outdated
+
+    def upgrade(self, doc):
+        """
+        Converts a document to the current layout.
+
+        :param doc: dict or RawBSONDocument, the MongoDB document.
+        :return: dict or RawBSONDocument, doc itself if it is current.
+        :raises UnresolvedGamesError: if a v1 Twitch document contains games
+            whose ids are unknown.
+        """
+        version = self.detect(doc)
+        if version == self.current:
+            return doc
+        docid = doc.get('_id')
+        while version < self.current:
+            doc = self.upgrades[version](doc)
+            version += 1
+        if docid is not None:
+            doc['_id'] = docid
+        return doc
+
+
+# Twitch game ids are needed to upgrade v1 twitch documents, which only
+# contain game names.
+_game_id_lookup = None
+
+
+def set_game_id_lookup(lookup):
+    """
+    Sets the function used to find the Twitch id of a game by name.
+
+    :param lookup: function, takes a game name and returns its Twitch id or
+        None if the game is unknown.
+    :return: None
+    """
+    global _game_id_lookup
+    _game_id_lookup = lookup
+
+
+class UnresolvedGamesError(ValueError):
+    """
+    Raised when a v1 Twitch document contains games whose ids are unknown.
+
+    The document cannot be upgraded without losing the viewers of those
+    games, so it is left in its old layout.
+    """
+    def __init__(self, names):
+        """
+        UnresolvedGamesError constructor.
+
+        :param names: set(str), the names that could not be resolved.
+        """
+        super().__init__('Unknown games: ' + ', '.join(sorted(names)))
+        self.names = names
+
+
+def _game_ids(names):
+    """
+    Looks up the Twitch ids of game names.
+
+    :param names: iterable(str), names of games.
+    :return: dict, keys are names and values are Twitch ids.
+    :raises UnresolvedGamesError: if any of the names is unknown.
+    """
+    if _game_id_lookup is None:
+        raise ValueError('Upgrading v1 Twitch documents requires a game id '
+                         'lookup, see set_game_id_lookup')
+    ids = {name: _game_id_lookup(name) for name in set(names)}
+    missing = {name for name, gid in ids.items() if gid is None}
+    if missing:
+        raise UnresolvedGamesError(missing)
+    return ids
+
+
+def _top_games_version(doc):
+    # V1 games are keyed by giantbomb id and do not include the Twitch id.
+    for game in doc['games'].values():
+        return 2 if 'id' in game else 1
+    return 2
+
+
+def _top_games_v1tov2(doc):
+    ids = _game_ids(game['name'] for game in doc['games'].values())
+    games = {}
+    for giantbomb_id, game in doc['games'].items():
+        gid = ids[game['name']]
+        games[str(gid)] = {
+            'name': game['name'],
+            'id': int(gid),
+            'viewers': game['viewers'],
+            'channels': game['channels'],
+            'giantbomb_id': int(giantbomb_id)
+        }
+    return {'timestamp': doc['timestamp'], 'games': games}
+
+
+def _twitch_streams_v1tov2(doc):
+    # Kraken streams only had a game name and a status.
+    ids = _game_ids([doc['game']] +
+                    [stream['game'] for stream in doc['streams'].values()])
+    streams = {}
+    for stream in doc['streams'].values():
+        broadcaster_id = int(stream['broadcaster_id'])
+        streams[str(broadcaster_id)] = {
+            'viewers': int(stream['viewers']),
+            'game_id': int(ids[stream['game']]),
+            'language': 'en',
+            'stream_type': 'live',
+            'title': stream['status'],
+            'stream_id': None,
+            'broadcaster_id': broadcaster_id
+        }
+    return {'timestamp': doc['timestamp'],
+            'game_id': int(ids[doc['game']]),
+            'streams': streams}
+
+
+def _youtube_streams_version(doc):
+    if 'streams' in doc:
+        return 3
+    return 2 if 'broadcasts' in doc else 1
+
+
+def _youtube_streams_v1tov2(doc):
+    # V1 documents are keyed by channel id and each broadcast has its own
+    # timestamp.
+    v2doc = {'timestamp': -1, 'broadcasts': {}}
+    for channel_id, broadcast in doc.items():
+        if channel_id == '_id':
+            continue
+        v2doc['timestamp'] = int(broadcast['timestamp'])
+        v2doc['broadcasts'][channel_id] = {
+            'title': broadcast['title'],
+            'broadcaster_name': broadcast['broadcaster_name'],
+            'broadcast_id': broadcast['broadcast_id'],
+            'concurrent_viewers': broadcast['concurrent_viewers'],
+            'language': 'unknown',
+            'tags': []
+        }
+    return v2doc
+
+
+def _youtube_streams_v2tov3(doc):
+    # Early V2 documents do not have language or tags.
+    streams = []
+    for channel_id, broadcast in doc['broadcasts'].items():
+        streams.append({
+            'title': broadcast['title'],
+            'channame': broadcast['broadcaster_name'],
+            'chanid': channel_id,
+            'vidid': broadcast['broadcast_id'],
+            'viewers': int(broadcast['concurrent_viewers']),
+            'language': broadcast.get('language', 'unknown'),
+            'tags': broadcast.get('tags', [])
+        })
+    return {'timestamp': int(doc['timestamp']), 'streams': streams}
+
+
+TWITCH_TOP_GAMES_VERSIONS = DocVersions(
+    2, _top_games_version, {1: _top_games_v1tov2})
+TWITCH_STREAMS_VERSIONS = DocVersions(
+    2, lambda doc: 2 if 'game_id' in doc else 1, {1: _twitch_streams_v1tov2},
+    {'game_id': {'$exists': False}})
+YOUTUBE_STREAMS_VERSIONS = DocVersions(
+    3, _youtube_streams_version,
+    {1: _youtube_streams_v1tov2, 2: _youtube_streams_v2tov3},
+    {'streams': {'$exists': False}})
+# Collections whose documents have more than one layout.
+DOC_VERSIONS = {
+    'twitch_top_games': TWITCH_TOP_GAMES_VERSIONS,
+    'twitch_streams': TWITCH_STREAMS_VERSIONS,
+    'youtube_streams': YOUTUBE_STREAMS_VERSIONS
+}
+
+
+def upgrade_doc(collname, doc):
+    """
+    Converts a document of any collection to its current layout.
+
+    :param collname: str, name of the collection the document is from.
+    :param doc: dict or RawBSONDocument, the MongoDB document.
+    :return: dict or RawBSONDocument
+    :raises UnresolvedGamesError: if a v1 Twitch document contains games
+        whose ids are unknown.
+    """
+    if collname not in DOC_VERSIONS:
+        return doc
+    return DOC_VERSIONS[collname].upgrade(doc)
+
+
 class TwitchGamesAPIResponse(Aggregatable, MongoDoc):
     """
     Model representing Twitch top games API response.
     """
     COLLECTION = 'twitch_top_games'
+    VERSIONS = TWITCH_TOP_GAMES_VERSIONS
 
     def __init__(self, timestamp, games):
         """
@@ -63,21 +284,31 @@ class TwitchGamesAPIResponse(Aggregatable, MongoDoc):
         self.games = games
 
     @staticmethod
-    def fromdoc(doc):
+    def fromdoc(doc, strings=None):
+        """
+        Constructor that takes a MongoDB document.
+
+        :param doc: dict, the MongoDB document.
+        :param strings: StringTable, interns game names across the documents
+            of an aggregation batch.
+        :return: TwitchGamesAPIResponse
+        """
+        doc = TwitchGamesAPIResponse.VERSIONS.upgrade(doc)
         games = {}
         for gid, game in doc['games'].items():
-            games[int(gid)] = TwitchGameSnapshot(**game)
+            games[int(gid)] = TwitchGameSnapshot.fromdoc(game, strings)
         return TwitchGamesAPIResponse(doc['timestamp'], games)
 
     @staticmethod
-    def fromapiresponse(response):
+    def fromapiresponse(response, timestamp=None):
         """
         Constructor for api response
         :param response: requests.Response, the api response.
+        :param timestamp: int, epoch of the scrape, defaults to now.
         :return: TwitchGamesAPIResponse
         """
-        res = json.loads(response.text)
-        timestamp = int(time.time())
+        res = loads_response(response)
+        timestamp = int(timestamp or time.time())
         games = {}
         for game in res['top']:
             params = {
@@ -93,7 +324,7 @@ class TwitchGamesAPIResponse(Aggregatable, MongoDoc):
     def todoc(self):
         return {
             'timestamp': self.timestamp,
-            'games': {str(gid): vars(snap) for gid, snap in self.games.items()}
+            'games': {str(gid): snap.todoc() for gid, snap in self.games.items()}
         }
 
     def viewercounts(self):
@@ -107,6 +338,8 @@ class TwitchGameSnapshot:
     """
     One game from a TwitchGamesAPIResponse
     """
+    __slots__ = ['name', 'id', 'viewers', 'channels', 'giantbomb_id']
+
     def __init__(self, name, id, viewers, channels, giantbomb_id):
         self.name = name
         self.id = int(id)
@@ -114,8 +347,32 @@ class TwitchGameSnapshot:
         self.channels = int(channels)
         self.giantbomb_id = int(giantbomb_id)
 
+    @staticmethod
+    def fromdoc(doc, strings=None):
+        """
+        Constructor for one game of a twitch_top_games document.
+
+        :param doc: dict, the game.
+        :param strings: StringTable, interns the game name.
+        :return: TwitchGameSnapshot
+        """
+        name = doc['name']
+        if strings is not None:
+            name = strings.intern(name)
+        return TwitchGameSnapshot(name, doc['id'], doc['viewers'],
+                                  doc['channels'], doc['giantbomb_id'])
+
+    def todoc(self):
+        return {
+            'name': self.name,
+            'id': self.id,
+            'viewers': self.viewers,
+            'channels': self.channels,
+            'giantbomb_id': self.giantbomb_id
+        }
+
     def __str__(self):
-        return str(vars(self))
+        return str(self.todoc())
 
     def __repr__(self):
         return self.__str__()
@@ -126,6 +383,7 @@ class TwitchStreamsAPIResponse(Aggregatable, MongoDoc):
     Model representing Twitch Streams API response.
     """
     COLLECTION = 'twitch_streams'
+    VERSIONS = TWITCH_STREAMS_VERSIONS
 
     def __init__(self, timestamp, streams, game_id):
         self.timestamp = int(timestamp)
@@ -133,10 +391,26 @@ class TwitchStreamsAPIResponse(Aggregatable, MongoDoc):
         self.game_id = int(game_id)
 
     @staticmethod
-    def fromdoc(doc):
-        streams = {}
-        for cid, stream in doc['streams'].items():
-            streams[int(cid)] = TwitchStreamSnapshot(**stream)
+    def fromdoc(doc, strings=None):
+        """
+        Constructor that takes a MongoDB document.
+
+        If doc is a RawBSONDocument the streams are decoded lazily, see
+        LazyStreamSnapshots.
+
+        :param doc: dict or RawBSONDocument, the MongoDB document.
+        :param strings: StringTable, interns the string fields of the streams
+            across the documents of an aggregation batch.
+        :return: TwitchStreamsAPIResponse
+        """
+        doc = TwitchStreamsAPIResponse.VERSIONS.upgrade(doc)
+        if isinstance(doc, RawBSONDocument):
+            streams = LazyStreamSnapshots(doc['streams'], strings)
+        else:
+            streams = {}
+            for cid, stream in doc['streams'].items():
+                streams[int(cid)] = TwitchStreamSnapshot.fromdoc(stream,
+                                                                 strings)
         return TwitchStreamsAPIResponse(doc['timestamp'], streams, doc['game_id'])
 
     def todoc(self):
@@ -144,21 +418,22 @@ class TwitchStreamsAPIResponse(Aggregatable, MongoDoc):
             'timestamp': self.timestamp,
             'game_id': self.game_id,
             'streams':
-                {str(cid): vars(snap) for cid, snap in self.streams.items()}
+                {str(cid): snap.todoc() for cid, snap in self.streams.items()}
         }
 
     @staticmethod
-    def fromapiresponse(rawstreams, minviewers=10):
+    def fromapiresponse(rawstreams, minviewers=10, timestamp=None):
         """
         Constructor for api response.
 
         Returns None if no streams are entered.
 
-        :param response: requests.Response, the api response.
+        :param rawstreams: list(dict), the data of each response page.
         :param minviewers: int, does not include streams with fewer viewers.
+        :param timestamp: int, epoch of the scrape, defaults to now.
         :return: TwitchStreamsAPIResponse
         """
-        timestamp = int(time.time())
+        timestamp = int(timestamp or time.time())
         if not rawstreams:
             return None
         streams = {}
@@ -176,10 +451,12 @@ class TwitchStreamsAPIResponse(Aggregatable, MongoDoc):
                 'stream_id':        int(stream['id']),
                 'broadcaster_id':   int(stream['user_id']),
             }
-            streams[stream['user_id']] = TwitchStreamSnapshot(**params)
+            streams[int(stream['user_id'])] = TwitchStreamSnapshot(**params)
         return TwitchStreamsAPIResponse(timestamp, streams, gameid)
 
     def viewercounts(self):
+        if isinstance(self.streams, LazyStreamSnapshots):
+            return self.streams.viewercounts()
         return {s.broadcaster_id: s.viewers for s in self.streams.values()}
 
     def gettimestamp(self):
@@ -190,6 +467,9 @@ class TwitchStreamSnapshot:
     """
     One stream from a TwitchStreamsAPIResponse
     """
+    __slots__ = ['viewers', 'game_id', 'language', 'stream_type', 'title',
+                 'stream_id', 'broadcaster_id']
+
     def __init__(self, viewers, game_id, language, stream_type, title, stream_id,
                  broadcaster_id):
         self.viewers = int(viewers)
@@ -200,13 +480,430 @@ class TwitchStreamSnapshot:
         self.stream_id = stream_id
         self.broadcaster_id = broadcaster_id
 
+    @staticmethod
+    def fromdoc(doc, strings=None):
+        """
+        Constructor for one stream of a twitch_streams document.
+
+        :param doc: dict, the stream.
+        :param strings: StringTable, interns language, stream_type and title.
+        :return: TwitchStreamSnapshot
+        """
+        language, stream_type, title = (doc['language'], doc['stream_type'],
+                                        doc['title'])
+        if strings is not None:
+            language = strings.intern(language)
+            stream_type = strings.intern(stream_type)
+            title = strings.intern(title)
+        return TwitchStreamSnapshot(doc['viewers'], doc['game_id'], language,
+                                    stream_type, title, doc['stream_id'],
+                                    doc['broadcaster_id'])
+
+    def todoc(self):
+        return {
+            'viewers': self.viewers,
+            'game_id': self.game_id,
+            'language': self.language,
+            'stream_type': self.stream_type,
+            'title': self.title,
+            'stream_id': self.stream_id,
+            'broadcaster_id': self.broadcaster_id
+        }
+
     def __str__(self):
-        return str(vars(self))
+        return str(self.todoc())
 
     def __repr__(self):
         return self.__str__()
 
 
+class TwitchStreamsHourBucket(MongoDoc):
+    """
+    Every TwitchStreamsAPIResponse for one game in one hour.
+
+    The bucketed alternative to the twitch_streams collection.  Each document
+    holds the timestamp of every scrape in the hour and, for each channel,
+    arrays of the timestamps it was live at and its viewers at those times:
+
+      {'game_id': int,
+       'hour': epoch of the first second in the hour,
+       'timestamp': epoch of the first scrape in the hour,
+       'timestamps': [int, ...],
+       'streams': {
+           str(channel_id): {
+               'timestamps': [int, ...],
+               'viewers': [int, ...],
+               'game_id', 'language', 'stream_type', 'title', 'stream_id',
+               'broadcaster_id'
+           }, ...
+       }}
+
+    Scrapers append to the bucket with pushupdate.  Stream metadata is
+    overwritten on every append so the bucket keeps the most recent title.
+    A response is only appended if its timestamp is not in the bucket yet.
+    """
+    COLLECTION = 'twitch_streams_hourly'
+    METADATA = ['game_id', 'language', 'stream_type', 'title', 'stream_id',
+                'broadcaster_id']
+    STRING_METADATA = ['language', 'stream_type', 'title']
+
+    def __init__(self, game_id, hour, timestamps, streams):
+        """
+        TwitchStreamsHourBucket constructor.
+
+        :param game_id: int, Twitch game id.
+        :param hour: int, epoch of the first second in the hour.
+        :param timestamps: list(int), epochs of each scrape.
+        :param streams: dict, keys are channel ids and values are dicts with
+            timestamps, viewers, and the METADATA fields.
+        """
+        self.game_id = int(game_id)
+        self.hour = int(hour)
+        self.timestamps = timestamps
+        self.streams = streams
+
+    @staticmethod
+    def hourof(timestamp):
+        return int(timestamp) // 3600 * 3600
+
+    @staticmethod
+    def fromdoc(doc, strings=None):
+        """
+        Constructor that takes a MongoDB document.
+
+        :param doc: dict, the MongoDB document.
+        :param strings: StringTable, interns the string metadata of the
+            streams across the documents of an aggregation batch.
+        :return: TwitchStreamsHourBucket
+        """
+        streams = {}
+        for cid, stream in doc['streams'].items():
+            streams[int(cid)] = {k: stream[k] for k in
+                                 ['timestamps', 'viewers'] +
+                                 TwitchStreamsHourBucket.METADATA}
+            if strings is not None:
+                for field in TwitchStreamsHourBucket.STRING_METADATA:
+                    streams[int(cid)][field] = strings.intern(stream[field])
+        return TwitchStreamsHourBucket(doc['game_id'], doc['hour'],
+                                       list(doc['timestamps']), streams)
+
+    @staticmethod
+    def fromresponses(resps):
+        """
+        Builds a bucket from responses for the same game and hour.
+
+        :param resps: list(TwitchStreamsAPIResponse), sorted by timestamp.
+        :return: TwitchStreamsHourBucket
+        """
+        first = resps[0]
+        bucket = TwitchStreamsHourBucket(
+            first.game_id, TwitchStreamsHourBucket.hourof(first.timestamp),
+            [], {})
+        for resp in resps:
+            bucket.timestamps.append(resp.timestamp)
+            for cid, snp in resp.streams.items():
+                stream = bucket.streams.setdefault(
+                    int(cid), {'timestamps': [], 'viewers': []})
+                stream['timestamps'].append(resp.timestamp)
+                stream['viewers'].append(snp.viewers)
+                for field in TwitchStreamsHourBucket.METADATA:
+                    stream[field] = getattr(snp, field)
+        return bucket
+
+    @staticmethod
+    def pushupdate(resp):
+        """
+        Returns the upsert that appends one response to its bucket.
+
+        :param resp: TwitchStreamsAPIResponse
+        :return: tuple, (filter, update) for update_one with upsert=True.
+        """
+        hour = TwitchStreamsHourBucket.hourof(resp.timestamp)
+        push = {'timestamps': resp.timestamp}
+        setfields = {}
+        for cid, snp in resp.streams.items():
+            prefix = f'streams.{cid}.'
+            push[prefix + 'timestamps'] = resp.timestamp
+            push[prefix + 'viewers'] = snp.viewers
+            for field in TwitchStreamsHourBucket.METADATA:
+                setfields[prefix + field] = getattr(snp, field)
+        update = {'$push': push, '$min': {'timestamp': resp.timestamp}}
+        if setfields:
+            update['$set'] = setfields
+        # Matches nothing if the response was already appended.
+        filter = {'game_id': resp.game_id, 'hour': hour,
+                  'timestamps': {'$ne': resp.timestamp}}
+        return filter, update
+
+    def todoc(self):
+        return {
+            'game_id': self.game_id,
+            'hour': self.hour,
+            'timestamp': min(self.timestamps),
+            'timestamps': self.timestamps,
+            'streams': {str(cid): s for cid, s in self.streams.items()}
+        }
+
+    def responses(self):
+        """
+        Expands the bucket into one TwitchStreamsAPIResponse per scrape.
+
+        :return: list(TwitchStreamsAPIResponse)
+        """
+        samples = {ts: {} for ts in self.timestamps}
+        for cid, stream in self.streams.items():
+            meta = {k: stream[k] for k in self.METADATA}
+            for ts, viewers in zip(stream['timestamps'], stream['viewers']):
+                snp = TwitchStreamSnapshot(viewers=viewers, **meta)
+                samples.setdefault(ts, {})[cid] = snp
+        return [TwitchStreamsAPIResponse(ts, streams, self.game_id)
+                for ts, streams in sorted(samples.items())]
+
+
+class LazyStreamSnapshots(Mapping):
+    """
+    Read only mapping of channel ids to TwitchStreamSnapshots.
+
+    Wraps the raw BSON streams field of a twitch_streams document.  Streams
+    are only decoded into TwitchStreamSnapshot objects when they are accessed,
+    so aggregation can compute viewer counts without building a snapshot for
+    every stream in the hour.
+    """
+    def __init__(self, rawstreams, strings=None):
+        """
+        LazyStreamSnapshots constructor.
+
+        :param rawstreams: RawBSONDocument, streams keyed by channel id.
+        :param strings: StringTable, interns the string fields of decoded
+            snapshots.
+        """
+        self._raw = rawstreams
+        self._strings = strings
+        self._snapshots = {}
+
+    def __getitem__(self, channel_id):
+        if channel_id not in self._snapshots:
+            stream = self._raw[str(channel_id)]
+            self._snapshots[channel_id] = TwitchStreamSnapshot.fromdoc(
+                stream, self._strings)
+        return self._snapshots[channel_id]
+
+    def __contains__(self, channel_id):
+        return str(channel_id) in self._raw
+
+    def __iter__(self):
+        return (int(cid) for cid in self._raw)
+
+    def __len__(self):
+        return len(self._raw)
+
+    def viewercounts(self):
+        """
+        Returns the viewer count of each stream without building snapshots.
+
+        :return: dict, {channel_id: viewers}
+        """
+        return {int(cid): s['viewers'] for cid, s in self._raw.items()}
+
+
+class StringTable:
+    """
+    Assigns an integer code to each distinct string.
+
+    Shared between the TwitchStreamsColumns of an aggregation batch so that
+    repeated titles and languages are only stored once.  None has code -1.
+
+    The table also interns strings for the object models: fromdoc
+    constructors that are given a StringTable replace each string field with
+    the first equal string seen in the batch, so the thousands of copies
+    decoded from an hour of documents can be freed immediately.  Unlike
+    sys.intern the strings are released with the table at the end of the
+    batch.
+    """
+    def __init__(self):
+        self.codes = {}
+        self.strings = []
+
+    def code(self, string):
+        if string is None:
+            return -1
+        if string not in self.codes:
+            self.codes[string] = len(self.strings)
+            self.strings.append(string)
+        return self.codes[string]
+
+    def string(self, code):
+        return None if code < 0 else self.strings[code]
+
+    def intern(self, string):
+        """
+        Returns the canonical copy of string for this table.
+
+        :param string: str or None
+        :return: str or None
+        """
+        return self.string(self.code(string))
+
+
+class TwitchStreamsColumns(Aggregatable, MongoDoc):
+    """
+    Columnar form of a TwitchStreamsAPIResponse.
+
+    Each stream is a position in a set of numpy arrays rather than a
+    TwitchStreamSnapshot.  String fields are stored as codes into a
+    StringTable and a missing stream_id is stored as -1.
+    """
+    COLLECTION = 'twitch_streams'
+    FIELDS = ['viewers', 'game_id', 'language', 'stream_type', 'title',
+              'stream_id', 'broadcaster_id']
+
+    def __init__(self, timestamp, game_id, columns, strings):
+        """
+        TwitchStreamsColumns constructor.
+
+        :param timestamp: int, epoch.
+        :param game_id: int, Twitch game id of the response.
+        :param columns: dict, keys are FIELDS and values are numpy arrays.
+        :param strings: StringTable, table the string columns refer to.
+        """
+        self.timestamp = int(timestamp)
+        self.game_id = int(game_id)
+        self.broadcaster_id = columns['broadcaster_id']
+        self.viewers = columns['viewers']
+        self.stream_game_id = columns['game_id']
+        self.stream_id = columns['stream_id']
+        self.title = columns['title']
+        self.language = columns['language']
+        self.stream_type = columns['stream_type']
+        self.strings = strings
+
+    @staticmethod
+    def fromstreams(timestamp, game_id, streams, strings=None):
+        """
+        Builds the columns from an iterable of stream dicts.
+
+        :param timestamp: int, epoch.
+        :param game_id: int, Twitch game id of the response.
+        :param streams: iterable(dict), dicts containing the FIELDS.
+        :param strings: StringTable, a new table is created if None.
+        :return: TwitchStreamsColumns
+        """
+        strings = strings if strings is not None else StringTable()
+        cols = {f: [] for f in TwitchStreamsColumns.FIELDS}
+        for stream in streams:
+            cols['broadcaster_id'].append(stream['broadcaster_id'])
+            cols['viewers'].append(stream['viewers'])
+            cols['game_id'].append(stream['game_id'])
+            stream_id = stream['stream_id']
+            cols['stream_id'].append(-1 if stream_id is None else stream_id)
+            cols['title'].append(strings.code(stream['title']))
+            cols['language'].append(strings.code(stream['language']))
+            cols['stream_type'].append(strings.code(stream['stream_type']))
+        columns = {
+            'broadcaster_id': np.array(cols['broadcaster_id'], dtype=np.int64),
+            'viewers': np.array(cols['viewers'], dtype=np.int32),
+            'game_id': np.array(cols['game_id'], dtype=np.int64),
+            'stream_id': np.array(cols['stream_id'], dtype=np.int64),
+            'title': np.array(cols['title'], dtype=np.int32),
+            'language': np.array(cols['language'], dtype=np.int32),
+            'stream_type': np.array(cols['stream_type'], dtype=np.int32)
+        }
+        return TwitchStreamsColumns(timestamp, game_id, columns, strings)
+
+    @staticmethod
+    def fromdoc(doc, strings=None):
+        """
+        Constructor that takes a twitch_streams MongoDB document.
+
+        :param doc: dict or RawBSONDocument, the MongoDB document.
+        :param strings: StringTable, shared string table.
+        :return: TwitchStreamsColumns
+        """
+        doc = TwitchStreamsAPIResponse.VERSIONS.upgrade(doc)
+        return TwitchStreamsColumns.fromstreams(
+            doc['timestamp'], doc['game_id'], doc['streams'].values(), strings)
+
+    @staticmethod
+    def fromresponse(resp, strings=None):
+        """
+        Converts a TwitchStreamsAPIResponse.
+
+        :param resp: TwitchStreamsAPIResponse
+        :param strings: StringTable, shared string table.
+        :return: TwitchStreamsColumns
+        """
+        streams = (snp.todoc() for snp in resp.streams.values())
+        return TwitchStreamsColumns.fromstreams(resp.timestamp, resp.game_id,
+                                                streams, strings)
+
+    @staticmethod
+    def fromapiresponse(rawstreams, timestamp, gameid, minviewers=10,
+                        strings=None):
+        """
+        Constructor for the Helix streams api response.
+
+        Returns None if no streams are entered.
+
+        :param rawstreams: list(dict), the data of each response page.
+        :param timestamp: int, epoch of the scrape.
+        :param gameid: int, Twitch game id the streams were requested for.
+        :param minviewers: int, does not include streams with fewer viewers.
+        :param strings: StringTable, shared string table.
+        :return: TwitchStreamsColumns
+        """
+        if not rawstreams:
+            return None
+        streams = ({
+            'viewers': stream['viewer_count'],
+            'game_id': int(stream['game_id']),
+            'language': stream['language'],
+            'stream_type': stream['type'],
+            'title': stream['title'],
+            'stream_id': int(stream['id']),
+            'broadcaster_id': int(stream['user_id'])
+        } for stream in rawstreams if stream['viewer_count'] >= minviewers)
+        return TwitchStreamsColumns.fromstreams(timestamp, gameid, streams,
+                                                strings)
+
+    def __len__(self):
+        return len(self.broadcaster_id)
+
+    def metadata(self, i):
+        """
+        Returns the non viewer fields of the stream at position i.
+
+        :param i: int, position of the stream.
+        :return: dict
+        """
+        stream_id = int(self.stream_id[i])
+        return {
+            'game_id': int(self.stream_game_id[i]),
+            'title': self.strings.string(self.title[i]),
+            'language': self.strings.string(self.language[i]),
+            'stream_id': None if stream_id < 0 else stream_id,
+            'stream_type': self.strings.string(self.stream_type[i])
+        }
+
+    def todoc(self):
+        streams = {}
+        for i, cid in enumerate(self.broadcaster_id.tolist()):
+            stream = self.metadata(i)
+            stream['viewers'] = int(self.viewers[i])
+            stream['broadcaster_id'] = cid
+            streams[str(cid)] = {f: stream[f] for f in self.FIELDS}
+        return {
+            'timestamp': self.timestamp,
+            'game_id': self.game_id,
+            'streams': streams
+        }
+
+    def viewercounts(self):
+        return dict(zip(self.broadcaster_id.tolist(), self.viewers.tolist()))
+
+    def gettimestamp(self):
+        return self.timestamp
+
+
 class TwitchChannelDoc(MongoDoc):
     """
     Twitch User API response
@@ -232,7 +929,7 @@ class TwitchChannelDoc(MongoDoc):
 
     @staticmethod
     def fromapiresponse(resp):
-        data = json.loads(resp.text)['data']
+        data = loads_response(resp)['data']
         users = []
         for user in data:
             params = {
@@ -251,7 +948,7 @@ class TwitchChannelDoc(MongoDoc):
 
     @staticmethod
     def fromdoc(doc):
-        del doc['_id']
+        doc.pop('_id', None)
         return TwitchChannelDoc(**doc)
 
     def todoc(self):
@@ -278,10 +975,12 @@ class YouTubeChannelDoc(MongoDoc):
 
     @staticmethod
     def fromapiresponse(resp):
-        data = json.loads(resp.text)['items']
+        data = loads_response(resp)['items']
         channels = []
         for channel in data:
-            bsc = channel['brandingSettings']['channel']
+            # Partial responses omit brandingSettings if none of the
+            # requested fields are set.
+            bsc = channel.get('brandingSettings', {}).get('channel', {})
             snip = channel['snippet']
             params = {
                 'channel_id': channel['id'],
@@ -301,7 +1000,7 @@ class YouTubeChannelDoc(MongoDoc):
 
     @staticmethod
     def fromdoc(doc):
-        del doc['_id']
+        doc.pop('_id', None)
         return YouTubeChannelDoc(**doc)
 
     def todoc(self):
@@ -313,6 +1012,7 @@ class YTLivestreams(Aggregatable, MongoDoc):
     Model representing document in youtube_top_streams Mongo collection.
     """
     COLLECTION = 'youtube_streams'
+    VERSIONS = YOUTUBE_STREAMS_VERSIONS
 
     def __init__(self, streams, timestamp):
         """
@@ -327,22 +1027,25 @@ class YTLivestreams(Aggregatable, MongoDoc):
         self.streams = streams
 
     @staticmethod
-    def fromdoc(doc):
+    def fromdoc(doc, strings=None):
         """
         Constructor for MongoDB document.
 
         :param doc: dict, MongoDB document.
+        :param strings: StringTable, interns the string fields of the streams
+            across the documents of an aggregation batch.
         :return: YTLivestreams
         """
+        doc = YTLivestreams.VERSIONS.upgrade(doc)
         streams = []
         for stream in doc['streams']:
-            streams.append(YTLivestream(**stream))
+            streams.append(YTLivestream.fromdoc(stream, strings))
         return YTLivestreams(streams, doc['timestamp'])
 
     def todoc(self):
         return {
             'timestamp': self.timestamp,
-            'streams': [vars(x) for x in self.streams]
+            'streams': [x.todoc() for x in self.streams]
         }
 
     def viewercounts(self):
@@ -356,6 +1059,9 @@ class YTLivestream:
     """
     Represents a YouTube livestream.
     """
+    __slots__ = ['title', 'channame', 'chanid', 'vidid', 'viewers', 'language',
+                 'tags']
+
     def __init__(self, title, channame, chanid, vidid, viewers, language, tags):
         """
         Constructor for Livestream.
@@ -376,8 +1082,39 @@ class YTLivestream:
         self.language = language
         self.tags = tags
 
+    @staticmethod
+    def fromdoc(doc, strings=None):
+        """
+        Constructor for one stream of a youtube_streams document.
+
+        :param doc: dict, the stream.
+        :param strings: StringTable, interns every string field and tag.
+        :return: YTLivestream
+        """
+        if strings is None:
+            return YTLivestream(**doc)
+        tags = doc['tags']
+        if tags is not None:
+            tags = [strings.intern(tag) for tag in tags]
+        return YTLivestream(strings.intern(doc['title']),
+                            strings.intern(doc['channame']),
+                            strings.intern(doc['chanid']),
+                            strings.intern(doc['vidid']), doc['viewers'],
+                            strings.intern(doc['language']), tags)
+
+    def todoc(self):
+        return {
+            'title': self.title,
+            'channame': self.channame,
+            'chanid': self.chanid,
+            'vidid': self.vidid,
+            'viewers': self.viewers,
+            'language': self.language,
+            'tags': self.tags
+        }
+
     def __str__(self):
-        return str(vars(self))
+        return str(self.todoc())
 
     def __repr__(self):
         return self.__str__()
\ No newline at end of file
@@ -1,23 +1,27 @@
-from abc import ABC, abstractmethod
+from collections import namedtuple
 from ..classifiers import classify_language
 
 
-class Row(ABC):
-    @abstractmethod
+class Row:
+    """
+    Mixin for rows of a Postgres table.
+
+    Subclasses also inherit from a namedtuple whose fields are the table's
+    columns in order, so a row is already the tuple that psycopg2 inserts.
+    Rows are immutable, use _replace to change a field.
+    """
+    __slots__ = ()
+    TABLE_NAME = None
+    PRIMARY_KEY = None
+
     def to_row(self):
         """
         Returns a tuple that can be inserted into Postgres.
         """
-        pass
-
-    def __str__(self):
-        return str(self.to_row())
-
-    def __repr__(self):
-        return self.__str__()
+        return self
 
 
-class Game(Row):
+class Game(Row, namedtuple('Game', ['game_id', 'name', 'giantbomb_id'])):
     """
     A row in the game table.
 
@@ -25,12 +29,13 @@ class Game(Row):
     """
     TABLE_NAME = 'game'
     PRIMARY_KEY = 'game_id'
-    __slots__ = ['game_id', 'name', 'giantbomb_id']
+    __slots__ = ()
 
-    def __init__(self, game_id, name, giantbomb_id):
-        self.game_id = int(game_id)
-        self.name = name
-        self.giantbomb_id = int(giantbomb_id)
+    def __new__(cls, game_id, name, giantbomb_id):
+        # Games resolved with Helix have no giantbomb id.
+        if giantbomb_id is not None:
+            giantbomb_id = int(giantbomb_id)
+        return super().__new__(cls, int(game_id), name, giantbomb_id)
 
     @staticmethod
     def from_docs(resps):
@@ -47,11 +52,9 @@ class Game(Row):
                     games[snp.id] = Game(snp.id, snp.name, snp.giantbomb_id)
         return list(games.values())
 
-    def to_row(self):
-        return self.game_id, self.name, self.giantbomb_id
-
 
-class TwitchGameVC(Row):
+class TwitchGameVC(Row, namedtuple('TwitchGameVC',
+                                   ['game_id', 'epoch', 'viewers'])):
     """
     A row in the twitch_top_game table.
 
@@ -59,12 +62,7 @@ class TwitchGameVC(Row):
     """
     TABLE_NAME = 'twitch_game_vc'
     PRIMARY_KEY = ['game_id', 'epoch']
-    __slots__ = ['game_id', 'epoch', 'viewers']
-
-    def __init__(self, game_id, epoch, viewers):
-        self.game_id = game_id
-        self.epoch = epoch
-        self.viewers = viewers
+    __slots__ = ()
 
     @staticmethod
     def from_vcs(vcs, timestamp):
@@ -73,18 +71,19 @@ class TwitchGameVC(Row):
             vs.append(TwitchGameVC(gid, timestamp, viewers))
         return vs
 
-    def to_row(self):
-        return self.game_id, self.epoch, self.viewers
-
 
-class TwitchChannel(Row):
+class TwitchChannel(Row, namedtuple('TwitchChannel', [
+        'channel_id', 'display_name', 'description', 'followers', 'login',
+        'broadcaster_type', 'type', 'offline_image_url', 'profile_image_url',
+        'affiliation'])):
     """
     A mapping between a Twitch channel name and its id.
     """
     TABLE_NAME = 'twitch_channel'
     PRIMARY_KEY = 'channel_id'
+    __slots__ = ()
 
-    def __init__(self, channel_id, display_name=None, description=None,
+    def __new__(cls, channel_id, display_name=None, description=None,
                  followers=None, login=None, broadcaster_type=None, type=None,
                  offline_image_url=None, profile_image_url=None,
                  affiliation=None):
@@ -102,16 +101,10 @@ class TwitchChannel(Row):
         :param profile_image_url: text, URL of the user's profile image.
         :param affiliation: text, name of the affiliated esports organization.
         """
-        self.channel_id = channel_id
-        self.display_name = display_name
-        self.description = description
-        self.followers = followers
-        self.login = login
-        self.broadcaster_type = broadcaster_type
-        self.type = type
-        self.offline_image_url = offline_image_url
-        self.profile_image_url = profile_image_url
-        self.affiliation = affiliation
+        return super().__new__(cls, channel_id, display_name, description,
+                               followers, login, broadcaster_type, type,
+                               offline_image_url, profile_image_url,
+                               affiliation)
 
     @staticmethod
     def from_api_resp(resps):
@@ -125,19 +118,17 @@ class TwitchChannel(Row):
         """
         streams = {}
         for resp in resps:
-            for snp in resp.streams.values():
-                if snp.broadcaster_id not in streams:
-                    channel = TwitchChannel(snp.broadcaster_id)
-                    streams[snp.broadcaster_id] = channel
+            # Keys are broadcaster ids, iterating over them avoids decoding
+            # lazily loaded snapshots.
+            for chanid in resp.streams:
+                if chanid not in streams:
+                    streams[chanid] = TwitchChannel(chanid)
         return list(streams.values())
 
-    def to_row(self):
-        return self.channel_id, self.display_name, self.description,\
-               self.followers, self.login, self.broadcaster_type, self.type,\
-               self.offline_image_url, self.profile_image_url, self.affiliation
 
-
-class TwitchStream(Row):
+class TwitchStream(Row, namedtuple('TwitchStream', [
+        'channel_id', 'epoch', 'game_id', 'viewers', 'title', 'language',
+        'stream_id', 'stream_type'])):
     """
     A row in the twitch_stream table.
 
@@ -145,19 +136,7 @@ class TwitchStream(Row):
     """
     TABLE_NAME = 'twitch_stream'
     PRIMARY_KEY = ['channel_id', 'epoch']
-    __slots__ = ['channel_id', 'epoch', 'game_id', 'viewers', 'title',
-                 'language', 'stream_id', 'stream_type']
-
-    def __init__(self, channel_id, epoch, game_id, viewers, title, language,
-                 stream_id, stream_type):
-        self.channel_id = channel_id
-        self.epoch = epoch
-        self.game_id = game_id
-        self.viewers = viewers
-        self.title = title
-        self.language = language
-        self.stream_id = stream_id
-        self.stream_type = stream_type
+    __slots__ = ()
 
     @staticmethod
     def from_vcs(api_resp, vcs, timestamp):
@@ -173,54 +152,75 @@ class TwitchStream(Row):
         :param timestamp: int, unix epoch of the row.
         :return: list(TwitchStream), list of rows to insert.
         """
+        # Only the first snapshot of each channel is used, so the snapshot
+        # is looked up after finding the first response that contains it.
         comb = {}
         for resp in api_resp:
-            for snapshot in resp.streams.values():
-                if snapshot.broadcaster_id not in comb:
-                    comb[snapshot.broadcaster_id] = snapshot
+            for chanid in resp.streams:
+                if chanid not in comb:
+                    comb[chanid] = resp
 
         ts = []
         for chanid, viewers in vcs.items():
+            snapshot = comb[chanid].streams[chanid]
             params = {
                 'channel_id':chanid,
                 'epoch': timestamp,
-                'game_id': comb[chanid].game_id,
+                'game_id': snapshot.game_id,
                 'viewers': viewers,
-                'title': comb[chanid].title,
-                'language': comb[chanid].language,
-                'stream_id': comb[chanid].stream_id,
-                'stream_type': comb[chanid].stream_type
+                'title': snapshot.title,
+                'language': snapshot.language,
+                'stream_id': snapshot.stream_id,
+                'stream_type': snapshot.stream_type
             }
             ts.append(TwitchStream(**params))
         return ts
 
-    def to_row(self):
-        return (self.channel_id, self.epoch, self.game_id, self.viewers,
-                self.title, self.language, self.stream_id, self.stream_type)
+    @staticmethod
+    def from_columns(api_resp, vcs, timestamp):
+        """
+        Creates TwitchStream objects from viewercounts and columnar responses.
 
+        Equivalent to from_vcs, but metadata is read directly from the
+        columns of the first response each channel appears in.
 
-class YouTubeChannel(Row):
+        :param api_resp: list(mongomodels.TwitchStreamsColumns), the
+            responses.
+        :param vcs:   {channel_id, viewercount}, the viewercounts of the api
+            responses.
+        :param timestamp: int, unix epoch of the row.
+        :return: list(TwitchStream), list of rows to insert.
+        """
+        comb = {}
+        for resp in api_resp:
+            for i, chanid in enumerate(resp.broadcaster_id.tolist()):
+                if chanid not in comb:
+                    comb[chanid] = (resp, i)
+
+        ts = []
+        for chanid, viewers in vcs.items():
+            resp, i = comb[chanid]
+            ts.append(TwitchStream(chanid, timestamp, viewers=viewers,
+                                   **resp.metadata(i)))
+        return ts
+
+
+class YouTubeChannel(Row, namedtuple('YouTubeChannel', [
+        'channel_id', 'display_name', 'affiliation', 'description', 'keywords',
+        'published_at', 'thumbnail_url', 'default_language', 'country'])):
     """
     A mapping between a YouTube channel name and its id.
     """
     TABLE_NAME = 'youtube_channel'
     PRIMARY_KEY = 'channel_id'
-    __slots__ = ['channel_id', 'display_name', 'affiliation', 'description',
-                 'keywords', 'published_at', 'thumbnail_url',
-                 'default_language', 'country']
-
-    def __init__(self, channel_id, display_name=None, affiliation=None,
-                 description=None, keywords=None, published_at=None,
-                 thumbnail_url=None, default_language=None, country=None):
-        self.channel_id = channel_id
-        self.display_name = display_name
-        self.affiliation = affiliation
-        self.description = description
-        self.keywords = keywords
-        self.published_at = published_at
-        self.thumbnail_url = thumbnail_url
-        self.default_language = default_language
-        self.country = country
+    __slots__ = ()
+
+    def __new__(cls, channel_id, display_name=None, affiliation=None,
+                description=None, keywords=None, published_at=None,
+                thumbnail_url=None, default_language=None, country=None):
+        return super().__new__(cls, channel_id, display_name, affiliation,
+                               description, keywords, published_at,
+                               thumbnail_url, default_language, country)
 
     @staticmethod
     def fromstreams(streams):
@@ -248,46 +248,52 @@ class YouTubeChannel(Row):
         # TODO: Test.
         return YouTubeChannel(**doc.to_doc())
 
-    def to_row(self):
-        return (self.channel_id, self.display_name, self.affiliation,
-                self.description, self.keywords, self.published_at,
-                self.thumbnail_url, self.default_language, self.country)
-
 
 LANGUAGE_DETECTION = True
 
 
-class YouTubeStream(Row):
+class YouTubeStream(Row, namedtuple('YouTubeStream', [
+        'video_id', 'epoch', 'channel_id', 'game_id', 'viewers', 'title',
+        'language', 'tags'])):
     """
     A row in the youtube_stream table.
 
-    The title and number of viewers of a stream for a given hour.
+    The title and number of viewers of a stream for a given hour.  Tags are
+    stored as the string representation of the list of tags.
     """
     PRIMARY_KEY = ['video_id', 'epoch']
     TABLE_NAME = 'youtube_stream'
-    __slots__ = ['video_id', 'epoch', 'channel_id', 'game_id', 'viewers',
-                 'title', 'language', 'tags']
-
-    def __init__(self, video_id, epoch, channel_id, game_id, viewers, title,
-                 language, tags):
-        self.video_id = video_id
-        self.epoch = epoch
-        self.channel_id = channel_id
-        self.game_id = game_id
-        self.viewers = viewers
-        self.title = title
-        self.language = language
-        self.tags = tags
+    __slots__ = ()
 
     @staticmethod
-    def from_vcs(api_resp, vcs, timestamp):
+    def detect_language(title, tags):
+        """
+        Predicts the language of a stream that did not specify one.
+
+        :param title: str, title of the stream.
+        :param tags: list(str) or str, the stream's tags.
+        :return: str, ISO 2 letter language code followed by '_d'.
+        """
+        if type(tags) == list:
+            info = title + ' '.join(tags)
+        else:
+            info = title + tags
+        return classify_language(info) + '_d'
+
+    @staticmethod
+    def from_vcs(api_resp, vcs, timestamp, classifier=None):
         """
         Creates rows from mongodocs.
 
+        Unknown languages are detected from the title and tags when
+        LANGUAGE_DETECTION is set.
+
         :param api_resp: list(YTLivestreams), livestream objects.
         :param vcs: int, aggregated viewercounts.
         :param timestamp: int, epoch.
-        :return:
+        :param classifier: YouTubeGameClassifier, sets the game_id of each
+            row if given.
+        :return: list(YouTubeStream)
         """
         # Combine api_resp so that we can look across all api responses
         comb = {}
@@ -299,43 +305,36 @@ class YouTubeStream(Row):
         ys = []
         for videoid, viewers in vcs.items():
             stream = comb[videoid]
+            language = stream.language
+            if LANGUAGE_DETECTION and language == 'unknown':
+                language = YouTubeStream.detect_language(stream.title,
+                                                         stream.tags)
+            game_id = None
+            if classifier:
+                game_id = classifier.classify(stream.chanid, stream.title,
+                                              stream.tags)
             params = {
                 'video_id': videoid,
                 'epoch': timestamp,
                 'channel_id': stream.chanid,
-                'game_id': None,
+                'game_id': game_id,
                 'viewers': viewers,
                 'title': stream.title,
-                'language': stream.language,
-                'tags': stream.tags
+                'language': language,
+                'tags': str(stream.tags)
             }
             ys.append(YouTubeStream(**params))
         return ys
 
     @staticmethod
     def from_row(row):
-        return YouTubeStream(row[0], row[1], row[2], row[3], row[4], row[5],
-                             row[6], row[7])
-
-    def to_row(self):
-        if LANGUAGE_DETECTION and self.language == 'unknown':
-            if type(self.tags) == list:
-                info = self.title + ' '.join(self.tags)
-            else:
-                info = self.title + self.tags
-            self.language = classify_language(info) + '_d'
-        return (self.video_id, self.epoch, self.channel_id, self.game_id,
-                self.viewers, self.title, self.language, str(self.tags))
+        return YouTubeStream._make(row)
 
 
-class TournamentOrganizer(Row):
+class TournamentOrganizer(Row, namedtuple('TournamentOrganizer', ['name'])):
     """
     A row in the esports_org table.
     """
     TABLE_NAME = 'tournament_organizer'
     PRIMARY_KEY = 'org_name'
-    def __init__(self, name):
-        self.name = name
-
-    def to_row(self):
-        return self.name,
+    __slots__ = ()
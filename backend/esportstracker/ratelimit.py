@@ -0,0 +1,278 @@
+import os
+import json
+import time
+import fcntl
+from datetime import datetime, timedelta
+import pytz
+
+# Lower numbers are served first.
+PRIORITY_STREAMS = 0
+PRIORITY_CHANNELS = 10
+
+
+def update_state(path, fun):
+    """
+    Calls fun with the JSON state stored at path while holding a file lock.
+
+    The state is written back after fun returns, so concurrent processes see
+    each update atomically.
+
+    :param path: str, path of the state file, created if missing.
+    :param fun: function, takes the state dict, modifies it in place, and
+        returns a value.
+    :return: the return value of fun.
+    """
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    with os.fdopen(fd, 'r+') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            try:
+                state = json.loads(f.read())
+            except ValueError:
+                state = {}
+            res = fun(state)
+            f.seek(0)
+            f.truncate()
+            f.write(json.dumps(state))
+            f.flush()
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+    return res
+
+
+class SharedTokenBucket:
+    """
+    Token bucket shared by every local process using one Twitch client id.
+
+    Twitch limits requests per client id and IP address, so the scrapers on
+    a host have to share one budget.  The bucket's state is kept in a small
+    JSON file that is only read and written while holding an exclusive
+    flock, so any number of processes can draw from it.  Tokens refill
+    continuously at capacity / window per second and are corrected with the
+    ratelimit headers of each response.  Once Twitch reports that no
+    requests remain, nothing is granted until its reset time.
+
+    Processes waiting for a token register their priority in the file.  A
+    token is only granted if no live process with a lower priority number
+    is waiting, so the viewer count scraper is served before the channel
+    backfill.
+    """
+    def __init__(self, path, capacity=30, window=60):
+        """
+        SharedTokenBucket constructor.
+
+        :param path: str, path of the state file, created if missing.
+        :param capacity: int, the maximum number of tokens.
+        :param window: int, seconds for an empty bucket to refill.
+        """
+        self.path = path
+        self.capacity = capacity
+        self.window = window
+        self.rate = capacity / window
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _update(self, fun):
+        """
+        Calls fun with the refilled state of the bucket.
+
+        :param fun: function, takes the state dict and the current time,
+            modifies the state in place, and returns a value.
+        :return: the return value of fun.
+        """
+        def refill(state):
+            now = time.time()
+            state.setdefault('tokens', self.capacity)
+            state.setdefault('updated', now)
+            state.setdefault('waiting', {})
+            if 'full_at' in state and now >= state['full_at']:
+                state['tokens'] = self.capacity
+                del state['full_at']
+            elif 'full_at' not in state:
+                elapsed = max(0, now - state['updated'])
+                state['tokens'] = min(self.capacity, state['tokens'] +
+                                      elapsed * self.rate)
+            state['updated'] = now
+            return fun(state, now)
+        return update_state(self.path, refill)
+
+    def _try_acquire(self, priority):
+        """
+        Takes a token if one is available to a process of this priority.
+
+        :param priority: int, lower numbers are served first.
+        :return: float, 0 if a token was taken or else seconds to wait.
+        """
+        pid = str(os.getpid())
+
+        def take(state, now):
+            waiting = state['waiting']
+            # Forget processes that stopped waiting without a token.
+            for wpid, (wpriority, seen) in list(waiting.items()):
+                if now - seen > self.window:
+                    del waiting[wpid]
+            ahead = [p for wpid, (p, _) in waiting.items()
+                     if p < priority and wpid != pid]
+            if state['tokens'] >= 1 and not ahead:
+                state['tokens'] -= 1
+                waiting.pop(pid, None)
+                return 0
+            waiting[pid] = [priority, now]
+            if 'full_at' in state:
+                return max(0.05, state['full_at'] - now)
+            return max(0.05, (1 - state['tokens']) / self.rate)
+
+        return self._update(take)
+
+    def acquire(self, priority=PRIORITY_STREAMS):
+        """
+        Blocks until a request may be made.
+
+        :param priority: int, lower numbers are served first.
+        :return: None
+        """
+        while True:
+            wait = self._try_acquire(priority)
+            if not wait:
+                return
+            time.sleep(min(wait, 1))
+
+    def sync(self, remaining, reset):
+        """
+        Corrects the bucket with the ratelimit headers of a response.
+
+        :param remaining: int, value of the ratelimit-remaining header.
+        :param reset: int, value of the ratelimit-reset header, the epoch at
+            which the bucket is full again.
+        :return: None
+        """
+        def correct(state, now):
+            if remaining < state['tokens']:
+                state['tokens'] = remaining
+            if remaining == 0 and reset > now:
+                # Nothing refills until Twitch resets the bucket.
+                state['full_at'] = reset
+        self._update(correct)
+
+
+class QuotaBudget:
+    """
+    Daily YouTube API quota shared by every local process using one key.
+
+    Usage is stored per consumer in a lock-protected JSON file and resets at
+    midnight Pacific time, when YouTube resets the quota.  Each consumer
+    owns a share of the daily limit and paces itself so that its share is
+    spread evenly over the rest of the day instead of being exhausted early.
+    """
+    TIMEZONE = pytz.timezone('US/Pacific')
+
+    def __init__(self, path, daily_limit=10000, shares=None):
+        """
+        QuotaBudget constructor.
+
+        :param path: str, path of the state file, created if missing.
+        :param daily_limit: int, quota units available per day.
+        :param shares: dict, keys are consumer names and values are the
+            fraction of the daily limit each may use.
+        """
+        self.path = path
+        self.daily_limit = daily_limit
+        self.shares = shares or {}
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def _today(self, now):
+        day = datetime.fromtimestamp(now, self.TIMEZONE)
+        return day.strftime('%Y-%m-%d')
+
+    def seconds_left(self, now=None):
+        """
+        Returns the number of seconds until the quota resets.
+
+        :param now: float, unix epoch, defaults to the current time.
+        :return: float
+        """
+        now = now or time.time()
+        day = datetime.fromtimestamp(now, self.TIMEZONE)
+        midnight = self.TIMEZONE.localize(
+            datetime(day.year, day.month, day.day) + timedelta(days=1))
+        return max(1, midnight.timestamp() - now)
+
+    def _update(self, fun):
+        now = time.time()
+
+        def reset(state):
+            if state.get('day') != self._today(now):
+                state['day'] = self._today(now)
+                state['used'] = {}
+            return fun(state['used'])
+        return update_state(self.path, reset)
+
+    def charge(self, units, consumer):
+        """
+        Records quota units spent by a consumer.
+
+        :param units: int, quota units spent.
+        :param consumer: str, name of the consumer.
+        :return: None
+        """
+        def add(used):
+            used[consumer] = used.get(consumer, 0) + units
+        self._update(add)
+
+    def used(self, consumer=None):
+        """
+        Returns the quota units spent today.
+
+        :param consumer: str, only count this consumer's units if given.
+        :return: int
+        """
+        def count(used):
+            if consumer:
+                return used.get(consumer, 0)
+            return sum(used.values())
+        return self._update(count)
+
+    def remaining(self, consumer):
+        """
+        Returns the units left in a consumer's share of today's quota.
+
+        Consumers without a configured share may use the whole limit.
+
+        :param consumer: str, name of the consumer.
+        :return: float
+        """
+        def left(used):
+            share = self.shares.get(consumer, 1) * self.daily_limit
+            total = self.daily_limit - sum(used.values())
+            return max(0, min(share - used.get(consumer, 0), total))
+        return self._update(left)
+
+    def interval(self, consumer, cycle_cost, minimum):
+        """
+        Returns how long to wait between cycles to spend the quota evenly.
+
+        :param consumer: str, name of the consumer.
+        :param cycle_cost: int, quota units spent by one cycle.
+        :param minimum: int, the shortest allowed interval in seconds.
+        :return: float, seconds until the next cycle.
+        """
+        seconds_left = self.seconds_left()
+        remaining = self.remaining(consumer)
+        if remaining < cycle_cost:
+            return max(minimum, seconds_left)
+        return max(minimum, seconds_left * cycle_cost / remaining)
+
+    def allowance(self, consumer, interval):
+        """
+        Returns the units a consumer may spend in the next interval.
+
+        :param consumer: str, name of the consumer.
+        :param interval: int, seconds until the consumer runs again.
+        :return: int
+        """
+        seconds_left = self.seconds_left()
+        remaining = self.remaining(consumer)
+        return int(remaining * min(1, interval / seconds_left))
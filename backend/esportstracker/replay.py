@@ -0,0 +1,252 @@
+import os
+import re
+import math
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from urllib.parse import urlsplit, parse_qsl
+from aiohttp import web
+
+
+# Query parameters that are credentials rather than part of the request,
+# compared case insensitively.
+SECRET_PARAMS = {'key', 'client-id'}
+RECORDED_HEADERS = {'content-type', 'etag'}
+
+
+def _normpath(path):
+    """
+    Removes repeated and trailing slashes from a url path.
+
+    The configured API hosts end with a slash, so the clients request paths
+    such as //helix/streams/.
+    """
+    return re.sub('/+', '/', path).rstrip('/')
+
+
+def _public_params(query):
+    """
+    Removes the credentials from query string parameters.
+
+    :param query: list(tuple), the query string parameters.
+    :return: list(tuple)
+    """
+    return [(k, v) for k, v in query if k.lower() not in SECRET_PARAMS]
+
+
+def _request_key(path, query):
+    """
+    Returns the key recorded responses are matched by.
+
+    :param path: str, the url path.
+    :param query: list(tuple), the query string parameters.
+    :return: str
+    """
+    params = sorted(_public_params(query))
+    return _normpath(path) + '?' + '&'.join(f'{k}={v}' for k, v in params)
+
+
+class Recorder:
+    """
+    Records the API responses received by a client to fixture files.
+
+    Attaches a response hook to the client's requests session, so every
+    request made through _request, including retries, is saved as one
+    JSON file.  Credentials are not recorded.
+    """
+    def __init__(self, directory):
+        """
+        Recorder constructor.
+
+        :param directory: str, the fixture directory, created if missing.
+        """
+        self.directory = directory
+        self.count = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def attach(self, client):
+        """
+        Records the responses of an API client.
+
+        :param client: TwitchAPIClient or YouTubeAPIClient
+        :return: None
+        """
+        client.session.hooks['response'].append(self.save)
+
+    def save(self, response, *args, **kwargs):
+        """
+        Writes a response to the fixture directory.
+
+        :param response: requests.Response
+        :return: None
+        """
+        # A 304 is answered from the client's cache and replayed as such.
+        if response.status_code == 304:
+            return
+        url = urlsplit(response.url)
+        query = parse_qsl(url.query, keep_blank_values=True)
+        fixture = {
+            'path': url.path,
+            'query': [[k, v] for k, v in _public_params(query)],
+            'status': response.status_code,
+            'headers': {k.lower(): v for k, v in response.headers.items()
+                        if k.lower() in RECORDED_HEADERS},
+            'body': response.content.decode('utf8')
+        }
+        self.count += 1
+        name = '{:05d}{}.json'.format(self.count,
+                                      _normpath(url.path).replace('/', '-'))
+        with open(os.path.join(self.directory, name), 'w') as f:
+            json.dump(fixture, f)
+
+
+class StandInServer:
+    """
+    Local HTTP server that replays recorded Twitch and YouTube responses.
+
+    Requests are matched to recordings by path and query string.  Repeated
+    requests cycle through the recordings of the same request in the order
+    they were recorded, and a request that was never recorded is answered
+    with the first recording of its path.  The server can delay responses,
+    send Twitch ratelimit headers and answer with 429s once its bucket is
+    empty, and inject errors, so clients can be benchmarked offline.
+    """
+    def __init__(self, directory, latency=0, jitter=0, error_rate=0,
+                 error_status=503, ratelimit=None, seed=None):
+        """
+        StandInServer constructor.
+
+        :param directory: str, the fixture directory of a Recorder.
+        :param latency: float, seconds to delay each response.
+        :param jitter: float, up to this many seconds are added at random.
+        :param error_rate: float, the fraction of requests answered with
+            error_status.
+        :param error_status: int, the status code of injected errors.
+        :param ratelimit: tuple, (capacity, window) of the Twitch rate limit
+            to enforce on /helix requests, or None.
+        :param seed: int, seeds the latency jitter and error injection.
+        """
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.ratelimit = ratelimit
+        self.random = random.Random(seed)
+        self.fixtures = {}
+        self.bypath = {}
+        self.served = {}
+        self.stats = {'requests': 0, 'errors': 0, 'ratelimited': 0,
+                      'not_modified': 0, 'unmatched': 0}
+        if ratelimit:
+            self.tokens = ratelimit[0]
+            self.reset = time.time() + ratelimit[1]
+        for name in sorted(os.listdir(directory)):
+            if not name.endswith('.json'):
+                continue
+            with open(os.path.join(directory, name)) as f:
+                fixture = json.load(f)
+            key = _request_key(fixture['path'], fixture['query'])
+            self.fixtures.setdefault(key, []).append(fixture)
+            self.bypath.setdefault(_normpath(fixture['path']), fixture)
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    def _ratelimit_headers(self):
+        """
+        Takes a token from the rate limit.
+
+        :return: tuple, (bool whether a token was taken, dict of headers)
+        """
+        now = time.time()
+        if now >= self.reset:
+            self.tokens = self.ratelimit[0]
+            self.reset = now + self.ratelimit[1]
+        taken = self.tokens > 0
+        if taken:
+            self.tokens -= 1
+        headers = {'Ratelimit-Limit': str(self.ratelimit[0]),
+                   'Ratelimit-Remaining': str(self.tokens),
+                   'Ratelimit-Reset': str(math.ceil(self.reset))}
+        return taken, headers
+
+    def _match(self, request):
+        """
+        Returns the recording that answers a request.
+
+        :param request: aiohttp.web.Request
+        :return: dict, or None if nothing was recorded for the path.
+        """
+        key = _request_key(request.path, request.query.items())
+        if key not in self.fixtures:
+            self.stats['unmatched'] += 1
+            return self.bypath.get(_normpath(request.path))
+        recordings = self.fixtures[key]
+        i = self.served.get(key, 0)
+        self.served[key] = i + 1
+        return recordings[i % len(recordings)]
+
+    async def handle(self, request):
+        self.stats['requests'] += 1
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay:
+            await asyncio.sleep(delay)
+        headers = {}
+        if self.ratelimit and _normpath(request.path).startswith('/helix'):
+            taken, headers = self._ratelimit_headers()
+            if not taken:
+                self.stats['ratelimited'] += 1
+                return web.Response(status=429, headers=headers)
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.stats['errors'] += 1
+            return web.Response(status=self.error_status, headers=headers)
+        fixture = self._match(request)
+        if fixture is None:
+            return web.Response(status=404, headers=headers)
+        etag = fixture['headers'].get('etag')
+        if etag and request.headers.get('If-None-Match') == etag:
+            self.stats['not_modified'] += 1
+            return web.Response(status=304, headers={**headers, 'ETag': etag})
+        headers.update(fixture['headers'])
+        return web.Response(status=fixture['status'], headers=headers,
+                            body=fixture['body'].encode('utf8'))
+
+    def start(self, port=0):
+        """
+        Starts the server on a background thread.
+
+        :param port: int, the port to listen on, any free port if 0.
+        :return: str, the host url of the server.
+        """
+        app = web.Application()
+        app.router.add_route('GET', '/{path:.*}', self.handle)
+        self._loop = asyncio.new_event_loop()
+        self._runner = web.AppRunner(app)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, '127.0.0.1', port)
+        self._loop.run_until_complete(site.start())
+        port = self._runner.addresses[0][1]
+        self._thread = threading.Thread(target=self._loop.run_forever,
+                                        daemon=True, name='StandInServer')
+        self._thread.start()
+        logging.debug(f'Replaying {len(self.fixtures)} requests on {port}')
+        return f'http://127.0.0.1:{port}'
+
+    def stop(self):
+        """
+        Stops the server.
+
+        :return: None
+        """
+        if not self._thread:
+            return
+        future = asyncio.run_coroutine_threadsafe(self._runner.cleanup(),
+                                                  self._loop)
+        future.result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+        self._thread = None
@@ -0,0 +1,148 @@
+import time
+import random
+import logging
+import collections
+from email.utils import parsedate_to_datetime
+
+
+class RetryPolicy:
+    """
+    Decides whether and how long to wait before retrying a failed request.
+
+    Shared by the API clients so that a single failed request does not stall
+    a scraping cycle.  Waits grow exponentially with full jitter and are
+    replaced by the server's Retry-After or ratelimit-reset header when
+    either requests a wait.  Client errors other than 429 are not retried
+    since repeating the request cannot succeed.
+
+    A deadline, normally the end of the current scraping cycle, bounds the
+    retries.  A retry that would have to wait past the deadline is given up
+    so the next cycle starts on time.  The number of retries and the time
+    spent sleeping are recorded for each cycle.
+    """
+    RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, attempts=4, base_delay=1, max_delay=60):
+        """
+        RetryPolicy constructor.
+
+        :param attempts: int, the maximum number of attempts per request.
+        :param base_delay: float, seconds to wait after the first failure.
+        :param max_delay: float, the longest backoff in seconds.  Waits
+            requested by the server are only limited by the deadline.
+        """
+        self.attempts = attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.deadline = None
+        self.retries = 0
+        self.slept = 0
+        self.failures = collections.Counter()
+
+    def begin_cycle(self, deadline=None):
+        """
+        Sets the deadline of a new cycle and resets the recorded stats.
+
+        :param deadline: float, unix epoch after which requests are not
+            retried, or None for no deadline.
+        :return: None
+        """
+        self.deadline = deadline
+        self.retries = 0
+        self.slept = 0
+        self.failures.clear()
+
+    def stats(self):
+        """
+        Returns the stats recorded since the cycle began.
+
+        :return: dict
+        """
+        return {'retries': self.retries, 'slept': round(self.slept, 2),
+                'failures': dict(self.failures)}
+
+    def backoff(self, attempt):
+        """
+        Returns a jittered exponential backoff.
+
+        :param attempt: int, the number of the failed attempt, starting at 0.
+        :return: float, seconds.
+        """
+        return random.uniform(0, min(self.max_delay,
+                                     self.base_delay * 2 ** attempt))
+
+    @staticmethod
+    def server_delay(headers, now=None):
+        """
+        Returns the wait requested by the Retry-After or ratelimit-reset
+        headers of a response.
+
+        :param headers: dict, response headers with lowercase names.
+        :param now: float, unix epoch, defaults to the current time.
+        :return: float, seconds, or None if neither header is present.
+        """
+        now = now or time.time()
+        if 'retry-after' in headers:
+            value = headers['retry-after']
+            try:
+                return max(0, float(value))
+            except ValueError:
+                pass
+            try:
+                return max(0, parsedate_to_datetime(value).timestamp() - now)
+            except (TypeError, ValueError):
+                pass
+        if 'ratelimit-reset' in headers:
+            try:
+                return max(0, int(headers['ratelimit-reset']) - now)
+            except ValueError:
+                pass
+        return None
+
+    def delay(self, attempt, status=None, headers=None):
+        """
+        Returns how long to wait before retrying a failed attempt.
+
+        :param attempt: int, the number of the failed attempt, starting at 0.
+        :param status: int, the response status code, or None if no
+            response was received or the response was empty.
+        :param headers: dict, response headers with lowercase names.
+        :return: float, seconds to wait, or None if the request should not
+            be retried.
+        """
+        self.failures[status or 'error'] += 1
+        if attempt + 1 >= self.attempts:
+            return None
+        if status is not None and status not in self.RETRY_STATUSES:
+            return None
+        wait = None
+        if status is not None and headers:
+            if status != 429:
+                # A reset time only matters once the rate limit is hit.
+                headers = {k: v for k, v in headers.items()
+                           if k != 'ratelimit-reset'}
+            wait = self.server_delay(headers)
+        if not wait:
+            # A zero wait or a reset that already passed would retry at once.
+            wait = self.backoff(attempt)
+        if self.deadline and time.time() + wait > self.deadline:
+            logging.debug(f'Not retrying, {wait:.1f}s wait passes deadline')
+            return None
+        self.retries += 1
+        self.slept += wait
+        return wait
+
+    def sleep(self, attempt, status=None, headers=None):
+        """
+        Sleeps before retrying a failed attempt.
+
+        :param attempt: int, the number of the failed attempt, starting at 0.
+        :param status: int, the response status code, or None.
+        :param headers: dict, response headers with lowercase names.
+        :return: bool, False if the request should not be retried.
+        """
+        wait = self.delay(attempt, status, headers)
+        if wait is None:
+            return False
+        time.sleep(wait)
+        return True
@@ -3,14 +3,23 @@ import requests
 import time
 import logging
 import sys
+import psycopg2
 import pymongo.errors
 import random
+import collections
 from abc import ABC, abstractmethod
 
 
 from .apiclients import YouTubeAPIClient, TwitchAPIClient
+from .apiclients import AsyncTwitchAPIClient
 from .dbinterface import MongoManager, PostgresManager
+from .spool import DocSpool
+from .gameregistry import GameRegistry
+from .ratelimit import SharedTokenBucket, PRIORITY_STREAMS, PRIORITY_CHANNELS
+from .ratelimit import QuotaBudget
+from .retry import RetryPolicy
 from .models.mongomodels import YTLivestreams, YouTubeChannelDoc, TwitchChannelDoc
+from .models.mongomodels import TwitchStreamsHourBucket
 from .models.postgresmodels import TwitchChannel, YouTubeChannel
 
 
@@ -20,6 +29,9 @@ class Scraper(ABC):
 
     Scrapers should retrieve some information using the API
     """
+    spool = None
+    retry = None
+
     @abstractmethod
     def run(self):
         """
@@ -34,25 +46,73 @@ class Scraper(ABC):
         """
         Calls the run function at regular intervals and sleeps in between.
 
-        run() is called every update_interval minutes.
+        run() is called every update_interval minutes.  If the scraper has a
+        spool, its background flusher is started first.  API requests are not
+        retried past the end of the cycle.
         :return:
         """
+        if self.spool:
+            self.spool.start()
         while True:
             start_time = time.time()
+            if self.retry:
+                self.retry.begin_cycle(start_time + self.update_interval)
             try:
                 self.run()
                 tot_time = time.time() - start_time
                 logging.debug('Elapsed time: {:.2f}s'.format(tot_time))
-            except requests.exceptions.ConnectionError:
-                logging.warning('Twitch API Failed')
-            except pymongo.errors.ServerSelectionTimeoutError:
+            except (requests.exceptions.ConnectionError, ConnectionError):
+                logging.warning('API Failed')
+            except (pymongo.errors.PyMongoError, psycopg2.Error):
                 logging.warning(
                     'Database Error: {}'.format(sys.exc_info()[0]))
+            if self.retry and self.retry.retries:
+                logging.debug(f'API retries: {self.retry.stats()}')
             time_to_sleep = self.update_interval - (time.time() - start_time)
             if time_to_sleep > 0:
                 time.sleep(time_to_sleep)
 
 
+def twitch_ratelimiter(config):
+    """
+    Creates the rate limit shared by the local Twitch scrapers.
+
+    :param config: dict, the whole config file.
+    :return: ratelimit.SharedTokenBucket or None if twitch_ratelimit is not
+        set in the config file.
+    """
+    cfg = config.get('twitch_ratelimit')
+    if not cfg:
+        return None
+    return SharedTokenBucket(cfg['path'], cfg['capacity'], cfg['window'])
+
+
+def retry_policy(config):
+    """
+    Creates the retry policy of a scraper's API clients.
+
+    :param config: dict, the whole config file.
+    :return: retry.RetryPolicy
+    """
+    cfg = config.get('retry', {})
+    return RetryPolicy(cfg.get('attempts', 4), cfg.get('base_delay', 1),
+                       cfg.get('max_delay', 60))
+
+
+def youtube_budget(config):
+    """
+    Creates the daily quota budget shared by the local YouTube scrapers.
+
+    :param config: dict, the whole config file.
+    :return: ratelimit.QuotaBudget or None if youtube_quota is not set in
+        the config file.
+    """
+    cfg = config.get('youtube_quota')
+    if not cfg:
+        return None
+    return QuotaBudget(cfg['path'], cfg['daily_limit'], cfg['shares'])
+
+
 # noinspection PyTypeChecker
 class TwitchScraper(Scraper):
     """
@@ -71,64 +131,177 @@ class TwitchScraper(Scraper):
         with open(config_path) as f:
             config = yaml.safe_load(f)
             self.esportsgames = config['esportsgames']
+            ratelimiter = twitch_ratelimiter(config)
+            self.retry = retry_policy(config)
+            postgres = config.get('postgres')
             config = config['twitch']
             self.update_interval = config['update_interval']
+            self.bucketed = config['db'].get('bucketed', False)
+            self.minviewers = config['api'].get('minviewers', 10)
+            self.batch = config['api'].get('batch_games', False)
         with open(key_path) as f:
             keys = yaml.safe_load(f)
             user, pwd = None, None
             if 'mongodb' in keys:
                 user = keys['mongodb']['write']['user']
                 pwd = keys['mongodb']['write']['pwd']
+            # The game registry is only persisted if Postgres is available.
+            if postgres and 'postgres' in keys:
+                postgres['user'] = keys['postgres']['user']
+                postgres['password'] = keys['postgres']['passwd']
+            else:
+                postgres = None
 
         self.apiclient = TwitchAPIClient(config['api']['host'],
                                          keys['twitchclientid'],
-                                         keys['twitchsecret'])
+                                         keys['twitchsecret'],
+                                         ratelimiter, PRIORITY_STREAMS,
+                                         self.retry)
+        self.asyncclient = None
+        if config['api'].get('concurrency'):
+            self.asyncclient = AsyncTwitchAPIClient(
+                config['api']['host'], keys['twitchclientid'],
+                keys['twitchsecret'], config['api']['concurrency'],
+                ratelimiter, PRIORITY_STREAMS, self.retry)
+        # The esports games are resolved by the first cycle that succeeds.
+        self.postgres = postgres
+        self.games = None
+        self.resolved = False
+        self.default_pages = config['api'].get('pages', 1)
+        self.pages = {}
         self.mongo = MongoManager(config['db']['host'],
                                   config['db']['port'],
                                   config['db']['db_name'],
-                                  user, pwd, False)
+                                  user, pwd, False,
+                                  write_concern=config['db'].get(
+                                      'write_concern'))
         self.mongo.check_indexes()
+        if 'spool' in config:
+            self.spool = DocSpool(config['spool'], self.mongo)
 
-    def scrape_top_games(self):
+    def resolve_esports_games(self):
         """
-        Makes a twitch API Request and stores the result in MongoDB.
+        Fills in the ids of esports games configured by name only.
 
-        Retrieves and returns the current viewership and number of broadcasting
-        channels for each of the top 100 games by viewer count.
+        Every esports game is resolved with bulk requests and games that do
+        not exist on Twitch are dropped.  Called at the start of the first
+        scraping cycle, and again by the next cycle if it fails.
 
-        :return: requests.Response, The response to the API request.
+        :return: None
+        """
+        if self.games is None:
+            if self.postgres:
+                esg = [game['name'] for game in self.esportsgames]
+                self.games = PostgresManager.from_config(
+                    self.postgres, esg, self.apiclient).games
+            else:
+                self.games = GameRegistry(apiclient=self.apiclient)
+        self.games.load()
+        self.games.warm(
+            [g['name'] for g in self.esportsgames if 'id' not in g],
+            [g['id'] for g in self.esportsgames if 'id' in g])
+        games = []
+        for game in self.esportsgames:
+            if 'id' not in game:
+                game['id'] = self.games.id(game['name'])
+            if game['id'] is None:
+                logging.warning(f'Unknown esports game: {game["name"]}')
+                continue
+            games.append(game)
+        self.esportsgames = games
+        # Games may override the number of pages of streams requested.
+        self.pages = {game['id']: game.get('pages', self.default_pages)
+                      for game in self.esportsgames}
+        self.resolved = True
+
+    def scrape_top_games(self, timestamp=None):
         """
-        apiresult = self.apiclient.gettopgames()
-        m = self.mongo.store(apiresult)
+        Makes a twitch API Request for the current top games.
+
+        Retrieves the current viewership and number of broadcasting channels
+        for each of the top 100 games by viewer count.
+
+        :param timestamp: int, epoch of the scraping cycle.
+        :return: models.mongomodels.TwitchGamesAPIResponse
+        """
+        apiresult = self.apiclient.gettopgames(timestamp=timestamp)
         logging.debug(apiresult)
-        logging.debug(m)
+        return apiresult
 
-    def _scrape_streams(self, game):
+    def _scrape_streams(self, game, timestamp=None):
         """
         Retrieves stream data for one game.
 
-        Scrapes viewership data from all esports titles defined in the config
-        file.
-
         :param game: dict: name and id of the game in the format
             {id: int, name: str}.
-        :return: None
+        :param timestamp: int, epoch of the scraping cycle.
+        :return: models.mongomodels.TwitchStreamsAPIResponse or None
         """
-        apiresult = self.apiclient.topstreams(game['id'])
+        apiresult = self.apiclient.topstreams(game['id'], timestamp,
+                                              self.pages[game['id']],
+                                              self.minviewers)
         if apiresult:
-            m = self.mongo.store(apiresult)
             logging.debug(apiresult)
-            logging.debug(m)
         else:
             logging.warning(f'No API result for game {game}')
+        return apiresult
+
+    def scrape_esports_games(self, timestamp=None):
+        """
+        Retrieves stream data for every esports title in the config file.
+
+        The games are requested concurrently if twitch.api.concurrency is set
+        in the config file, and up to 10 games are requested at once if
+        twitch.api.batch_games is set.
 
-    def scrape_esports_games(self):
+        :param timestamp: int, epoch of the scraping cycle.
+        :return: list(models.mongomodels.TwitchStreamsAPIResponse)
+        """
+        gameids = [game['id'] for game in self.esportsgames]
+        if self.asyncclient:
+            results = self.asyncclient.topstreams_many(gameids, timestamp,
+                                                       self.pages,
+                                                       self.minviewers,
+                                                       self.batch)
+        elif self.batch:
+            results = self.apiclient.topstreams_batched(gameids, timestamp,
+                                                        self.pages,
+                                                        self.minviewers)
+        else:
+            docs = []
+            for game in self.esportsgames:
+                apiresult = self._scrape_streams(game, timestamp)
+                if apiresult:
+                    docs.append(apiresult)
+            return docs
+        docs = []
         for game in self.esportsgames:
-            self._scrape_streams(game)
+            apiresult = results[game['id']]
+            if apiresult:
+                logging.debug(apiresult)
+                docs.append(apiresult)
+            else:
+                logging.warning(f'No API result for game {game}')
+        return docs
 
     def run(self):
-        self.scrape_top_games()
-        self.scrape_esports_games()
+        if not self.resolved:
+            self.resolve_esports_games()
+        # Every document of a cycle shares one timestamp.
+        timestamp = int(time.time())
+        topgames = self.scrape_top_games(timestamp)
+        streams = self.scrape_esports_games(timestamp)
+        if self.spool:
+            bucket = TwitchStreamsHourBucket.COLLECTION
+            m = self.spool.append([topgames])
+            m += self.spool.append(streams, bucket if self.bucketed else None)
+        elif self.bucketed:
+            m = self.mongo.store_many([topgames])
+            m[TwitchStreamsHourBucket.COLLECTION] = \
+                self.mongo.append_buckets(streams)
+        else:
+            m = self.mongo.store_many([topgames] + streams)
+        logging.debug(m)
 
 
 class TwitchChannelScraper(Scraper):
@@ -139,6 +312,8 @@ class TwitchChannelScraper(Scraper):
             config = yaml.safe_load(f)
             esg = set([game['name'] for game in config['esportsgames']])
             postgres = config['postgres']
+            ratelimiter = twitch_ratelimiter(config)
+            self.retry = retry_policy(config)
             config = config['twitch_channel_scraper']
             self.update_interval = config['update_interval']
             mongo = config['mongodb']
@@ -151,27 +326,32 @@ class TwitchChannelScraper(Scraper):
                 user = keys['mongodb']['write']['user']
                 pwd = keys['mongodb']['write']['pwd']
 
+        # The channel backfill yields to the viewer count scraper.
         self.apiclient = TwitchAPIClient(config['api']['host'],
                                          keys['twitchclientid'],
-                                         keys['twitchsecret'])
+                                         keys['twitchsecret'],
+                                         ratelimiter, PRIORITY_CHANNELS,
+                                         self.retry)
         self.mongo = MongoManager(mongo['host'], mongo['port'],
                                   mongo['db_name'], user, pwd, mongo['ssl'])
         self.mongo.check_indexes()
 
         self.pg = PostgresManager.from_config(postgres, esg)
 
-    def store_channel_info(self, doc):
+    def store_channel_info(self, docs):
         """
-        Stores information from doc in Postgres.
+        Stores information from docs in Postgres.
 
-        :param doc: int, TwitchChannelDoc.
+        :param docs: list(TwitchChannelDoc), the documents to store.
         :return:
         """
-        row = TwitchChannel(**doc.todoc())
+        if not docs:
+            return
+        rows = [TwitchChannel(**doc.todoc()) for doc in docs]
         update_fields = ['display_name', 'description', 'followers', 'login',
                          'broadcaster_type', 'type', 'offline_image_url',
                          'profile_image_url']
-        self.pg.update_rows(row, update_fields)
+        self.pg.update_rows(rows, update_fields)
         self.pg.commit()
 
     def get_missing_channels(self, channel_ids):
@@ -179,33 +359,38 @@ class TwitchChannelScraper(Scraper):
         Checks the channel_ids against the Mongo database and retrieves any
         missing channels using the Twitch API.
 
+        Missing channels are requested in batches of up to 100 ids.  Channels
+        absent from a response no longer exist and are stored as banned.
+
         :param channel_ids: list(channel_ids), list of channel_ids.
         :return: int, the number of channels that were new.
         """
         new_channel_count = 0
         start = time.time()
+        batch_size = TwitchAPIClient.API_MAX_RESULTS
         # Shuffle so multiple instances don't duplicate API calls.
         random.shuffle(channel_ids)
-        for channel_id in channel_ids:
-            doc = self.mongo.get_twitch_channel(channel_id)
-            if not doc:
-                new_channel_count += 1
-                if new_channel_count % 30 == 0:
-                    tot = time.time() - start
-                    logging.debug(
-                        'Retrieved {} channels in {:.2f}s -- {:.2f}c/s'.format(
-                            new_channel_count, tot, new_channel_count / tot
-                        ))
-                doc = self.apiclient.channelinfo(channel_id)
-                if not doc:
+        for found, missing in self.mongo.get_twitch_channels(channel_ids):
+            self.store_channel_info(list(found.values()))
+            for i in range(0, len(missing), batch_size):
+                batch = missing[i:i + batch_size]
+                users = self.apiclient.channelinfo(batch)
+                docs = []
+                for channel_id in batch:
+                    if channel_id in users:
+                        docs.append(users[channel_id])
+                        continue
                     logging.debug(f'Channel {channel_id} no longer exists')
-                    doc = TwitchChannelDoc(channel_id, '', 'BANNED',
-                                                      None, None, None, None, '',
-                                                      None)
-                else:
-                    doc = doc[channel_id]
-                self.mongo.store(doc)
-            self.store_channel_info(doc)
+                    docs.append(TwitchChannelDoc(channel_id, '', 'BANNED',
+                                                 None, None, None, None, '',
+                                                 None))
+                self.mongo.store_many(docs)
+                self.store_channel_info(docs)
+                new_channel_count += len(batch)
+                tot = time.time() - start
+                logging.debug(
+                    'Retrieved {} channels in {:.2f}s -- {:.2f}c/s'.format(
+                        new_channel_count, tot, new_channel_count / tot))
         return new_channel_count
 
     def run(self):
@@ -227,8 +412,15 @@ class YouTubeScraper(Scraper):
         with open(key_file_path) as f:
             keys = yaml.load(f)
         with open(config_path) as f:
-            config = yaml.load(f)['youtube']
+            config = yaml.load(f)
+            budget = youtube_budget(config)
+            self.retry = retry_policy(config)
+            config = config['youtube']
         self.update_interval = config['update_interval']
+        # The interval is lengthened to stay within the quota budget.
+        self.min_interval = self.update_interval
+        # Quota units spent by recent cycles.
+        self.cycle_costs = collections.deque(maxlen=24)
 
         user, pwd = None, None
         if 'mongodb' in keys:
@@ -239,25 +431,48 @@ class YouTubeScraper(Scraper):
                                config['db']['db_name'],
                                user, pwd, False)
         self.db.check_indexes()
+        if 'spool' in config:
+            self.spool = DocSpool(config['spool'], self.db)
 
         self.apiclient = YouTubeAPIClient(config['api']['base_url'],
                                           keys['youtubeclientid'],
-                                          keys['youtubesecret'])
+                                          keys['youtubesecret'],
+                                          budget, 'streams',
+                                          config.get('discovery_interval', 0),
+                                          retry=self.retry)
 
     def run(self):
         """
         Retrieves and stores YouTube livestream information.
 
         Retrieves the top 100 livestreams from YouTube Gaming and stores
-        information about them in the MongoDB database.
+        information about them in the MongoDB database.  New livestreams are
+        only searched for every youtube.discovery_interval seconds.
 
         :return: None
         """
-        res = self.apiclient.most_viewed_gaming_streams(100)
+        quota = self.apiclient.quota_used
+        try:
+            res = self.apiclient.live_gaming_streams(100)
+        finally:
+            self.apiclient.settle()
         doc = YTLivestreams(res, int(time.time()))
-        mongores = self.db.store(doc)
+        if self.spool:
+            mongores = self.spool.append([doc])
+        else:
+            mongores = self.db.store(doc)
         logging.debug(mongores)
         logging.debug(doc)
+        cost = self.apiclient.quota_used - quota
+        logging.debug('YouTube quota used: {} units this cycle, {} total'.format(
+            cost, self.apiclient.quota_used))
+        self.cycle_costs.append(cost)
+        if self.apiclient.budget:
+            # Searches only run in some cycles, so pace by the average cost.
+            avgcost = sum(self.cycle_costs) / len(self.cycle_costs)
+            self.update_interval = self.apiclient.budget.interval(
+                'streams', avgcost, self.min_interval)
+            logging.debug(f'Next scrape in {self.update_interval:.0f}s')
 
 
 class YouTubeChannelScraper(Scraper):
@@ -270,6 +485,8 @@ class YouTubeChannelScraper(Scraper):
             config = yaml.safe_load(f)
             esg = set([game['name'] for game in config['esportsgames']])
             postgres = config['postgres']
+            budget = youtube_budget(config)
+            self.retry = retry_policy(config)
             config = config['youtube_channel_scraper']
             self.update_interval = config['update_interval']
             mongo = config['mongodb']
@@ -284,62 +501,86 @@ class YouTubeChannelScraper(Scraper):
 
         self.apiclient = YouTubeAPIClient(config['api']['host'],
                                          keys['youtubeclientid'],
-                                         keys['youtubesecret'])
+                                         keys['youtubesecret'],
+                                         budget, 'channels',
+                                         retry=self.retry)
         self.mongo = MongoManager(mongo['host'], mongo['port'],
                                   mongo['db_name'], user, pwd, mongo['ssl'])
         self.mongo.check_indexes()
 
         self.pg = PostgresManager.from_config(postgres, esg)
 
-    def store_channel_info(self, doc):
+    def store_channel_info(self, docs):
         """
-        Stores information from doc in Postgres.
+        Stores information from docs in Postgres.
 
-        :param doc: YouTubeChannelDoc, the document to store.
+        :param docs: list(YouTubeChannelDoc), the documents to store.
         :return:
         """
-        row = YouTubeChannel(**doc.todoc())
+        if not docs:
+            return
+        rows = [YouTubeChannel(**doc.todoc()) for doc in docs]
         update_fields = ['affiliation', 'description',
                          'keywords', 'published_at', 'thumbnail_url',
                          'default_language', 'country']
-        self.pg.update_rows(row, update_fields)
+        self.pg.update_rows(rows, update_fields)
         self.pg.commit()
 
     def get_missing_channels(self, channel_ids):
         """
         Checks the channel_ids against the Mongo database and retrieves any
-        missing channels using the Twitch API.
+        missing channels using the YouTube API.
+
+        Missing channels are requested in batches of up to 50 ids, which cost
+        the same quota as a single id.  Channels absent from a response no
+        longer exist and are stored as banned.
 
         :param channel_ids: list(channel_ids), list of channel_ids.
         :return: int, the number of channels that were new.
         """
         new_channel_count = 0
         start = time.time()
+        batch_size = self.apiclient.maxres
         # Shuffle so multiple instances don't duplicate API calls.
         random.shuffle(channel_ids)
-        for channel_id in channel_ids:
-            doc = self.mongo.get_youtube_channel(channel_id)
-            if not doc:
-                new_channel_count += 1
-                if new_channel_count % 30 == 0:
-                    tot = time.time() - start
-                    logging.debug(
-                        'Retrieved {} channels in {:.2f}s -- {:.2f}c/s'.format(
-                            new_channel_count, tot, new_channel_count / tot
-                        ))
-                doc = self.apiclient.channelinfo(channel_id)
-                if not doc:
-                    doc = YouTubeChannelDoc(channel_id, display_name='',
-                                      description='BANNED', published_at=None,
-                                      thumbnail_url=None)
+        for found, missing in self.mongo.get_youtube_channels(channel_ids):
+            self.store_channel_info(list(found.values()))
+            for i in range(0, len(missing), batch_size):
+                batch = missing[i:i + batch_size]
+                channels = self.apiclient.channelinfo(batch)
+                docs = []
+                for channel_id in batch:
+                    if channel_id in channels:
+                        docs.append(channels[channel_id])
+                        continue
                     logging.debug(f'Channel {channel_id} no longer exists')
-                else:
-                    doc = doc[channel_id]
-                self.mongo.store(doc)
-            self.store_channel_info(doc)
-
+                    docs.append(YouTubeChannelDoc(
+                        channel_id, display_name='', description='BANNED',
+                        published_at=None, thumbnail_url=None))
+                self.mongo.store_many(docs)
+                self.store_channel_info(docs)
+                new_channel_count += len(batch)
+                tot = time.time() - start
+                logging.debug(
+                    'Retrieved {} channels in {:.2f}s -- {:.2f}c/s'.format(
+                        new_channel_count, tot, new_channel_count / tot))
         return new_channel_count
 
     def run(self):
-        channel_ids = self.pg.null_youtube_channels(10000)
-        self.get_missing_channels(channel_ids)
\ No newline at end of file
+        quota = self.apiclient.quota_used
+        limit = 10000
+        if self.apiclient.budget:
+            # Each unit looks up one batch of channels.
+            units = self.apiclient.budget.allowance('channels',
+                                                    self.update_interval)
+            limit = min(limit, units * self.apiclient.maxres)
+            if not limit:
+                logging.debug('YouTube channel quota exhausted')
+                return
+        channel_ids = self.pg.null_youtube_channels(limit)
+        try:
+            self.get_missing_channels(channel_ids)
+        finally:
+            self.apiclient.settle()
+        logging.debug('YouTube quota used: {} units this cycle, {} total'.format(
+            self.apiclient.quota_used - quota, self.apiclient.quota_used))
\ No newline at end of file
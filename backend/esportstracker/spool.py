@@ -0,0 +1,233 @@
+import os
+import json
+import time
+import logging
+import threading
+import pymongo.errors
+from bson.objectid import ObjectId
+
+from .models.mongomodels import TwitchStreamsAPIResponse
+
+
+class DocSpool:
+    """
+    Durable local queue of documents waiting to be stored in MongoDB.
+
+    Scrapers append documents to an append-only file instead of writing to
+    MongoDB directly, so API requests never wait on the database and nothing
+    is lost while it is unavailable.  A background thread periodically
+    rotates the file into a numbered segment and drains the segments into
+    MongoDB with bulk inserts.  Each document is given an _id when it is
+    spooled and bucket appends skip snapshots that are already in their
+    bucket, so a segment that is flushed twice does not create duplicates.
+
+    A segment that cannot be stored is moved to the dead letter directory
+    so it does not hold up the segments after it, immediately if its
+    documents cannot be decoded and after max_attempts flushes otherwise.
+    Dead segments can be flushed again by moving them back.
+    """
+    CURRENT = 'current.spool'
+    SEGMENT_SUFFIX = '.segment'
+    DEAD_LETTER = 'dead'
+
+    def __init__(self, directory, mongo, flush_interval=30, max_attempts=5):
+        """
+        DocSpool constructor.
+
+        :param directory: str, directory containing the spool files.
+        :param mongo: dbinterface.MongoManager, the database to flush to.
+        :param flush_interval: int, seconds between flushes.
+        :param max_attempts: int, flushes of a segment that may fail before
+            it is moved to the dead letter directory.
+        """
+        self.directory = directory
+        self.mongo = mongo
+        self.flush_interval = flush_interval
+        self.max_attempts = max_attempts
+        # Failed flushes of each segment path.
+        self.failures = {}
+        self.lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        os.makedirs(directory, exist_ok=True)
+        self._file = self._open()
+
+    def _open(self):
+        path = os.path.join(self.directory, self.CURRENT)
+        f = open(path, 'a+', encoding='utf8')
+        # Terminate a line that was partially written before a crash.
+        if f.tell() > 0:
+            f.seek(f.tell() - 1)
+            if f.read(1) != '\n':
+                f.write('\n')
+        return f
+
+    def append(self, docs, collname=None):
+        """
+        Durably appends MongoDocs to the spool.
+
+        :param docs: iterable(mongomodels.MongoDoc), the documents to spool.
+        :param collname: str, overrides the COLLECTION of the docs.
+        :return: int, the number of documents spooled.
+        """
+        lines = []
+        for doc in docs:
+            record = doc.todoc()
+            record['_id'] = str(ObjectId())
+            entry = {'c': collname or doc.COLLECTION, 'd': record}
+            lines.append(json.dumps(entry, separators=(',', ':')) + '\n')
+        if not lines:
+            return 0
+        with self.lock:
+            self._file.write(''.join(lines))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        return len(lines)
+
+    def _rotate(self):
+        """
+        Moves the current spool file into a new segment.
+
+        :return: None
+        """
+        with self.lock:
+            if self._file.tell() == 0:
+                return
+            self._file.close()
+            segment = '{:017.6f}{}'.format(time.time(), self.SEGMENT_SUFFIX)
+            os.replace(os.path.join(self.directory, self.CURRENT),
+                       os.path.join(self.directory, segment))
+            self._file = self._open()
+
+    def segments(self):
+        """
+        Returns the paths of segments waiting to be flushed, oldest first.
+
+        :return: list(str)
+        """
+        names = [f for f in os.listdir(self.directory)
+                 if f.endswith(self.SEGMENT_SUFFIX)]
+        return [os.path.join(self.directory, f) for f in sorted(names)]
+
+    @staticmethod
+    def read_segment(path):
+        """
+        Reads a segment and groups its documents by collection.
+
+        :param path: str, path of the segment.
+        :return: dict, keys are collection names and values are lists of docs.
+        """
+        groups = {}
+        with open(path, encoding='utf8') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    logging.warning(f'Skipping corrupt spool entry in {path}')
+                    continue
+                doc = entry['d']
+                doc['_id'] = ObjectId(doc['_id'])
+                groups.setdefault(entry['c'], []).append(doc)
+        return groups
+
+    def _flush_segment(self, path):
+        """
+        Stores the documents of one segment and removes it.
+
+        :param path: str, path of the segment.
+        :return: int, the number of documents flushed.
+        """
+        groups = self.read_segment(path)
+        # Decode every bucket response before storing anything.
+        resps = {collname: [TwitchStreamsAPIResponse.fromdoc(d) for d in docs]
+                 for collname, docs in groups.items()
+                 if collname in self.mongo.bucket_collections}
+        count = 0
+        for collname, docs in groups.items():
+            if collname in resps:
+                self.mongo.append_buckets(resps[collname])
+            else:
+                self.mongo.insert_docs(collname, docs)
+            count += len(docs)
+        os.remove(path)
+        self.failures.pop(path, None)
+        return count
+
+    def _dead_letter(self, path):
+        """
+        Moves a segment to the dead letter directory.
+
+        :param path: str, path of the segment.
+        :return: None
+        """
+        directory = os.path.join(self.directory, self.DEAD_LETTER)
+        os.makedirs(directory, exist_ok=True)
+        os.replace(path, os.path.join(directory, os.path.basename(path)))
+        self.failures.pop(path, None)
+        logging.error(f'Moved spool segment {path} to {directory}')
+
+    def flush(self):
+        """
+        Stores every spooled document in MongoDB.
+
+        Segments are only removed once all of their documents are stored.  A
+        segment that fails is left for the next flush, or moved to the dead
+        letter directory, and the following segments are still flushed.
+        Flushing stops if the database cannot be reached.
+
+        :return: int, the number of documents flushed.
+        """
+        self._rotate()
+        count = 0
+        for path in self.segments():
+            try:
+                count += self._flush_segment(path)
+            except pymongo.errors.ConnectionFailure:
+                raise
+            except (KeyError, ValueError, TypeError) as e:
+                logging.error(f'Cannot decode spool segment {path}: {e!r}')
+                self._dead_letter(path)
+            except pymongo.errors.PyMongoError as e:
+                failures = self.failures.get(path, 0) + 1
+                logging.warning(f'Flushing spool segment {path} failed '
+                                f'{failures} times: {e}')
+                if failures >= self.max_attempts:
+                    self._dead_letter(path)
+                else:
+                    self.failures[path] = failures
+        return count
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                count = self.flush()
+                if count:
+                    logging.debug(f'Flushed {count} spooled documents')
+            except pymongo.errors.PyMongoError as e:
+                logging.warning(f'Spool flush failed: {e}')
+            except Exception:
+                logging.exception('Spool flush failed')
+
+    def start(self):
+        """
+        Starts the background flusher if it is not already running.
+
+        :return: None
+        """
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name='DocSpoolFlusher')
+        self._thread.start()
+
+    def stop(self):
+        """
+        Stops the background flusher.
+
+        :return: None
+        """
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+            self._thread = None
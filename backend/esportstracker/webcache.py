@@ -0,0 +1,115 @@
+import os
+import json
+import logging
+import tempfile
+
+DAY = 60 * 60 * 24
+
+
+def write_atomic(path, payload):
+    """
+    Writes payload to path as JSON without exposing partial files.
+
+    The payload is written to a temporary file in the same directory and then
+    renamed over path, so readers (the webserver or a CDN) only ever see the
+    previous or the new version of the file.
+
+    :param path: str, destination file path.
+    :param payload: object, JSON serializable payload.
+    :return: None
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmppath = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(payload, f, separators=(',', ':'))
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmppath, 0o644)
+        os.replace(tmppath, path)
+    except BaseException:
+        os.remove(tmppath)
+        raise
+
+
+class WebSnapshotPublisher:
+    """
+    Renders the JSON payloads of the webserver's hot API routes.
+
+    The payloads match the responses of the corresponding routes in
+    web/routes/api.js so that the files can be served directly instead of
+    having Node.js rerun the queries.  Files are laid out as
+    {directory}/{route}/{days}.json and {directory}/{route}/{game_id}/{days}.json.
+    """
+    def __init__(self, directory, days=(3, 7, 30, 90), numgames=10):
+        """
+        WebSnapshotPublisher constructor.
+
+        :param directory: str, root directory of the snapshot files.
+        :param days: iterable(int), the time periods to render.
+        :param numgames: int, the number of games in the top games payload,
+            including 'Other'.
+        """
+        self.directory = directory
+        self.days = list(days)
+        self.numgames = numgames
+
+    @staticmethod
+    def top_games_payload(games, numgames):
+        """
+        Lumps every game beyond the first numgames - 1 into 'Other'.
+
+        :param games: list(tuple), (name, viewers) in descending order.
+        :param numgames: int, number of entries in the result.
+        :return: list(list)
+        """
+        top = min(numgames - 1, len(games))
+        data = [[name, viewers] for name, viewers in games[:top]]
+        data.append(['Other', sum(viewers for _, viewers in games[top:])])
+        return data
+
+    @staticmethod
+    def marketshare_payload(twitch, youtube):
+        return [['Twitch', twitch], ['Youtube', youtube]]
+
+    @staticmethod
+    def game_hourly_payload(name, hourly):
+        return {'name': name, 'data': [[epoch, vc] for epoch, vc in hourly]}
+
+    def path(self, route, days, game_id=None):
+        if game_id is None:
+            return os.path.join(self.directory, route, f'{days}.json')
+        return os.path.join(self.directory, route, str(game_id), f'{days}.json')
+
+    def publish(self, man, esportsgames, now):
+        """
+        Renders and writes every snapshot.
+
+        :param man: PostgresManager, source of the aggregated data.
+        :param esportsgames: list(dict), games in the format
+            {id: int, name: str}.
+        :param now: int, unix epoch that the time periods end at.
+        :return: int, the number of files written.
+        """
+        count = 0
+        for days in self.days:
+            start = now - days * DAY
+            games = man.twitch_top_games_vh(start, now, 1000)
+            payload = self.top_games_payload(games, self.numgames)
+            write_atomic(self.path('twitchtopgames', days), payload)
+
+            twitch = man.total_viewer_hours('twitch_game_vc', start, now)
+            youtube = man.total_viewer_hours('youtube_stream', start, now)
+            payload = self.marketshare_payload(twitch, youtube)
+            write_atomic(self.path('marketshare', days), payload)
+            count += 2
+
+            for game in esportsgames:
+                hourly = man.twitch_game_hourly(game['id'], start, now)
+                payload = self.game_hourly_payload(game['name'], hourly)
+                path = self.path('twitchgameviewership', days, game['id'])
+                write_atomic(path, payload)
+                count += 1
+        logging.debug(f'Published {count} web snapshots to {self.directory}')
+        return count
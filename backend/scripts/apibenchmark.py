@@ -0,0 +1,145 @@
+import os
+import sys
+import time
+import yaml
+from urllib.parse import urlsplit
+
+DIR_PATH = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, DIR_PATH[0:len(DIR_PATH)-len('scripts/')])
+
+from esportstracker.apiclients import TwitchAPIClient, AsyncTwitchAPIClient
+from esportstracker.apiclients import YouTubeAPIClient
+from esportstracker.replay import Recorder, StandInServer
+from esportstracker.retry import RetryPolicy
+
+"""
+Records one scraping cycle of API responses and replays them to benchmark
+the API clients offline.
+
+Usage:
+    python apibenchmark.py record config.yml keys.yml fixture_dir
+    python apibenchmark.py replay config.yml fixture_dir [latency_ms]
+        [error_rate]
+
+Recording makes the requests of one Twitch and one YouTube scraping cycle
+with the real APIs.  Replaying serves the recordings from a local stand-in
+server with the Twitch rate limit and times the cycle with the sequential,
+concurrent and batched clients.
+"""
+
+
+def twitch_cycle(client, config, concurrency=None, batch=False):
+    """
+    Makes the Twitch requests of one TwitchScraper cycle.
+
+    :param client: TwitchAPIClient or AsyncTwitchAPIClient
+    :param config: dict, the whole config file.
+    :param concurrency: int, set if client is an AsyncTwitchAPIClient.
+    :param batch: bool, whether to request up to 10 games at once.
+    :return: int, the number of responses.
+    """
+    api = config['twitch']['api']
+    gameids = [game['id'] for game in config['esportsgames']]
+    pages = {game['id']: game.get('pages', api.get('pages', 1))
+             for game in config['esportsgames']}
+    minviewers = api.get('minviewers', 10)
+    timestamp = int(time.time())
+    if concurrency:
+        res = client.topstreams_many(gameids, timestamp, pages, minviewers,
+                                     batch)
+    elif batch:
+        client.gettopgames(timestamp=timestamp)
+        res = client.topstreams_batched(gameids, timestamp, pages, minviewers)
+    else:
+        client.gettopgames(timestamp=timestamp)
+        res = {gameid: client.topstreams(gameid, timestamp, pages[gameid],
+                                         minviewers)
+               for gameid in gameids}
+    return len([r for r in res.values() if r])
+
+
+def youtube_cycle(client):
+    """
+    Makes the YouTube requests of one YouTubeScraper cycle.
+
+    :param client: YouTubeAPIClient
+    :return: int, the number of livestreams.
+    """
+    return len(client.live_gaming_streams(100))
+
+
+def record(config, keys, directory):
+    recorder = Recorder(directory)
+    twitch = TwitchAPIClient(config['twitch']['api']['host'],
+                             keys['twitchclientid'], keys['twitchsecret'])
+    youtube = YouTubeAPIClient(config['youtube']['api']['base_url'],
+                               keys['youtubeclientid'], keys['youtubesecret'])
+    recorder.attach(twitch)
+    recorder.attach(youtube)
+    twitch_cycle(twitch, config)
+    twitch_cycle(twitch, config, batch=True)
+    youtube_cycle(youtube)
+    youtube_cycle(youtube)
+    print(f'Recorded {recorder.count} responses to {directory}')
+
+
+def bench(name, server, fun):
+    before = server.stats['requests']
+    start = time.time()
+    results = fun()
+    elapsed = time.time() - start
+    requests = server.stats['requests'] - before
+    print(f'{name}: {elapsed:.2f}s, {requests} requests, {results} results')
+
+
+def replay(config, directory, latency, error_rate):
+    window = config['twitch_ratelimit']['window']
+    capacity = config['twitch_ratelimit']['capacity']
+    server = StandInServer(directory, latency, latency / 2, error_rate,
+                           ratelimit=(capacity, window), seed=0)
+    host = server.start()
+    twitchhost = host + '/'
+    youtubehost = host + urlsplit(config['youtube']['api']['base_url']).path
+    retry = RetryPolicy(base_delay=0.1)
+    try:
+        client = TwitchAPIClient(twitchhost, 'id', 'secret', retry=retry)
+        bench('Twitch sequential', server,
+              lambda: twitch_cycle(client, config))
+        bench('Twitch batched', server,
+              lambda: twitch_cycle(client, config, batch=True))
+        for concurrency in (1, 5, 10):
+            client = AsyncTwitchAPIClient(twitchhost, 'id', 'secret',
+                                          concurrency, retry=retry)
+            bench(f'Twitch concurrency {concurrency}', server,
+                  lambda: twitch_cycle(client, config, concurrency))
+            bench(f'Twitch concurrency {concurrency} batched', server,
+                  lambda: twitch_cycle(client, config, concurrency, True))
+        client = YouTubeAPIClient(youtubehost, 'id', 'secret',
+                                  discovery_interval=3600, retry=retry)
+        bench('YouTube discovery', server, lambda: youtube_cycle(client))
+        bench('YouTube refresh', server, lambda: youtube_cycle(client))
+        print(f'Server: {server.stats}, retries: {retry.stats()}')
+    finally:
+        server.stop()
+
+
+def main():
+    if len(sys.argv) < 4 or sys.argv[1] not in ('record', 'replay'):
+        print('Usage: python apibenchmark.py record config.yml keys.yml dir\n'
+              '       python apibenchmark.py replay config.yml dir '
+              '[latency_ms] [error_rate]')
+        sys.exit(1)
+    with open(sys.argv[2]) as f:
+        config = yaml.safe_load(f)
+    if sys.argv[1] == 'record':
+        with open(sys.argv[3]) as f:
+            keys = yaml.safe_load(f)
+        record(config, keys, sys.argv[4])
+    else:
+        latency = float(sys.argv[4]) / 1000 if len(sys.argv) > 4 else 0.05
+        error_rate = float(sys.argv[5]) if len(sys.argv) > 5 else 0
+        replay(config, sys.argv[3], latency, error_rate)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+import os
+import sys
+import time
+import tracemalloc
+import bson
+
+DIR_PATH = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, DIR_PATH[0:len(DIR_PATH)-len('scripts/')])
+
+from esportstracker.models.mongomodels import TwitchStreamsAPIResponse
+from esportstracker.models.mongomodels import StringTable
+
+"""
+Measures the memory used by an hour of twitch_streams documents with and
+without interning their strings.
+
+Usage: python internbenchmark.py [num_streams]
+
+Documents are round tripped through BSON so that, like documents read from
+MongoDB, every string in every document is a separate object.
+"""
+
+SCRAPES_PER_HOUR = 30
+LANGUAGES = ['en', 'ko', 'ru', 'de', 'es', 'fr', 'pt', 'zh', 'ja', 'pl']
+
+
+def synthetic_docs(num_streams):
+    """
+    Returns encoded twitch_streams documents for one game over one hour.
+
+    :param num_streams: int, streams live in each scrape.
+    :return: list(bytes)
+    """
+    docs = []
+    for i in range(SCRAPES_PER_HOUR):
+        streams = {}
+        for cid in range(num_streams):
+            streams[str(cid)] = {
+                'viewers': 10000 // (cid + 1) + i,
+                'game_id': 21779,
+                'language': LANGUAGES[cid % len(LANGUAGES)],
+                'stream_type': 'live',
+                'title': f'Ranked grind with viewers | !discord !socials {cid}',
+                'stream_id': 26007351216 + cid,
+                'broadcaster_id': cid
+            }
+        doc = {'timestamp': 1521000000 + i * 120, 'game_id': 21779,
+               'streams': streams}
+        docs.append(bson.encode(doc))
+    return docs
+
+
+def measure(encoded, strings):
+    """
+    Decodes the documents and returns the memory held by the responses.
+
+    :param encoded: list(bytes), BSON documents.
+    :param strings: StringTable or None.
+    :return: tuple, (current bytes, peak bytes, seconds)
+    """
+    tracemalloc.start()
+    start = time.time()
+    resps = []
+    for raw in encoded:
+        resps.append(TwitchStreamsAPIResponse.fromdoc(bson.decode(raw),
+                                                      strings))
+    elapsed = time.time() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del resps
+    return current, peak, elapsed
+
+
+def main():
+    num_streams = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    encoded = synthetic_docs(num_streams)
+    print(f'{SCRAPES_PER_HOUR} documents with {num_streams} streams each')
+    for name, strings in [('No interning', None),
+                          ('StringTable', StringTable())]:
+        current, peak, elapsed = measure(encoded, strings)
+        print(f'{name}: retained {current / 2**20:.1f} MiB, '
+              f'peak {peak / 2**20:.1f} MiB, {elapsed:.2f}s')
+
+
+if __name__ == '__main__':
+    main()
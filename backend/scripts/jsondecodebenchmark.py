@@ -0,0 +1,71 @@
+import os
+import sys
+import json
+import time
+
+DIR_PATH = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, DIR_PATH[0:len(DIR_PATH)-len('scripts/')])
+
+from esportstracker import jsondecoder
+
+"""
+Compares the API response decoders.
+
+Usage: python jsondecodebenchmark.py [payload.json ...]
+
+Each argument is a recorded API response body.  A synthetic Helix /streams
+page is used if no payloads are given.
+"""
+
+
+def synthetic_payload():
+    streams = []
+    for i in range(100):
+        streams.append({
+            'id': str(26007351216 + i),
+            'user_id': str(23161357 + i),
+            'game_id': '21779',
+            'community_ids': [],
+            'type': 'live',
+            'title': 'LCS Summer Split Week {} Day 2 ステージ 🎮'.format(i),
+            'viewer_count': 100000 // (i + 1),
+            'started_at': '2018-03-12T16:22:15Z',
+            'language': 'en',
+            'thumbnail_url': 'https://static-cdn.jtvnw.net/previews-ttv/'
+                             'live_user_lcs-{width}x{height}.jpg'
+        })
+    payload = {'data': streams, 'pagination': {'cursor': 'eyJiIjpudWxsfQ'}}
+    return json.dumps(payload).encode('utf8')
+
+
+def bench(name, decoder, payloads, iterations):
+    start = time.time()
+    for i in range(iterations):
+        for payload in payloads:
+            decoder(payload)
+    total = time.time() - start
+    num_decoded = iterations * len(payloads)
+    print(f'{name}: {num_decoded / total:.0f} payloads/s')
+
+
+def main():
+    payloads = []
+    for path in sys.argv[1:]:
+        with open(path, 'rb') as f:
+            payloads.append(f.read())
+    if not payloads:
+        payloads.append(synthetic_payload())
+    iterations = 2000
+
+    # The decoding used before the pluggable decoder existed.
+    bench('json.loads(response.text)',
+          lambda b: json.loads(b.decode('utf8')), payloads, iterations)
+    bench('stdlib decoder', jsondecoder.stdlib_loads, payloads, iterations)
+    if jsondecoder.orjson:
+        bench('orjson decoder', jsondecoder.orjson.loads, payloads, iterations)
+    else:
+        print('orjson is not installed.')
+
+
+if __name__ == '__main__':
+    main()
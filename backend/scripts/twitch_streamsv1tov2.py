@@ -103,13 +103,16 @@ def v1tov2(keypath):
     count = 0
     while numv1(coll) > 0:
         v1docs = retrieve_v1(coll, 10000)
+        requests = []
         for v1doc in v1docs:
             count += 1
             if count % 1000 == 0:
                 print("Progress: ", count)
             v2doc = onev1tov2(v1doc, apiclient)
             filter = {'_id': ObjectId(v1doc['_id'])}
-            res = coll.replace_one(filter, v2doc)
+            requests.append(pymongo.ReplaceOne(filter, v2doc))
+        if requests:
+            coll.bulk_write(requests, ordered=False)
 
     end = time.time()
     print("Total Time: ", end-start)
@@ -0,0 +1,113 @@
+import os
+import sys
+import pymongo
+import time
+import yaml
+
+DIR_PATH = os.path.dirname(os.path.realpath(__file__))
+sys.path.insert(0, DIR_PATH[0:len(DIR_PATH)-len('scripts/')])
+
+from esportstracker.models.mongomodels import TwitchStreamsAPIResponse
+from esportstracker.models.mongomodels import TwitchStreamsHourBucket
+
+# Copies V2 twitch_streams entries into the twitch_streams_hourly collection.
+# The V2 collection is left untouched so the aggregator can be switched over
+# by setting twitch.db.bucketed in the config file once the copy completes.
+# Entries already in their bucket are skipped, so an interrupted copy can be
+# resumed by running the script again.
+#
+# V2 entries are organized as follows:
+#
+#  {'timestamp': epoch int,
+#   'game_id': int
+#   'streams': streams}
+#
+#    streams[stream['user_id'] = {
+#               'viewers':          stream['viewer_count'],
+#               'game_id':          gameid,
+#               'language':         stream['language'],
+#               'stream_type':      stream['type'],
+#               'title':            stream['title'],
+#               'stream_id':        stream['id'],
+#               'broadcaster_id':   stream['user_id'],
+#           }, ...
+#
+# Hourly entries contain every V2 entry for one game and hour:
+#
+#  {'game_id': int,
+#   'hour': epoch int of the first second in the hour,
+#   'timestamp': epoch int of the first V2 entry in the hour,
+#   'timestamps': [epoch int, ...],
+#   'streams': {
+#       str(user_id): {
+#           'timestamps': [epoch int, ...],
+#           'viewers': [int, ...],
+#           'game_id', 'language', 'stream_type', 'title', 'stream_id',
+#           'broadcaster_id'
+#       }, ...
+#   }}
+#
+
+BATCH_SIZE = 1000
+
+
+def v2tohourly(keypath):
+    """ Copies V2 entries into hourly buckets. """
+    print("Starting...")
+    start = time.time()
+    with open(keypath, 'r') as f:
+        m = yaml.safe_load(f)['mongodb']['write']
+        user = m['user']
+        pwd = m['pwd']
+    client = pymongo.MongoClient()
+    conn = client.esports_stats
+    conn.authenticate(user, pwd, source='admin')
+    coll = conn.twitch_streams
+    buckets = conn[TwitchStreamsHourBucket.COLLECTION]
+    buckets.create_index([('game_id', pymongo.ASCENDING),
+                          ('hour', pymongo.ASCENDING)], unique=True)
+    buckets.create_index('timestamp')
+
+    count = 0
+    skipped = 0
+    requests = []
+    # Timestamps already in the buckets of the current hour.
+    copied = {}
+    copied_hour = None
+    cursor = coll.find({'game_id': {'$exists': True}})
+    for doc in cursor.sort('timestamp', pymongo.ASCENDING):
+        count += 1
+        if count % 10000 == 0:
+            print("Progress: ", count)
+        resp = TwitchStreamsAPIResponse.fromdoc(doc)
+        hour = TwitchStreamsHourBucket.hourof(resp.timestamp)
+        key = (resp.game_id, hour)
+        if hour != copied_hour:
+            copied, copied_hour = {}, hour
+        if key not in copied:
+            bucket = buckets.find_one({'game_id': resp.game_id, 'hour': hour},
+                                      {'timestamps': True})
+            copied[key] = set(bucket['timestamps'] if bucket else [])
+        if resp.timestamp in copied[key]:
+            skipped += 1
+            continue
+        copied[key].add(resp.timestamp)
+        filter, update = TwitchStreamsHourBucket.pushupdate(resp)
+        requests.append(pymongo.UpdateOne(filter, update, upsert=True))
+        # Appends must stay in timestamp order within a bucket.
+        if len(requests) == BATCH_SIZE:
+            buckets.bulk_write(requests, ordered=True)
+            requests = []
+    if requests:
+        buckets.bulk_write(requests, ordered=True)
+
+    end = time.time()
+    print("Total Time: ", end-start)
+    print("Total V2 entries copied: ", count - skipped)
+    print("Entries already copied: ", skipped)
+    print("Num hourly Documents: {}".format(buckets.count_documents({})))
+
+
+if __name__ == '__main__':
+    keypath = DIR_PATH[0:len(DIR_PATH)-len('scripts/')] + '/keys.yml'
+    v2tohourly(keypath)
@@ -48,12 +48,11 @@ def classifydb():
                   '{:.1f} entries/s'.format(count/(time.time()-start)))
         yts = pgm.get_yts(epoch, limit)
         for stream in yts:
-            old_game_id = stream.game_id
-            yti.classify_game(stream)
-            if old_game_id != stream.game_id:
+            classifiedstream = yti.classify_game(stream)
+            if classifiedstream.game_id != stream.game_id:
                 updated += 1
-                pgm.update_rows(stream, 'game_id')
-            classified += 1 if stream.game_id else 0
+                pgm.update_rows(classifiedstream, 'game_id')
+            classified += 1 if classifiedstream.game_id else 0
         epoch += 3600
         count += len(yts)
 
@@ -22,7 +22,9 @@ setup(
         'setuptools',
         'langid',
         'setproctitle',
-        'pytz'
+        'pytz',
+        'numpy',
+        'aiohttp'
     ],
     author='Rowan Meara',
     author_email='rowanmeara@gmail.com',
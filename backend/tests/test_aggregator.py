@@ -3,6 +3,7 @@ import os
 
 from esportstracker.aggregator import Aggregator, RowFactory
 from esportstracker.models.mongomodels import TwitchGamesAPIResponse
+from esportstracker.models.mongomodels import YTLivestream, YTLivestreams
 
 config_path = 'res/test_scraper_config.yml'
 key_path = 'res/test_keys.yml'
@@ -68,3 +69,16 @@ def test_average_viewers():
     assert games[1] == 100
     assert games[2] == 0
     assert games[3] == 150
+
+
+def test_rows_are_tuples():
+    streams = [YTLivestream('Fortnite squads', 'chan', 'UCchan', 'vid', 10,
+                            'en', ['battle royale'])]
+    rows = RowFactory.youtube_streams([YTLivestreams(streams, 0).todoc()],
+                                      0, 3600)
+    channel, stream = rows
+    assert channel == ('UCchan', 'chan', None, None, None, None, None, None,
+                       None)
+    assert stream == ('vid', 0, 'UCchan', 33214, 10, 'Fortnite squads', 'en',
+                      "['battle royale']")
+    assert stream.to_row() is stream
@@ -0,0 +1,224 @@
+import asyncio
+import threading
+from aiohttp import web
+
+from esportstracker.apiclients import AsyncTwitchAPIClient, TwitchAPIClient
+from esportstracker.apiclients import YouTubeAPIClient, group_games
+from esportstracker.ratelimit import QuotaBudget
+
+
+def serve(app):
+    """ Runs app on a background thread and returns its host url. """
+    loop = asyncio.new_event_loop()
+    runner = web.AppRunner(app)
+    loop.run_until_complete(runner.setup())
+    site = web.TCPSite(runner, '127.0.0.1', 0)
+    loop.run_until_complete(site.start())
+    port = runner.addresses[0][1]
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    return f'http://127.0.0.1:{port}'
+
+
+def test_async_topstreams_many():
+    inflight = {'now': 0, 'max': 0}
+
+    async def streams(request):
+        inflight['now'] += 1
+        inflight['max'] = max(inflight['max'], inflight['now'])
+        await asyncio.sleep(0.05)
+        inflight['now'] -= 1
+        gameid = request.query['game_id']
+        if gameid == '3':
+            return web.json_response({'data': [], 'pagination': {}})
+        data = [{'id': '1', 'user_id': gameid, 'game_id': gameid,
+                 'type': 'live', 'title': 'title', 'viewer_count': 100,
+                 'language': 'en'}]
+        return web.json_response({'data': data, 'pagination': {}},
+                                 headers={'Ratelimit-Remaining': '29',
+                                          'Ratelimit-Reset': '0'})
+
+    app = web.Application()
+    app.router.add_get('/helix/streams/', streams)
+    client = AsyncTwitchAPIClient(serve(app), 'clientid', 'secret',
+                                  max_concurrency=2)
+    resps = client.topstreams_many([1, 2, 3], timestamp=1800)
+    assert inflight['max'] == 2
+    assert resps[3] is None
+    assert [resps[g].timestamp for g in (1, 2)] == [1800, 1800]
+    assert resps[2].viewercounts() == {2: 100}
+
+
+def test_channelinfo_batches():
+    batches = []
+
+    async def users(request):
+        ids = request.query.getall('id')
+        batches.append(len(ids))
+        data = [{'id': i, 'login': f'user{i}', 'display_name': f'User{i}',
+                 'type': '', 'broadcaster_type': '', 'description': '',
+                 'profile_image_url': '', 'offline_image_url': '',
+                 'view_count': 0} for i in ids if i != '7']
+        return web.json_response({'data': data})
+
+    app = web.Application()
+    app.router.add_get('/helix/users/', users)
+    client = TwitchAPIClient(serve(app), 'clientid', 'secret')
+    channels = client.channelinfo(list(range(250)))
+    assert batches == [100, 100, 50]
+    assert len(channels) == 249 and 7 not in channels
+    assert channels[3].display_name == 'User3'
+
+
+def test_youtube_channelinfo_batches(tmpdir):
+    batches = []
+
+    async def channels(request):
+        ids = request.query['id'].split(',')
+        batches.append(len(ids))
+        items = [{'id': i, 'brandingSettings': {'channel': {}},
+                  'snippet': {'title': i, 'description': '',
+                              'publishedAt': '2018-01-01T00:00:00.000Z',
+                              'thumbnails': {'default': {'url': ''}}}}
+                 for i in ids]
+        return web.json_response({'items': items})
+
+    app = web.Application()
+    app.router.add_get('/channels/', channels)
+    budget = QuotaBudget(str(tmpdir.join('youtube.quota')))
+    client = YouTubeAPIClient(serve(app), 'clientid', 'secret', budget,
+                              'channels')
+    res = client.channelinfo([f'UC{i}' for i in range(120)])
+    assert batches == [50, 50, 20]
+    assert len(res) == 120
+    assert client.quota_used == 3
+    # The budget is charged once per cycle.
+    assert budget.used() == 0
+    assert client.settle() == 3
+    assert budget.used('channels') == 3
+
+
+def test_youtube_known_live_streams():
+    calls = []
+
+    async def search(request):
+        calls.append('search')
+        items = [{'id': {'videoId': v},
+                  'snippet': {'title': v, 'channelTitle': v, 'channelId': v}}
+                 for v in ('a', 'b', 'c')]
+        return web.json_response({'items': items})
+
+    async def videos(request):
+        calls.append('videos')
+        ended = len(calls) > 2
+        items = []
+        for i, v in enumerate(request.query['id'].split(',')):
+            lsd = {'concurrentViewers': str(10 * (i + 1))}
+            if v == 'b' and ended:
+                lsd['actualEndTime'] = '2018-01-01T00:00:00.000Z'
+            items.append({'id': v, 'liveStreamingDetails': lsd,
+                          'snippet': {'title': v, 'channelTitle': v,
+                                      'channelId': v}})
+        return web.json_response({'items': items})
+
+    app = web.Application()
+    app.router.add_get('/search', search)
+    app.router.add_get('/videos', videos)
+    client = YouTubeAPIClient(serve(app), 'clientid', 'secret',
+                              discovery_interval=3600)
+    assert len(client.live_gaming_streams(100)) == 3
+    streams = client.live_gaming_streams(100)
+    assert calls == ['search', 'videos', 'videos']
+    assert [s.vidid for s in streams] == ['c', 'a']
+    assert client.known_live == ['c', 'a']
+    assert client.quota_used == 102
+
+
+def test_youtube_etag_cache():
+    seen = []
+
+    async def channels(request):
+        seen.append((request.query.get('fields'),
+                     request.headers.get('If-None-Match')))
+        if request.headers.get('If-None-Match') == '"v1"':
+            return web.Response(status=304)
+        items = [{'id': 'UC1', 'snippet': {
+            'title': 'UC1', 'description': '',
+            'publishedAt': '2018-01-01T00:00:00.000Z',
+            'thumbnails': {'default': {'url': ''}}}}]
+        return web.json_response({'items': items}, headers={'ETag': '"v1"'})
+
+    app = web.Application()
+    app.router.add_get('/channels/', channels)
+    client = YouTubeAPIClient(serve(app), 'clientid', 'secret')
+    first = client.channelinfo('UC1')
+    second = client.channelinfo('UC1')
+    assert seen[0][0].startswith('items(id,snippet(')
+    assert [etag for _, etag in seen] == [None, '"v1"']
+    assert client.not_modified == 1
+    assert second['UC1'].display_name == first['UC1'].display_name == 'UC1'
+
+
+def test_topstreams_pagination():
+    requests = []
+
+    def stream(userid, gameid, viewers):
+        return {'id': str(userid), 'user_id': str(userid), 'game_id': gameid,
+                'type': 'live', 'title': 'title', 'viewer_count': viewers,
+                'language': 'en'}
+
+    async def streams(request):
+        gameid = request.query['game_id']
+        page = int(request.query.get('after', 0))
+        requests.append((gameid, page))
+        # Stream 99 moves from the first page to the second.
+        data = [stream(page * 2 + i, gameid, 100 - page * 40 - i)
+                for i in range(2)] + [stream(99, gameid, 50)]
+        return web.json_response({'data': data,
+                                  'pagination': {'cursor': str(page + 1)}})
+
+    app = web.Application()
+    app.router.add_get('/helix/streams/', streams)
+    host = serve(app)
+    resp = TwitchAPIClient(host, 'clientid', 'secret').topstreams(
+        1, pages=5, minviewers=30)
+    assert [page for _, page in requests] == [0, 1, 2]
+    assert sorted(resp.streams) == [0, 1, 2, 3, 99]
+
+    requests.clear()
+    client = AsyncTwitchAPIClient(host, 'clientid', 'secret')
+    resps = client.topstreams_many([1, 2], pages={1: 2}, minviewers=0)
+    assert sorted(requests) == [('1', 0), ('1', 1), ('2', 0)]
+    assert len(resps[1].streams) == 5 and len(resps[2].streams) == 3
+
+
+def test_group_games():
+    counts = {1: 150, 2: 60, 3: 50, 4: 30, 5: 5}
+    assert group_games([1, 2, 3, 4, 5, 6], counts) == [[1], [2, 4, 5, 6], [3]]
+    assert group_games(list(range(12)), {}) == [list(range(10)), [10, 11]]
+
+
+def test_topstreams_batched():
+    requests = []
+
+    async def streams(request):
+        gameids = request.query.getall('game_id')
+        requests.append(gameids)
+        data = [{'id': g, 'user_id': g, 'game_id': g, 'type': 'live',
+                 'title': 'title', 'viewer_count': 100, 'language': 'en'}
+                for g in gameids if g != '3']
+        return web.json_response({'data': data, 'pagination': {}})
+
+    app = web.Application()
+    app.router.add_get('/helix/streams/', streams)
+    host = serve(app)
+    for client in (TwitchAPIClient(host, 'clientid', 'secret'),
+                   AsyncTwitchAPIClient(host, 'clientid', 'secret')):
+        requests.clear()
+        if isinstance(client, TwitchAPIClient):
+            resps = client.topstreams_batched([1, 2, 3], timestamp=1800)
+        else:
+            resps = client.topstreams_many([1, 2, 3], 1800, batch=True)
+        assert requests == [['1', '2', '3']]
+        assert resps[3] is None
+        assert list(resps[2].streams) == [2] and resps[2].game_id == 2
+        assert client.stream_counts == {1: 1, 2: 1, 3: 0}
@@ -0,0 +1,38 @@
+from esportstracker.archive import SnapshotArchive, DAY
+
+
+def test_archive_roundtrip(tmp_path):
+    archive = SnapshotArchive(str(tmp_path))
+    stream = {
+        'viewers': 10,
+        'game_id': 21779,
+        'language': 'en',
+        'stream_type': 'live',
+        'title': 'title',
+        'stream_id': None,
+        'broadcaster_id': 1
+    }
+    twitch = [
+        {'timestamp': DAY + 60, 'game_id': 21779, 'streams': {'1': stream}},
+        {'timestamp': DAY + 7200, 'game_id': 21779, 'streams': {}}
+    ]
+    youtube = [{'timestamp': DAY + 60, 'streams': [{
+        'title': 'a', 'channame': 'b', 'chanid': 'c', 'vidid': 'd',
+        'viewers': 5, 'language': 'unknown', 'tags': ['x', 'y']}]}]
+    archive.write_day('twitch_streams', DAY, twitch)
+    archive.write_day('twitch_streams', DAY, twitch[:1])
+    archive.write_day('youtube_streams', DAY, youtube)
+
+    assert archive.days('twitch_streams') == [DAY]
+    assert archive.docsbetween(DAY, DAY + 3600, 'twitch_streams') == twitch[:1]
+    assert archive.docsbetween(0, 2 * DAY, 'twitch_streams') == twitch
+    assert archive.docsbetween(0, 2 * DAY, 'youtube_streams') == youtube
+    assert archive.first_entry_after(DAY + 60, 'twitch_streams') == DAY + 7200
+    assert archive.first_entry_after(DAY, 'twitch_top_games') == (1 << 31) - 1
+
+    # Reading a day hour by hour decompresses its file once.
+    cols = archive._load('twitch_streams', DAY)[0]
+    assert archive.docsbetween(DAY + 3600, DAY + 7201,
+                               'twitch_streams') == twitch[1:]
+    assert archive.docsbetween(DAY + 120, DAY + 3600, 'twitch_streams') == []
+    assert archive._load('twitch_streams', DAY)[0] is cols
@@ -0,0 +1,36 @@
+from types import SimpleNamespace
+
+from esportstracker.compactor import DocCompactor
+from esportstracker.models.mongomodels import set_game_id_lookup
+
+
+class FakeCollection:
+    def __init__(self, docs):
+        self.docs = docs
+        self.replaced = []
+
+    def find(self, query, batch_size=None):
+        return list(self.docs)
+
+    def bulk_write(self, requests, ordered=False):
+        self.replaced += [req._doc for req in requests]
+
+
+def v1streams(docid, game):
+    return {'_id': docid, 'timestamp': 1800, 'game': game, 'streams': {
+        '3': {'display_name': 'c', 'viewers': 100, 'game': game,
+              'status': 'title', 'broadcaster_id': 3}}}
+
+
+def test_compactor_skips_unknown_games():
+    coll = FakeCollection([v1streams(1, 'League of Legends'),
+                           v1streams(2, 'Unknown')])
+    compactor = DocCompactor(SimpleNamespace(conn={'twitch_streams': coll}))
+    set_game_id_lookup({'League of Legends': 21779}.get)
+    try:
+        assert compactor.compact('twitch_streams') == 1
+    finally:
+        set_game_id_lookup(None)
+    assert [doc['_id'] for doc in coll.replaced] == [1]
+    assert coll.replaced[0]['game_id'] == 21779
+    assert 'twitch_streams' not in compactor.compacted
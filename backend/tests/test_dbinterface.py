@@ -0,0 +1,158 @@
+import pytest
+from types import SimpleNamespace
+import pymongo
+import pymongo.errors
+from bson.objectid import ObjectId
+
+from esportstracker.dbinterface import MongoManager, InsertError
+from esportstracker.models.mongomodels import TwitchStreamsAPIResponse
+from esportstracker.models.mongomodels import TwitchStreamSnapshot
+from esportstracker.models.mongomodels import YTLivestreams
+from esportstracker.models.mongomodels import YouTubeChannelDoc
+
+
+class FakeCollection:
+    """
+    Implements the few collection methods MongoManager uses.
+
+    Documents for which reject returns True fail with a validation error.
+    Bucket upserts follow MongoDB: a filter that matches nothing inserts a
+    new bucket, which fails with a duplicate key error if one exists.
+    """
+    def __init__(self, reject=None):
+        self.docs = {}
+        self.reject = reject
+        self.queries = 0
+
+    def with_options(self, **kwargs):
+        return self
+
+    def insert_many(self, docs, ordered=False):
+        errors = []
+        inserted = []
+        for i, doc in enumerate(docs):
+            doc.setdefault('_id', ObjectId())
+            if self.reject and self.reject(doc):
+                errors.append({'index': i, 'code': 121})
+            elif doc['_id'] in self.docs:
+                errors.append({'index': i, 'code': 11000})
+            else:
+                self.docs[doc['_id']] = doc
+                inserted.append(doc['_id'])
+        if errors:
+            raise pymongo.errors.BulkWriteError(
+                {'writeErrors': errors, 'nInserted': len(inserted)})
+        return SimpleNamespace(inserted_ids=inserted)
+
+    def find(self, query, projection=None):
+        self.queries += 1
+        ids = query['channel_id']['$in']
+        return [dict(doc) for doc in self.docs.values()
+                if doc['channel_id'] in ids]
+
+    @staticmethod
+    def _apply(doc, update):
+        for path, value in update.get('$push', {}).items():
+            *parents, field = path.split('.')
+            target = doc
+            for key in parents:
+                target = target.setdefault(key, {})
+            target.setdefault(field, []).append(value)
+        for path, value in update.get('$set', {}).items():
+            *parents, field = path.split('.')
+            target = doc
+            for key in parents:
+                target = target.setdefault(key, {})
+            target[field] = value
+        for field, value in update.get('$min', {}).items():
+            doc[field] = min(doc.get(field, value), value)
+
+    def bulk_write(self, requests, ordered=False):
+        errors = []
+        modified, upserted = 0, 0
+        for i, req in enumerate(requests):
+            query = req._filter
+            key = (query['game_id'], query['hour'])
+            doc = self.docs.get(key)
+            ts = query['timestamps']['$ne']
+            if doc is not None and ts not in doc['timestamps']:
+                self._apply(doc, req._doc)
+                modified += 1
+            elif doc is not None:
+                errors.append({'index': i, 'code': 11000})
+            else:
+                doc = {'game_id': key[0], 'hour': key[1]}
+                self._apply(doc, req._doc)
+                self.docs[key] = doc
+                upserted += 1
+        if errors:
+            raise pymongo.errors.BulkWriteError(
+                {'writeErrors': errors, 'nModified': modified,
+                 'nUpserted': upserted})
+        return SimpleNamespace(modified_count=modified,
+                               upserted_count=upserted)
+
+
+class FakeDB(dict):
+    def __missing__(self, collname):
+        self[collname] = FakeCollection()
+        return self[collname]
+
+
+def fake_mongo():
+    """ Returns a MongoManager that stores documents in memory. """
+    mongo = MongoManager('localhost', 27017, 'esports_stats', ssl=False)
+    mongo.conn = FakeDB()
+    return mongo
+
+
+def streams_resp(timestamp, viewers):
+    streams = {cid: TwitchStreamSnapshot(v, 21779, 'en', 'live', 'title',
+                                         cid, cid)
+               for cid, v in viewers.items()}
+    return TwitchStreamsAPIResponse(timestamp, streams, 21779)
+
+
+def test_insert_docs_counts_duplicates():
+    mongo = fake_mongo()
+    docs = [{'_id': i, 'timestamp': i} for i in range(5)]
+    assert mongo.insert_docs('twitch_top_games', docs[:3]) == 3
+    assert mongo.insert_docs('twitch_top_games', docs, batch_size=2) == 5
+    assert len(mongo.conn['twitch_top_games'].docs) == 5
+
+
+def test_store_many_partial_failure():
+    mongo = fake_mongo()
+    mongo.conn['youtube_streams'] = FakeCollection(
+        reject=lambda doc: doc['timestamp'] == 200)
+    docs = [YTLivestreams([], ts) for ts in (100, 200, 300)]
+    with pytest.raises(InsertError) as e:
+        mongo.store_many(docs, batch_size=2)
+    assert e.value.collname == 'youtube_streams'
+    assert e.value.stored == 2
+    assert len(e.value.errors) == 1
+    stored = mongo.conn['youtube_streams'].docs.values()
+    assert sorted(d['timestamp'] for d in stored) == [100, 300]
+
+
+def test_channels_by_id_chunks():
+    mongo = fake_mongo()
+    coll = mongo.conn['youtube_channels']
+    for cid in ('a', 'b', 'd', 'e'):
+        coll.docs[cid] = YouTubeChannelDoc(cid, cid, '', '', '').todoc()
+    chunks = list(mongo.get_youtube_channels(['a', 'b', 'c', 'd', 'e', 'f'],
+                                             chunk_size=4))
+    assert coll.queries == 2
+    assert [sorted(found) for found, _ in chunks] == [['a', 'b', 'd'], ['e']]
+    assert [missing for _, missing in chunks] == [['c'], ['f']]
+    assert chunks[0][0]['d'].display_name == 'd'
+
+
+def test_append_buckets_idempotent():
+    mongo = fake_mongo()
+    resps = [streams_resp(3700, {1: 100}), streams_resp(3800, {1: 200})]
+    assert mongo.append_buckets(resps) == 2
+    assert mongo.append_buckets(resps + [streams_resp(3900, {1: 300})]) == 1
+    bucket = mongo.conn['twitch_streams_hourly'].docs[(21779, 3600)]
+    assert bucket['timestamps'] == [3700, 3800, 3900]
+    assert bucket['streams']['1']['viewers'] == [100, 200, 300]
@@ -0,0 +1,69 @@
+from types import SimpleNamespace
+from aiohttp import web
+
+from esportstracker.apiclients import TwitchAPIClient
+from esportstracker.gameregistry import GameRegistry
+from .test_apiclients import serve
+
+
+def test_game_registry_warm():
+    batches = []
+    games = {str(i): f'Game {i}' for i in range(150)}
+
+    async def helixgames(request):
+        names = request.query.getall('name', [])
+        ids = request.query.getall('id', [])
+        batches.append(len(names) + len(ids))
+        data = [{'id': i, 'name': n} for i, n in games.items()
+                if n in names or i in ids]
+        return web.json_response({'data': data})
+
+    app = web.Application()
+    app.router.add_get('/helix/games/', helixgames)
+    client = TwitchAPIClient(serve(app), 'clientid', 'secret')
+    registry = GameRegistry(apiclient=client)
+    names = [f'Game {i}' for i in range(120)] + ['Missing']
+    assert registry.warm(names, ids=[130, 131]) == 122
+    assert batches == [100, 23]
+    assert registry.id('game 7') == 7
+    assert registry.name(131) == 'Game 131'
+    assert len(batches) == 2
+    assert registry.id('Game 140') == 140
+    assert batches == [100, 23, 1]
+    # Missing was not found by warm and is not requested again.
+    assert registry.id('Missing') is None
+    assert registry.id('missing') is None
+    assert registry.name(149) == 'Game 149'
+    assert registry.name(999) is None
+    assert registry.name(999) is None
+    assert batches == [100, 23, 1, 1, 1]
+    registry.miss_ttl = 0
+    assert registry.id('Missing') is None
+    assert batches == [100, 23, 1, 1, 1, 1]
+
+
+class FakeCursor:
+    def __init__(self, queries):
+        self.queries = queries
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        pass
+
+    def execute(self, query, params=()):
+        self.queries.append(params)
+
+    def fetchone(self):
+        return None
+
+
+def test_game_registry_caches_misses_without_client():
+    queries = []
+    pg = SimpleNamespace(conn=SimpleNamespace(
+        cursor=lambda: FakeCursor(queries)))
+    registry = GameRegistry(pg)
+    assert registry.id('Missing') is None
+    assert registry.id('missing') is None
+    assert queries == [('Missing',)]
@@ -0,0 +1,20 @@
+import json
+
+from esportstracker import jsondecoder
+
+
+class Response:
+    def __init__(self, payload):
+        self.content = json.dumps(payload).encode('utf8')
+
+
+def test_decoders_agree():
+    payload = {'data': [{'title': 'ステージ 🎮', 'viewer_count': 10}],
+               'pagination': {}}
+    resp = Response(payload)
+    assert jsondecoder.loads_response(resp) == payload
+    jsondecoder.set_decoder(jsondecoder.stdlib_loads)
+    try:
+        assert jsondecoder.loads_response(resp) == payload
+    finally:
+        jsondecoder.set_decoder(None)
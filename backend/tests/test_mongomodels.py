@@ -1,3 +1,180 @@
-from esportstracker.aggregator import Aggregator
+import tracemalloc
+import pytest
+import bson
+from bson.raw_bson import RawBSONDocument
+
+from esportstracker.aggregator import Aggregator, RowFactory
 from esportstracker.models.mongomodels import TwitchGamesAPIResponse
+from esportstracker.models.mongomodels import TwitchStreamsAPIResponse
+from esportstracker.models.mongomodels import TwitchStreamsHourBucket
+from esportstracker.models.mongomodels import TwitchStreamSnapshot
+from esportstracker.models.mongomodels import TwitchStreamsColumns
+from esportstracker.models.mongomodels import StringTable
+from esportstracker.models.mongomodels import YTLivestreams
+from esportstracker.models.mongomodels import set_game_id_lookup
+from esportstracker.models.mongomodels import UnresolvedGamesError
+
+
+def streams_doc(timestamp, viewers):
+    streams = {}
+    for cid, vc in viewers.items():
+        streams[str(cid)] = {
+            'viewers': vc,
+            'game_id': 21779,
+            'language': 'en',
+            'stream_type': 'live',
+            'title': f'title {cid}',
+            'stream_id': cid * 10,
+            'broadcaster_id': cid
+        }
+    return {'timestamp': timestamp, 'game_id': 21779, 'streams': streams}
+
+
+def test_raw_twitch_streams_doc():
+    docs = [streams_doc(0, {1: 100, 2: 50}), streams_doc(1800, {1: 300})]
+    rawdocs = [RawBSONDocument(bson.encode(doc)) for doc in docs]
+
+    resp = TwitchStreamsAPIResponse.fromdoc(rawdocs[0])
+    assert resp.viewercounts() == {1: 100, 2: 50}
+    assert 2 in resp.streams and 3 not in resp.streams
+    assert resp.streams[2].title == 'title 2'
+    assert resp.todoc() == docs[0]
+
+    rows = RowFactory.twitch_streams(docs, 0, 3600)
+    rawrows = RowFactory.twitch_streams(rawdocs, 0, 3600)
+    assert [r.to_row() for r in rows] == [r.to_row() for r in rawrows]
+
+
+def test_hour_bucket():
+    docs = [streams_doc(3700, {1: 100, 2: 50}), streams_doc(5400, {1: 300})]
+    resps = [TwitchStreamsAPIResponse.fromdoc(doc) for doc in docs]
+    bucket = TwitchStreamsHourBucket.fromresponses(resps)
+    doc = bucket.todoc()
+    assert doc['hour'] == 3600 and doc['timestamp'] == 3700
+    assert doc['streams']['1']['viewers'] == [100, 300]
+    assert doc['streams']['2']['timestamps'] == [3700]
+
+    filter, update = TwitchStreamsHourBucket.pushupdate(resps[1])
+    assert filter == {'game_id': 21779, 'hour': 3600,
+                      'timestamps': {'$ne': 5400}}
+    assert update['$push']['streams.1.viewers'] == 300
+
+    rows = RowFactory.twitch_streams(docs, 3600, 7200)
+    bucketrows = RowFactory.twitch_streams([doc], 3600, 7200)
+    assert [r.to_row() for r in rows] == [r.to_row() for r in bucketrows]
+
+
+def test_twitch_streams_columns():
+    docs = [streams_doc(0, {1: 100, 2: 50}), streams_doc(1000, {1: 300}),
+            streams_doc(2000, {3: 7, 2: 9})]
+    docs[1]['streams']['1']['stream_id'] = None
+    cols = TwitchStreamsColumns.fromdoc(docs[1])
+    assert cols.todoc() == docs[1]
+    assert cols.viewercounts() == {1: 300}
+
+    rows = RowFactory.twitch_streams(docs, 0, 3600)
+    colrows = RowFactory.twitch_streams_columnar(docs, 0, 3600)
+    assert sorted(map(str, rows)) == sorted(map(str, colrows))
+
+    raw = [{'viewer_count': v, 'game_id': '21779', 'language': 'en',
+            'type': 'live', 'title': 't', 'id': str(v), 'user_id': str(v)}
+           for v in (200, 5)]
+    cols = TwitchStreamsColumns.fromapiresponse(raw, 1800, 21779)
+    assert (cols.timestamp, cols.game_id) == (1800, 21779)
+    assert cols.viewercounts() == {200: 200}
+
+
+class DictStreamSnapshot:
+    """ TwitchStreamSnapshot without __slots__. """
+    def __init__(self, viewers, game_id, language, stream_type, title,
+                 stream_id, broadcaster_id):
+        self.viewers = int(viewers)
+        self.game_id = game_id
+        self.language = language
+        self.stream_type = stream_type
+        self.title = title
+        self.stream_id = stream_id
+        self.broadcaster_id = broadcaster_id
+
+
+def snapshot_memory(cls, num):
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    snaps = [cls(i, 21779, 'en', 'live', 'title', i, i) for i in range(num)]
+    used = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+    del snaps
+    return used
+
+
+def test_snapshot_slots_memory():
+    num = 100000
+    slotted = snapshot_memory(TwitchStreamSnapshot, num)
+    unslotted = snapshot_memory(DictStreamSnapshot, num)
+    assert slotted < unslotted * 0.75
+
+    snp = TwitchStreamSnapshot(1, 21779, 'en', 'live', 'title', 2, 3)
+    assert snp.todoc() == vars(DictStreamSnapshot(1, 21779, 'en', 'live',
+                                                  'title', 2, 3))
+
+
+def test_interned_snapshot_strings():
+    # Decoded documents hold a separate copy of every string.
+    docs = [bson.decode(bson.encode(streams_doc(ts, {1: 100, 2: 50})))
+            for ts in (0, 1800)]
+    strings = StringTable()
+    first, second = [TwitchStreamsAPIResponse.fromdoc(d, strings)
+                     for d in docs]
+    assert first.streams[1].title is second.streams[1].title
+    assert first.streams[1].language is second.streams[2].language
+    assert first.todoc() == docs[0]
+
+    raw = RawBSONDocument(bson.encode(docs[1]))
+    lazy = TwitchStreamsAPIResponse.fromdoc(raw, strings)
+    assert lazy.streams[2].title is first.streams[2].title
+
+
+def test_upgrade_old_layouts():
+    v1 = {'_id': 1, 'UCchan': {'timestamp': 1800.5, 'title': 'LCK',
+                               'broadcaster_name': 'chan',
+                               'broadcast_id': 'vid',
+                               'concurrent_viewers': '10'}}
+    v2 = {'timestamp': 1800, 'broadcasts': {'UCchan': {
+        'title': 'LCK', 'broadcaster_name': 'chan', 'broadcast_id': 'vid',
+        'concurrent_viewers': 10, 'language': 'unknown', 'tags': []}}}
+    resps = [YTLivestreams.fromdoc(doc) for doc in (v1, v2)]
+    assert resps[0].todoc() == resps[1].todoc()
+    assert YTLivestreams.VERSIONS.upgrade(dict(v1))['_id'] == 1
+
+    v1 = {'timestamp': 1800, 'game': 'League of Legends', 'streams': {
+        '3': {'display_name': 'c', 'viewers': 100, 'game': 'League of Legends',
+              'status': 'title', 'broadcaster_id': 3}}}
+    set_game_id_lookup({'League of Legends': 21779}.get)
+    try:
+        resp = TwitchStreamsAPIResponse.fromdoc(v1)
+    finally:
+        set_game_id_lookup(None)
+    assert resp.game_id == 21779
+    assert resp.streams[3].todoc() == {
+        'viewers': 100, 'game_id': 21779, 'language': 'en',
+        'stream_type': 'live', 'title': 'title', 'stream_id': None,
+        'broadcaster_id': 3}
+
 
+def test_upgrade_unknown_games():
+    v1games = {'timestamp': 1800, 'games': {
+        '24024': {'name': 'League of Legends', 'viewers': 100, 'channels': 5},
+        '1': {'name': 'Unknown', 'viewers': 10, 'channels': 1}}}
+    v1streams = {'timestamp': 1800, 'game': 'League of Legends', 'streams': {
+        '3': {'display_name': 'c', 'viewers': 100, 'game': 'Unknown',
+              'status': 'title', 'broadcaster_id': 3}}}
+    set_game_id_lookup({'League of Legends': 21779}.get)
+    try:
+        with pytest.raises(UnresolvedGamesError) as e:
+            TwitchGamesAPIResponse.fromdoc(dict(v1games))
+        assert e.value.names == {'Unknown'}
+        docs = Aggregator.upgrade_docs('twitch_streams',
+                                       [v1streams, streams_doc(2000, {1: 5})])
+    finally:
+        set_game_id_lookup(None)
+    assert [d['timestamp'] for d in docs] == [2000]
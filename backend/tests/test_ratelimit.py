@@ -0,0 +1,60 @@
+import json
+import time
+
+from esportstracker.ratelimit import SharedTokenBucket, QuotaBudget
+from esportstracker.ratelimit import PRIORITY_STREAMS, PRIORITY_CHANNELS
+
+
+def test_shared_token_bucket(tmpdir):
+    path = str(tmpdir.join('twitch.ratelimit'))
+    streams = SharedTokenBucket(path, capacity=2, window=1)
+    channels = SharedTokenBucket(path, capacity=2, window=1)
+    assert streams._try_acquire(PRIORITY_STREAMS) == 0
+    assert channels._try_acquire(PRIORITY_CHANNELS) == 0
+    # Both instances draw from the same file.
+    assert streams._try_acquire(PRIORITY_STREAMS) > 0
+
+    start = time.time()
+    channels.acquire(PRIORITY_CHANNELS)
+    assert time.time() - start >= 0.3
+
+    # A waiting higher priority process is served first.
+    with open(path) as f:
+        state = json.load(f)
+    state['tokens'] = 2
+    state['waiting']['-1'] = [PRIORITY_STREAMS, time.time()]
+    with open(path, 'w') as f:
+        json.dump(state, f)
+    assert channels._try_acquire(PRIORITY_CHANNELS) > 0
+    assert streams._try_acquire(PRIORITY_STREAMS) == 0
+
+    streams.sync(0, time.time() + 5)
+    assert streams._try_acquire(PRIORITY_STREAMS) > 4
+
+
+def test_quota_budget(tmpdir):
+    path = str(tmpdir.join('youtube.quota'))
+    shares = {'streams': 0.8, 'channels': 0.2}
+    streams = QuotaBudget(path, 1000, shares)
+    channels = QuotaBudget(path, 1000, shares)
+    streams.charge(400, 'streams')
+    channels.charge(50, 'channels')
+    assert streams.used() == 450
+    assert channels.remaining('streams') == 400
+    assert streams.remaining('channels') == 150
+
+    seconds_left = streams.seconds_left()
+    assert 0 < seconds_left <= 25 * 3600
+    # 400 units left at 100 per cycle is four cycles for the rest of the day.
+    interval = streams.interval('streams', 100, 60)
+    assert abs(interval - seconds_left / 4) < 5
+    assert streams.interval('streams', 500, 60) >= seconds_left - 5
+    assert channels.allowance('channels', seconds_left * 2) == 150
+
+    # Usage from a previous day is discarded.
+    with open(path) as f:
+        state = json.load(f)
+    state['day'] = '2018-01-01'
+    with open(path, 'w') as f:
+        json.dump(state, f)
+    assert streams.used() == 0
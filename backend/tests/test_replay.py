@@ -0,0 +1,56 @@
+import os
+import json
+import pytest
+import requests
+from aiohttp import web
+
+from esportstracker.apiclients import TwitchAPIClient
+from esportstracker.replay import Recorder, StandInServer
+from esportstracker.retry import RetryPolicy
+from .test_apiclients import serve
+
+
+def test_record_and_replay(tmpdir):
+    async def streams(request):
+        gameid = request.query['game_id']
+        data = [{'id': '1', 'user_id': '5', 'game_id': gameid, 'type': 'live',
+                 'title': 'title', 'viewer_count': 100, 'language': 'en'}]
+        return web.json_response({'data': data, 'pagination': {}})
+
+    app = web.Application()
+    app.router.add_get('/helix/streams/', streams)
+    client = TwitchAPIClient(serve(app), 'clientid', 'secret')
+    recorder = Recorder(str(tmpdir))
+    recorder.attach(client)
+    recorded = client.topstreams(21779, timestamp=1800)
+    assert recorder.count == 1
+
+    server = StandInServer(str(tmpdir), ratelimit=(2, 60))
+    host = server.start()
+    try:
+        retry = RetryPolicy(attempts=2, base_delay=0.01)
+        client = TwitchAPIClient(host, 'clientid', 'secret', retry=retry)
+        replayed = client.topstreams(21779, timestamp=1800)
+        assert replayed.todoc() == recorded.todoc()
+        assert client.req_remaining == 1
+
+        server.error_rate = 1
+        with pytest.raises(ConnectionError):
+            client.topstreams(21779)
+        assert server.stats['errors'] == 1
+        assert server.stats['ratelimited'] == 1
+    finally:
+        server.stop()
+
+
+def test_recorder_drops_credentials(tmpdir):
+    response = requests.Response()
+    response.url = ('https://www.googleapis.com/youtube/v3/videos?'
+                    'part=snippet&Client-ID=clientid&key=secret')
+    response.status_code = 200
+    response._content = b'{}'
+    Recorder(str(tmpdir)).save(response)
+    name, = os.listdir(str(tmpdir))
+    with open(os.path.join(str(tmpdir), name)) as f:
+        fixture = json.load(f)
+    assert fixture['query'] == [['part', 'snippet']]
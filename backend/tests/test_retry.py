@@ -0,0 +1,46 @@
+import time
+from aiohttp import web
+
+from esportstracker.apiclients import TwitchAPIClient
+from esportstracker.retry import RetryPolicy
+from .test_apiclients import serve
+
+
+def test_retry_delays():
+    policy = RetryPolicy(attempts=3, base_delay=1, max_delay=4)
+    assert 0 <= policy.delay(0, 500) <= 1
+    assert policy.delay(1, 503, {'retry-after': '3'}) == 3
+    assert policy.delay(2, 503) is None
+    assert policy.delay(0, 404) is None
+    reset = str(int(time.time()) + 10)
+    assert 8 < policy.delay(0, 429, {'ratelimit-reset': reset}) <= 10
+    # The reset time is ignored unless the rate limit was hit.
+    assert policy.delay(0, 500, {'ratelimit-reset': reset}) <= 1
+    policy.begin_cycle(time.time() + 5)
+    assert policy.delay(0, 429, {'ratelimit-reset': reset}) is None
+    assert policy.retries == 0 and policy.failures[429] == 1
+
+
+def test_zero_server_delay_backs_off():
+    policy = RetryPolicy(attempts=3)
+    policy.backoff = lambda attempt: 0.5
+    assert policy.delay(0, 503, {'retry-after': '0'}) == 0.5
+    past = str(int(time.time()) - 10)
+    assert policy.delay(0, 429, {'ratelimit-reset': past}) == 0.5
+    assert policy.delay(0, 503, {'retry-after': '2'}) == 2
+
+
+def test_request_retries():
+    statuses = [503, 500, 200]
+
+    async def games(request):
+        status = statuses.pop(0)
+        return web.json_response({'top': []}, status=status)
+
+    app = web.Application()
+    app.router.add_get('/kraken/games/top/', games)
+    policy = RetryPolicy(attempts=3, base_delay=0.01)
+    client = TwitchAPIClient(serve(app), 'clientid', 'secret', retry=policy)
+    client.gettopgames(timestamp=1800)
+    assert policy.retries == 2
+    assert policy.stats()['failures'] == {503: 1, 500: 1}
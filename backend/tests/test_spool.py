@@ -0,0 +1,91 @@
+import pymongo.errors
+
+from esportstracker.spool import DocSpool
+from esportstracker.models.mongomodels import YTLivestreams, YTLivestream
+from .test_dbinterface import FakeCollection, fake_mongo, streams_resp
+
+
+class FakeMongo:
+    bucket_collections = ['twitch_streams_hourly']
+
+    def __init__(self):
+        self.up = False
+        self.docs = {}
+
+    def insert_docs(self, collname, docs):
+        if not self.up:
+            raise pymongo.errors.ServerSelectionTimeoutError('down')
+        for doc in docs:
+            self.docs.setdefault(collname, {})[doc['_id']] = doc
+        return len(docs)
+
+
+def test_spool_survives_outage(tmp_path):
+    mongo = FakeMongo()
+    spool = DocSpool(str(tmp_path), mongo)
+    stream = YTLivestream('title', 'chan', 'chanid', 'vid', 10, 'en', [])
+    spool.append([YTLivestreams([stream], 100)])
+    try:
+        spool.flush()
+    except pymongo.errors.ServerSelectionTimeoutError:
+        pass
+    spool.append([YTLivestreams([], 200)])
+    assert len(spool.segments()) == 1
+
+    mongo.up = True
+    assert spool.flush() == 2
+    assert spool.segments() == []
+    docs = sorted(mongo.docs['youtube_streams'].values(),
+                  key=lambda d: d['timestamp'])
+    assert [d['timestamp'] for d in docs] == [100, 200]
+    assert docs[0]['streams'][0]['vidid'] == 'vid'
+
+
+def test_spool_keeps_segment_on_failed_insert(tmp_path):
+    mongo = fake_mongo()
+    mongo.conn['youtube_streams'] = FakeCollection(
+        reject=lambda doc: doc['timestamp'] == 200)
+    spool = DocSpool(str(tmp_path), mongo)
+    spool.append([streams_resp(3700, {1: 100})], 'twitch_streams_hourly')
+    spool.append([YTLivestreams([], 100), YTLivestreams([], 200)])
+    assert spool.flush() == 0
+    assert len(spool.segments()) == 1
+    assert list(spool.failures.values()) == [1]
+
+    mongo.conn['youtube_streams'].reject = None
+    assert spool.flush() == 3
+    assert spool.segments() == []
+    assert len(mongo.conn['youtube_streams'].docs) == 2
+    bucket = mongo.conn['twitch_streams_hourly'].docs[(21779, 3600)]
+    assert bucket['timestamps'] == [3700]
+    assert bucket['streams']['1']['viewers'] == [100]
+
+
+def test_spool_dead_letters_poisoned_segments(tmp_path):
+    mongo = fake_mongo()
+    mongo.conn['youtube_streams'] = FakeCollection(
+        reject=lambda doc: doc['timestamp'] == 100)
+    spool = DocSpool(str(tmp_path), mongo, max_attempts=2)
+    spool.append([YTLivestreams([], 100)])
+    spool._rotate()
+    with open(spool.segments()[0], 'a') as f:
+        f.write('{"c":"twitch_streams_hourly","d":{"_id":"%s"}}\n'
+                % '5f0000000000000000000000')
+    spool._rotate()
+    spool.append([YTLivestreams([], 200)])
+    spool.append([YTLivestreams([], 300)])
+
+    # The corrupt segment is dead lettered and the later ones are flushed.
+    assert spool.flush() == 2
+    dead = tmp_path / DocSpool.DEAD_LETTER
+    assert len(list(dead.iterdir())) == 1
+    assert spool.segments() == []
+
+    spool.append([YTLivestreams([], 100)])
+    assert spool.flush() == 0
+    assert len(spool.segments()) == 1
+    assert spool.flush() == 0
+    assert spool.segments() == []
+    assert len(list(dead.iterdir())) == 2
+    stored = mongo.conn['youtube_streams'].docs.values()
+    assert sorted(d['timestamp'] for d in stored) == [200, 300]
@@ -0,0 +1,22 @@
+import json
+import os
+
+from esportstracker.webcache import WebSnapshotPublisher, write_atomic
+
+
+def test_top_games_payload():
+    games = [('a', 50), ('b', 30), ('c', 20), ('d', 10)]
+    payload = WebSnapshotPublisher.top_games_payload(games, 3)
+    assert payload == [['a', 50], ['b', 30], ['Other', 30]]
+    payload = WebSnapshotPublisher.top_games_payload(games[:1], 3)
+    assert payload == [['a', 50], ['Other', 0]]
+
+
+def test_write_atomic(tmp_path):
+    publisher = WebSnapshotPublisher(str(tmp_path))
+    path = publisher.path('twitchgameviewership', 30, 21779)
+    write_atomic(path, {'name': 'League of Legends', 'data': [[3600, 10]]})
+    write_atomic(path, {'name': 'League of Legends', 'data': []})
+    with open(path) as f:
+        assert json.load(f) == {'name': 'League of Legends', 'data': []}
+    assert os.listdir(os.path.dirname(path)) == ['30.json']
@@ -7,6 +7,7 @@ const bodyParser = require('body-parser')
 const api = require('./routes/api')
 const index = require('./routes/index')
 const game = require('./routes/game')
+const config = require('./config')
 
 let app = express()
 let env = app.get('env')
@@ -32,6 +33,11 @@ if (env === 'development') {
   app.use(express.static(path.join(__dirname, 'public'), { maxage: '1d' }))
 }
 
+// Aggregator snapshots are rewritten every hour.
+if (config.snapshots.dir) {
+  app.use('/snapshots', express.static(config.snapshots.dir, { maxage: '5m' }))
+}
+
 // Routes
 app.use('/', index)
 app.use('/api', api.router)
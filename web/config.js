@@ -12,4 +12,10 @@ config.site.title = 'EsportsTracker'
 config.api = {}
 config.api.days = [3, 7, 30, 90]
 
+// JSON snapshots of the hot API routes written hourly by the aggregator.
+// Set dir to aggregator.snapshots.dir to serve the routes from the snapshots.
+config.snapshots = {}
+config.snapshots.dir = null
+// config.snapshots.dir = '/var/www/esportstracker/snapshots'
+
 module.exports = config
@@ -1,5 +1,8 @@
+const fs = require('fs')
 const http = require('http')
 const os = require('os')
+const path = require('path')
+const { promisify } = require('util')
 
 const express = require('express')
 const apicache = require('apicache')
@@ -22,11 +25,40 @@ let options = {
 let cache = apicache.options(options).middleware
 
 const DAY = 60 * 60 * 24
+const readFile = promisify(fs.readFile)
+
+/**
+ * Reads the snapshot of a route written hourly by the aggregator.  Returns
+ * null if snapshots are disabled or the snapshot does not exist, in which
+ * case the route queries Postgres.
+ */
+async function readSnapshot (route, days, gameID) {
+  if (!config.snapshots.dir || !config.api.days.includes(days)) {
+    return null
+  }
+  let dir = path.join(config.snapshots.dir, route)
+  if (gameID !== undefined) {
+    dir = path.join(dir, parseInt(gameID).toString())
+  }
+  try {
+    return await readFile(path.join(dir, days + '.json'))
+  } catch (e) {
+    return null
+  }
+}
+
+function sendSnapshot (res, snapshot) {
+  res.status(200).type('json').send(snapshot)
+}
 
 router.get('/twitchtopgames', cache(), async function (req, res) {
   try {
     let days = parseInt(req.query.days) || 30
     let numGames = req.query.numgames || 10
+    if (parseInt(numGames) === 10) {
+      let snapshot = await readSnapshot('twitchtopgames', days)
+      if (snapshot) return sendSnapshot(res, snapshot)
+    }
     let now = Math.floor(new Date() / 1000)
     let start = now - days * DAY
 
@@ -52,6 +84,8 @@ router.get('/twitchtopgames', cache(), async function (req, res) {
 router.get('/marketshare', cache(), async function (req, res) {
   try {
     let days = parseInt(req.query.days) || 30
+    let snapshot = await readSnapshot('marketshare', days)
+    if (snapshot) return sendSnapshot(res, snapshot)
     let now = Math.floor(new Date() / 1000)
     let start = now - days * DAY
     let tvh = queries.twitchTotalVH(start, now)
@@ -73,6 +107,8 @@ router.get('/twitchgameviewership', cache(), async function (req, res) {
   try {
     let days = parseInt(req.query.days) || 30
     let gameID = req.query.id
+    let snapshot = await readSnapshot('twitchgameviewership', days, gameID)
+    if (snapshot) return sendSnapshot(res, snapshot)
     let epoch = Math.floor(new Date() / 1000)
     let start = epoch - days * DAY
     let rows = await queries.esportsGameHourly(gameID, start, epoch)
@@ -222,17 +258,29 @@ async function refreshCache () {
       esgid.push(g.game_id)
     })
     let daypaths = [
-      '/api/marketshare?days=',
-      '/api/twitchtopgames?days=',
       '/api/organizerviewership?days=',
       '/api/esportshoursbygame?days='
     ]
+    // Routes served from the aggregator's snapshots are only cleared.
+    let snapshotpaths = [
+      '/api/marketshare?days=',
+      '/api/twitchtopgames?days='
+    ]
     let paths = []
     esgid.forEach((gid) => {
-      daypaths.push('/api/twitchgameviewership?id=' + gid.toString() + '&days=')
+      snapshotpaths.push('/api/twitchgameviewership?id=' + gid.toString() + '&days=')
       daypaths.push('/api/youtubegameviewership?id=' + gid.toString() + '&days=')
       daypaths.push('/api/gameviewership?id=' + gid.toString() + '&days=')
     })
+    if (config.snapshots.dir) {
+      snapshotpaths.forEach((path) => {
+        days.forEach((day) => {
+          apicache.clear(path + day)
+        })
+      })
+    } else {
+      daypaths = daypaths.concat(snapshotpaths)
+    }
 
     daypaths.forEach((path) => {
       days.forEach((day) => {